@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""
+Measures send throughput of a ShardedMixer for an increasing number of shards.
+
+    python -m project.benchmarks.bench_sharding --shards 1,2,4,8 --transactions 200000
+"""
+import json
+import random
+import sys
+import time
+
+import click
+from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.sharding import ShardedMixer
+
+
+def _measure(num_shards, transactions, wallets, batch_size, cross_shard):
+    mixer = ShardedMixer(num_shards)
+    network = BitcoinZNetwork(mixer)
+    try:
+        deposits = [network.add_addresses(["0x{:x}".format(i)]) for i in range(wallets)]
+        network.send_many([(BitcoinZNetwork.MINTED, deposit, "1000000") for deposit in deposits])
+        by_shard = {}
+        for deposit in deposits:
+            by_shard.setdefault(mixer.shard_of(deposit), []).append(deposit)
+
+        rng = random.Random(0)
+        start = time.perf_counter()
+        for _ in range(transactions // batch_size):
+            batch = []
+            for _ in range(batch_size):
+                sender = rng.choice(deposits)
+                receivers = deposits if cross_shard else by_shard[mixer.shard_of(sender)]
+                batch.append((sender, rng.choice(receivers), "0.01"))
+            network.send_many(batch)
+        seconds = time.perf_counter() - start
+    finally:
+        mixer.close(drain=False)
+    return (transactions // batch_size) * batch_size / seconds
+
+
+@click.command()
+@click.option("--shards", default="1,2,4", help="Comma separated shard counts to measure.")
+@click.option("--transactions", default=50000, help="Number of sends per shard count.")
+@click.option("--wallets", default=1000, help="Number of deposit addresses.")
+@click.option("--batch-size", default=1000, help="Sends per send_many batch.")
+@click.option("--cross-shard", is_flag=True, help="Pick receivers on any shard instead of the sender's shard.")
+def main(shards, transactions, wallets, batch_size, cross_shard):
+    results = {}
+    for num_shards in (int(n) for n in shards.split(",")):
+        results[num_shards] = round(_measure(num_shards, transactions, wallets, batch_size, cross_shard), 1)
+    click.echo(json.dumps({"transactions": transactions, "cross_shard": cross_shard, "sends_per_second": results}))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""
+Measures write throughput of a journaled Mixer and how long recovering it from disk takes.
+
+    python -m project.benchmarks.bench_wal --transactions 20000 --batch-size 256
+"""
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+import click
+from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.persistence import open_mixer
+from project.bitcoinz.scheduler import PayoutScheduler
+
+
+def _open(directory, batch_size, snapshot_interval, fsync, sync_commit=True):
+    journal_options = {"batch_size": batch_size, "snapshot_interval": snapshot_interval, "fsync": fsync, "sync_commit": sync_commit}
+    return BitcoinZNetwork(open_mixer(directory, journal_options=journal_options, scheduler=PayoutScheduler(background=False)))
+
+
+@click.command()
+@click.option("--transactions", default=20000, help="Number of sends to journal.")
+@click.option("--wallets", default=100, help="Number of deposit addresses.")
+@click.option("--batch-size", default=256, help="Group commit size of the write-ahead log.")
+@click.option("--snapshot-interval", default=100000, help="Records between snapshots.")
+@click.option("--no-fsync", is_flag=True, help="Skip fsync to measure the cost of durability.")
+@click.option("--async-commit", is_flag=True, help="Return from sends before their records are durable.")
+def main(transactions, wallets, batch_size, snapshot_interval, no_fsync, async_commit):
+    directory = tempfile.mkdtemp(prefix="bitcoinz-wal-")
+    try:
+        network = _open(directory, batch_size, snapshot_interval, not no_fsync, not async_commit)
+        deposits = [network.add_addresses(["0x{:x}".format(i)]) for i in range(wallets)]
+
+        start = time.perf_counter()
+        for i in range(transactions):
+            network.send(BitcoinZNetwork.MINTED, deposits[i % wallets], "1.5")
+            network.wait_for_payouts()
+        network.mixer.journal.wal.flush()
+        write_seconds = time.perf_counter() - start
+        commits = network.mixer.journal.num_commits
+        network.mixer.close()
+
+        start = time.perf_counter()
+        recovered = _open(directory, batch_size, snapshot_interval, not no_fsync)
+        recovery_seconds = time.perf_counter() - start
+        replayed = recovered.mixer.journal.records_since_snapshot
+        recovered.mixer.close()
+
+        click.echo(json.dumps({
+            "transactions": transactions,
+            "write_tps": round(transactions / write_seconds, 1),
+            "group_commits": commits,
+            "recovery_seconds": round(recovery_seconds, 4),
+            "records_replayed": replayed,
+        }))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
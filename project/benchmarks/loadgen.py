@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""
+Drives BitcoinZAPINetwork at a target rate of sends and reports the achieved throughput and latency percentiles.
+Without --url, a local JobcoinServer is started with the given latency and fault options.
+
+    python -m project.benchmarks.loadgen --tps 200 --duration 10 --latency 0.005 --error-rate 0.01
+    python -m project.benchmarks.loadgen --url http://127.0.0.1:8080 --tps 500
+"""
+import contextlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import click
+from project.benchmarks.suite import percentile
+from project.bitcoinz.bitcoinz_network import BitcoinZAPINetwork
+from project.bitcoinz.exceptions import InsufficientBalanceException
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.throttle import CREATE, GET_ADDRESS, GET_TRANSACTIONS, POST_TRANSACTION, AdaptiveLimiter, Throttle
+from project.bitcoinz.mixer import APIBasedMixer
+from project.jobcoin_server import JobcoinServer, running
+
+
+class LoadResult:
+    """
+    Outcomes and latencies of the sends of one run, recorded from worker threads.
+    """
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.outcomes: Dict[str, int] = {"ok": 0, "rejected": 0, "error": 0}
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str, latency: float) -> None:
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self.latencies.append(latency)
+
+
+def generate_load(network: BitcoinZAPINetwork, tps: float, duration: float, wallets: int, concurrency: int,
+                  amount: str = "0.01", seed: int = 0) -> Dict:
+    """
+    Send amount between random pairs of funded wallets at tps sends per second for duration seconds.
+
+    Sends are started on schedule (open loop) by a pool of concurrency threads, and latency is measured from
+    the scheduled start, so a backed-up system shows up as latency instead of silently lowering the rate.
+
+    Returns:
+        Dict: Target and achieved throughput, outcome counts and latency percentiles in milliseconds.
+    """
+    rng = random.Random(seed)
+    deposits = [network.add_addresses(["0x{:x}".format(i)]) for i in range(wallets)]
+    for deposit in deposits:
+        network.mixer.client.create(deposit)
+
+    result = LoadResult()
+
+    def send(sender: str, receiver: str, scheduled: float) -> None:
+        try:
+            network.send(sender, receiver, amount)
+            outcome = "ok"
+        except InsufficientBalanceException:
+            outcome = "rejected"
+        except Exception:
+            outcome = "error"
+        result.record(outcome, time.perf_counter() - scheduled)
+
+    total = int(tps * duration)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(total):
+            scheduled = start + i / tps
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sender, receiver = rng.sample(deposits, 2)
+            pool.submit(send, sender, receiver, scheduled)
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(result.latencies)
+    report = {
+        "target_tps": tps,
+        "achieved_tps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "sends": len(latencies),
+        "outcomes": result.outcomes,
+    }
+    if latencies:
+        report["latency_ms"] = {name: round(percentile(latencies, fraction) * 1000, 2)
+                                for name, fraction in (("p50", 0.50), ("p90", 0.90), ("p99", 0.99), ("max", 1.0))}
+    return report
+
+
+@click.command()
+@click.option("--url", default=None, help="Jobcoin API to load. Defaults to a local JobcoinServer.")
+@click.option("--tps", default=100.0, help="Target sends per second.")
+@click.option("--duration", default=10.0, help="Seconds to generate load for.")
+@click.option("--wallets", default=50, help="Number of funded deposit addresses.")
+@click.option("--concurrency", default=32, help="Concurrent sends (threads and pooled connections).")
+@click.option("--amount", default="0.01", help="Amount of every send.")
+@click.option("--max-installment-delay", default=APIBasedMixer.MAX_INSTALLMENT_DELAY, help="Upper bound of the random delay between installments.")
+@click.option("--seed", default=0, help="Seed of the wallet pairs and installment splits.")
+@click.option("--latency", default=0.0, help="Local server: seconds every response is delayed by.")
+@click.option("--latency-jitter", default=0.0, help="Local server: up to this many more seconds of random delay.")
+@click.option("--error-rate", default=0.0, help="Local server: fraction of requests failing with 503.")
+@click.option("--insufficient-balance-rate", default=0.0, help="Local server: fraction of transfers rejected.")
+@click.option("--rate-limit", default=None, type=float, help="Local server: requests per second allowed.")
+@click.option("--client-rate", default=None, type=float, help="Cap the mixer's transfers to this many requests per second.")
+@click.option("--adaptive/--no-adaptive", default=False, help="Adapt the mixer's requests in flight to latency and errors (AIMD).")
+def main(url, tps, duration, wallets, concurrency, amount, max_installment_delay, seed,
+         latency, latency_jitter, error_rate, insufficient_balance_rate, rate_limit, client_rate, adaptive):
+    server: Optional[JobcoinServer] = None
+    with contextlib.ExitStack() as stack:
+        if url is None:
+            server = stack.enter_context(running(JobcoinServer(latency=latency, latency_jitter=latency_jitter, error_rate=error_rate,
+                                                               insufficient_balance_rate=insufficient_balance_rate,
+                                                               rate_limit=rate_limit, seed=seed)))
+            url = server.url
+        throttles = None
+        if client_rate is not None or adaptive:
+            # Transfers share one throttle, lookups another
+            writes = Throttle(client_rate, limiter=AdaptiveLimiter(concurrency, max_limit=concurrency, latency_tolerance=2.0 if adaptive else None,
+                                                                    backoff=0.5 if adaptive else 1.0))
+            reads = Throttle(limiter=AdaptiveLimiter(concurrency, max_limit=concurrency, latency_tolerance=None, backoff=0.5 if adaptive else 1.0))
+            throttles = {CREATE: writes, POST_TRANSACTION: writes, GET_TRANSACTIONS: reads, GET_ADDRESS: reads}
+        mixer = APIBasedMixer(client=JobcoinClient(url, pool_size=concurrency, throttles=throttles), rng=random.Random(seed))
+        mixer.MAX_INSTALLMENT_DELAY = max_installment_delay
+        network = BitcoinZAPINetwork(mixer)
+
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            report = generate_load(network, tps, duration, wallets, concurrency, amount, seed)
+            report["payouts_drained"] = network.wait_for_payouts(timeout=max_installment_delay * 6 + 30)
+        if server is not None:
+            report["server_statuses"] = {str(status): count for status, count in sorted(server.status_counts.items())}
+        mixer.client.close()
+    click.echo(json.dumps(report))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,269 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the network, mixer and API client hot paths, reporting throughput, p50/p99 latency and
+peak memory per case. Nothing sleeps: installments are scheduled on a fake clock and paid out right away,
+and every random choice comes from a seeded RNG, so runs are repeatable.
+
+    python -m project.benchmarks.suite --save baseline.json
+    python -m project.benchmarks.suite --compare baseline.json
+"""
+import contextlib
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+
+import click
+from project.bitcoinz.bitcoinz_network import BitcoinZAPINetwork, BitcoinZNetwork
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.mixer import APIBasedMixer, Mixer
+from project.bitcoinz.scheduler import PayoutScheduler
+from project.jobcoin_server import JobcoinServer, running
+
+# A case turns a BenchContext into an operation, called once per iteration with the iteration number
+Case = Callable[["BenchContext"], Callable[[int], None]]
+
+
+class FakeClock:
+    """
+    Clock for the PayoutScheduler that never advances, so scheduling an installment never waits.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class BenchContext:
+    """
+    What a case needs to build its fixtures: seeded randomness, a fake clock and the size parameters.
+    """
+    def __init__(self, seed: int, ledger_size: int, api_url: Optional[str] = None):
+        self.rng = random.Random(seed)
+        self.clock = FakeClock()
+        self.ledger_size = ledger_size
+        self.api_url = api_url
+
+    def scheduler(self) -> PayoutScheduler:
+        return PayoutScheduler(clock=self.clock, background=False)
+
+    def network(self, metrics: Optional[MetricsRegistry] = None) -> BitcoinZNetwork:
+        return BitcoinZNetwork(Mixer(scheduler=self.scheduler(), rng=random.Random(self.rng.random()), metrics=metrics), metrics=metrics)
+
+    def api_network(self) -> BitcoinZAPINetwork:
+        mixer = APIBasedMixer(scheduler=self.scheduler(), client=JobcoinClient(self.api_url), rng=random.Random(self.rng.random()))
+        return BitcoinZAPINetwork(mixer)
+
+
+def _private_addresses(count: int, offset: int = 0) -> List[str]:
+    return ["0x{:x}".format(offset + i) for i in range(count)]
+
+
+def bench_add_addresses(ctx: BenchContext) -> Callable[[int], None]:
+    network = ctx.network()
+    return lambda i: network.add_addresses(_private_addresses(2, 2 * i))
+
+
+def bench_send_minted(num_addresses: int) -> Case:
+    def make(ctx: BenchContext) -> Callable[[int], None]:
+        network = ctx.network()
+        deposit = network.add_addresses(_private_addresses(num_addresses))
+
+        def op(i):
+            network.send(BitcoinZNetwork.MINTED, deposit, "1.5")
+            network.wait_for_payouts()
+        return op
+    return make
+
+
+def bench_send_wallet(num_addresses: int, metrics: bool = False) -> Case:
+    def make(ctx: BenchContext) -> Callable[[int], None]:
+        network = ctx.network(MetricsRegistry() if metrics else None)
+        sender = network.add_addresses(_private_addresses(1))
+        receiver = network.add_addresses(_private_addresses(num_addresses, 1))
+        network.send(BitcoinZNetwork.MINTED, sender, "1000000")
+        network.wait_for_payouts()
+
+        def op(i):
+            network.send(sender, receiver, "0.01")
+            network.wait_for_payouts()
+        return op
+    return make
+
+
+def bench_get_transactions(ctx: BenchContext) -> Callable[[int], None]:
+    network = ctx.network()
+    wallets = [network.add_addresses(_private_addresses(2, 2 * i)) for i in range(100)]
+    for start in range(0, ctx.ledger_size, 1000):
+        network.send_many([(BitcoinZNetwork.MINTED, ctx.rng.choice(wallets), "1")
+                           for _ in range(min(1000, ctx.ledger_size - start))])
+    network.wait_for_payouts()
+    return lambda i: network.get_transactions(wallets[i % len(wallets)])
+
+
+def bench_query_transactions(ctx: BenchContext) -> Callable[[int], None]:
+    network = ctx.network()
+    wallet = network.add_addresses(_private_addresses(1))
+    for start in range(0, ctx.ledger_size, 1000):
+        network.send_many([(BitcoinZNetwork.MINTED, wallet, "1")] * min(1000, ctx.ledger_size - start))
+    network.wait_for_payouts()
+    return lambda i: network.query_transactions(cursor=ctx.rng.randrange(ctx.ledger_size), limit=100)
+
+
+def bench_api_send(ctx: BenchContext) -> Callable[[int], None]:
+    network = ctx.api_network()
+    sender = network.add_addresses(_private_addresses(1))
+    receiver = network.add_addresses(_private_addresses(3, 1))
+    network.send(BitcoinZAPINetwork.MINTED, sender, "50")
+    network.wait_for_payouts()
+    for _ in range(20):
+        network.mixer.client.create(sender)
+
+    def op(i):
+        network.send(sender, receiver, "0.01")
+        network.wait_for_payouts()
+    return op
+
+
+CASES: Dict[str, Case] = {
+    "add_addresses": bench_add_addresses,
+    "send_minted[addresses=1]": bench_send_minted(1),
+    "send_minted[addresses=4]": bench_send_minted(4),
+    "send_minted[addresses=16]": bench_send_minted(16),
+    "send_wallet[addresses=1]": bench_send_wallet(1),
+    "send_wallet[addresses=4]": bench_send_wallet(4),
+    "send_wallet[addresses=16]": bench_send_wallet(16),
+    "send_wallet[addresses=4,metrics]": bench_send_wallet(4, metrics=True),
+    "get_transactions[large ledger]": bench_get_transactions,
+    "query_transactions[large ledger]": bench_query_transactions,
+    "api_send[local server]": bench_api_send,
+}
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    Nearest-rank percentile of already sorted values.
+
+    Args:
+        sorted_values (List[float]): Values in ascending order, at least one.
+        fraction (float): Percentile as a fraction, e.g. 0.99.
+
+    Returns:
+        float: The percentile.
+    """
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+def run_case(case: Case, ops: int, seed: int, ledger_size: int, api_url: Optional[str] = None) -> Dict[str, float]:
+    """
+    Time ops iterations of a case, then run it again under tracemalloc for its peak memory.
+    Fixtures are built before measuring starts, from a fresh context each time.
+
+    Returns:
+        Dict[str, float]: ops, throughput (ops/s), p50_us, p99_us and peak_memory_kib.
+    """
+    op = case(BenchContext(seed, ledger_size, api_url))
+    latencies = []
+    start = time.perf_counter()
+    for i in range(ops):
+        begin = time.perf_counter()
+        op(i)
+        latencies.append(time.perf_counter() - begin)
+    elapsed = time.perf_counter() - start
+
+    op = case(BenchContext(seed, ledger_size, api_url))
+    tracemalloc.start()
+    try:
+        for i in range(ops):
+            op(i)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "ops": ops,
+        "throughput": round(ops / elapsed, 1),
+        "p50_us": round(percentile(latencies, 0.50) * 1e6, 1),
+        "p99_us": round(percentile(latencies, 0.99) * 1e6, 1),
+        "peak_memory_kib": round(peak / 1024, 1),
+    }
+
+
+def run_suite(ops: int = 1000, seed: int = 0, ledger_size: int = 100000, only: Optional[str] = None) -> Dict:
+    """
+    Run every case (or those whose name contains only) and collect the results with run metadata.
+
+    Returns:
+        Dict: {"meta": {...}, "results": {case name: measurements}}
+    """
+    results = {}
+    with running(JobcoinServer()) as server, open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, case in CASES.items():
+            if only is None or only in name:
+                results[name] = run_case(case, ops, seed, ledger_size, server.url)
+    meta = {"python": platform.python_version(), "platform": platform.platform(), "ops": ops, "seed": seed, "ledger_size": ledger_size}
+    return {"meta": meta, "results": results}
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.15) -> List[str]:
+    """
+    Regressions of current against baseline: throughput down, or p99 latency or peak memory up, by more than threshold.
+
+    Args:
+        baseline (Dict): Output of run_suite() of an earlier run.
+        current (Dict): Output of run_suite().
+        threshold (float, optional): Tolerated relative change. Defaults to 0.15.
+
+    Returns:
+        List[str]: One description per regression, empty if there are none.
+    """
+    regressions = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        if now["throughput"] < before["throughput"] * (1 - threshold):
+            regressions.append("{}: throughput {} -> {} ops/s".format(name, before["throughput"], now["throughput"]))
+        for metric in ("p99_us", "peak_memory_kib"):
+            if before[metric] > 0 and now[metric] > before[metric] * (1 + threshold):
+                regressions.append("{}: {} {} -> {}".format(name, metric, before[metric], now[metric]))
+    return regressions
+
+
+@click.command()
+@click.option("--ops", default=1000, help="Iterations per case.")
+@click.option("--seed", default=0, help="Seed of all random choices.")
+@click.option("--ledger-size", default=100000, help="Transactions in the ledger of the query cases.")
+@click.option("--only", default=None, help="Only run cases whose name contains this string.")
+@click.option("--save", "save_path", default=None, help="Write the results as a JSON baseline to this file.")
+@click.option("--compare", "compare_path", default=None, help="Compare the results with a JSON baseline; exit 1 on regressions.")
+@click.option("--threshold", default=0.15, help="Tolerated relative change when comparing.")
+def main(ops, seed, ledger_size, only, save_path, compare_path, threshold):
+    report = run_suite(ops, seed, ledger_size, only)
+    for name, result in report["results"].items():
+        click.echo("{:<34} {:>10.1f} ops/s  p50 {:>9.1f}us  p99 {:>9.1f}us  peak {:>9.1f}KiB".format(
+            name, result["throughput"], result["p50_us"], result["p99_us"], result["peak_memory_kib"]))
+
+    if save_path is not None:
+        with open(save_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if compare_path is not None:
+        with open(compare_path) as f:
+            regressions = compare(json.load(f), report, threshold)
+        for regression in regressions:
+            click.echo("REGRESSION " + regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+from decimal import Decimal, InvalidOperation
+from typing import List, Sequence, Tuple
+
+# Amounts are held as integers of base units (like satoshis) everywhere inside the ledger.
+# They are only parsed from / formatted to strings at the API boundary.
+DECIMALS = 8
+COIN = 10 ** DECIMALS
+# Amounts are stored in signed 64-bit columns of the transaction log
+MAX_UNITS = 2 ** 63 - 1
+
+# Float weights are quantized to integers of this resolution before splitting, keeping the split exact
+_WEIGHT_SCALE = 1 << 32
+
+
+def parse_amount(amount) -> int:
+    """
+    Parse a user supplied amount into base units.
+
+    Args:
+        amount (str): Amount in coins, e.g. "12.5". Decimals and ints are accepted as well.
+
+    Raises:
+        ValueError: If amount is malformed, negative, too large or more precise than one base unit.
+
+    Returns:
+        int: Amount in base units.
+    """
+    try:
+        value = Decimal(repr(amount)) if isinstance(amount, float) else Decimal(amount)
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError("Malformed amount ({})".format(amount))
+    if not value.is_finite() or value < 0:
+        raise ValueError("Malformed amount ({})".format(amount))
+
+    units = value.scaleb(DECIMALS)
+    if units != units.to_integral_value():
+        raise ValueError("Amount ({}) has more than {} decimal places".format(amount, DECIMALS))
+    if units > MAX_UNITS:
+        raise ValueError("Amount ({}) is too large".format(amount))
+    return int(units)
+
+
+def format_amount(units: int) -> str:
+    """
+    Format base units as an amount in coins, with trailing zeros stripped, e.g. 9000000000 -> "90.0".
+
+    Args:
+        units (int): Amount in base units.
+
+    Returns:
+        str: Amount in coins.
+    """
+    sign = "-" if units < 0 else ""
+    whole, fraction = divmod(abs(units), COIN)
+    return "{}{}.{}".format(sign, whole, "{:0{}d}".format(fraction, DECIMALS).rstrip("0") or "0")
+
+
+def to_decimal(units: int) -> Decimal:
+    """
+    Convert base units to a Decimal amount in coins.
+
+    Args:
+        units (int): Amount in base units.
+
+    Returns:
+        Decimal: Amount in coins.
+    """
+    return Decimal(units).scaleb(-DECIMALS)
+
+
+def fee_ratio(fee_percentage) -> Tuple[int, int]:
+    """
+    Exact integer ratio of a fee percentage, so fees can be computed in integer math.
+
+    Args:
+        fee_percentage (Decimal): Fee as a fraction, e.g. Decimal("0.02").
+
+    Returns:
+        Tuple[int, int]: (numerator, denominator)
+    """
+    return Decimal(str(fee_percentage)).as_integer_ratio()
+
+
+def apply_fee(units: int, ratio: Tuple[int, int]) -> int:
+    """
+    Fee charged on an amount, rounded down to a whole base unit.
+
+    Args:
+        units (int): Amount in base units.
+        ratio (Tuple[int, int]): Fee ratio from fee_ratio().
+
+    Returns:
+        int: Fee in base units.
+    """
+    numerator, denominator = ratio
+    return units * numerator // denominator
+
+
+def split_units(units: int, weights: Sequence[float]) -> List[int]:
+    """
+    Split an amount proportionally to weights into integer shares that sum exactly to the amount.
+    Shares are rounded down and the remaining base units go to the largest remainders.
+    If all weights are zero, the whole amount goes to the last share.
+
+    Args:
+        units (int): Amount in base units.
+        weights (Sequence[float]): Non-negative weights, at least one of them positive.
+
+    Returns:
+        List[int]: One share per weight, summing to units.
+    """
+    total = sum(weights)
+    int_weights = [int(weight * _WEIGHT_SCALE / total) for weight in weights] if total > 0 else [0] * len(weights)
+    int_total = sum(int_weights)
+    if int_total == 0:
+        shares = [0] * len(weights)
+        shares[-1] = units
+        return shares
+
+    shares = [units * weight // int_total for weight in int_weights]
+    remainder = units - sum(shares)
+    by_remainder = sorted(range(len(weights)), key=lambda i: units * int_weights[i] % int_total, reverse=True)
+    for i in by_remainder[:remainder]:
+        shares[i] += 1
+    return shares
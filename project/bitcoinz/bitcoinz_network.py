@@ -1,10 +1,34 @@
-from project.bitcoinz.transaction import Transaction
+from project.bitcoinz.transaction import Transaction, TransactionPage
+from datetime import datetime
 from . import config
-from typing import List, Optional
-from project.bitcoinz.mixer import Mixer, APIBasedMixer
-from project.bitcoinz.exceptions import DepositAddressDoesntExistException, InsufficientBalanceException
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from project.bitcoinz.mixer import Mixer, APIBasedMixer, AsyncAPIBasedMixer
+from project.bitcoinz.exceptions import BatchSendException, DepositAddressDoesntExistException, InsufficientBalanceException
+from project.bitcoinz.scheduler import ScheduledPayout
+from project.bitcoinz.amount import parse_amount, to_decimal
+from project.bitcoinz.concurrency import ThreadLocalCounter
+from project.bitcoinz.metrics import NULL_METRICS, MetricsRegistry
+from project.bitcoinz.events import EventBus
 from decimal import Decimal
 
+# Reasons a send is rejected, the label values of bitcoinz_send_rejections_total
+UNKNOWN_ADDRESS = "unknown_address"
+INSUFFICIENT_BALANCE = "insufficient_balance"
+INVALID_AMOUNT = "invalid_amount"
+
+
+def _rejections_counter(metrics: MetricsRegistry):
+    return metrics.counter("bitcoinz_send_rejections_total", "Sends rejected before reaching the ledger, by reason.", ("reason",))
+
+
+def _rejection_reason(error: Exception) -> str:
+    if isinstance(error, DepositAddressDoesntExistException):
+        return UNKNOWN_ADDRESS
+    if isinstance(error, InsufficientBalanceException):
+        return INSUFFICIENT_BALANCE
+    return INVALID_AMOUNT
+
+
 class BitcoinZNetwork:
     """
     User-facing network class that interacts with the user's input.
@@ -16,9 +40,27 @@ class BitcoinZNetwork:
     """
     MINTED = "(new)"
 
-    def __init__(self):        
-        self.mixer = Mixer()
-        self.network_minted_coins = Decimal(0)
+    def __init__(self, mixer: Optional[Mixer] = None, metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            mixer (Mixer, optional): Mixer executing the sends. Defaults to a Mixer recording in metrics.
+            metrics (MetricsRegistry, optional): Registry to record rejected sends in. Defaults to recording nothing.
+        """
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.mixer = mixer if mixer is not None else Mixer(metrics=metrics)
+        # Minted coins are held in integer base units, see project.bitcoinz.amount
+        self.network_minted_coins = ThreadLocalCounter(self.mixer.minted_coins)
+        self._rejections = _rejections_counter(self.metrics)
+
+    @property
+    def events(self) -> EventBus:
+        """
+        Bus the mixer publishes deposits, installments, completed transactions and fees on, see project.bitcoinz.events.
+
+        Raises:
+            NotImplementedError: If the mixer is a ShardedMixer, which publishes no events.
+        """
+        return self.mixer.events
 
     def add_addresses(self, addresses: List[str]) -> str:
         """
@@ -35,6 +77,7 @@ class BitcoinZNetwork:
     def send(self, sender: str, receiver: str, amount: str):
         """
         Send an amount from sender to receiver.
+        Returns once the sender has been debited; installments to receiver are paid out in the background.
 
         Args:
             sender (str): Sender's deposit address
@@ -43,21 +86,93 @@ class BitcoinZNetwork:
 
         Raises:
             DepositAddressDoesntExistException: If sender's or receiver's deposit address doesn't exist in Mixer.
+            ValueError: If amount is malformed or negative.
             InsufficientBalanceException: If sender has insufficient balance to cover amount.
         """        
         if sender != BitcoinZNetwork.MINTED and not self.mixer.contains_key(sender):
+            self._rejections.labels(UNKNOWN_ADDRESS).inc()
             raise DepositAddressDoesntExistException(sender)
         if not self.mixer.contains_key(receiver):
+            self._rejections.labels(UNKNOWN_ADDRESS).inc()
             raise DepositAddressDoesntExistException(receiver)
-        if sender != BitcoinZNetwork.MINTED and self.mixer.get_balance(sender) < Decimal(amount):
+        try:
+            units = parse_amount(amount)
+        except ValueError:
+            self._rejections.labels(INVALID_AMOUNT).inc()
+            raise
+        # Fails fast; the mixer's storage checks and debits the balance atomically when committing,
+        # so concurrent sends cannot overdraw the sender
+        if sender != BitcoinZNetwork.MINTED and self.mixer.get_balance_units(sender) < units:
+            self._rejections.labels(INSUFFICIENT_BALANCE).inc()
             raise InsufficientBalanceException()
         
-        if sender == BitcoinZNetwork.MINTED:
-            self.mint_coins(amount)
-            
-        transaction = Transaction(sender, receiver, amount)
+        transaction = Transaction(sender, receiver, units)
         is_minted = sender == BitcoinZNetwork.MINTED
         self.mixer.execute_transaction(transaction, is_minted)
+        # Only once committed, so a failed commit leaves the minted total alone
+        if is_minted:
+            self.mint_coins(amount)
+
+    def send_many(self, transfers: Iterable[Tuple[str, str, str]], atomic: bool = True) -> List[Optional[Exception]]:
+        """
+        Send a batch of amounts, validating every row in one pass and committing the valid ones as a single batch.
+        Balances are checked against each sender's aggregate debits in the batch. Funds received within the batch
+        are paid out in installments after the commit, so they cannot be spent by later rows.
+
+        Args:
+            transfers (Iterable[Tuple[str, str, str]]): (sender, receiver, amount) rows. Sender may be MINTED.
+            atomic (bool, optional): If True, commit nothing when any row is invalid. Defaults to True.
+
+        Raises:
+            BatchSendException: If atomic and any row failed validation.
+
+        Returns:
+            List[Optional[Exception]]: Per-row validation error, None for rows that were sent.
+        """
+        transfers = list(transfers)
+        # One lookup for every address in the batch instead of one per row
+        balances = self.mixer.get_wallet_balances([address for transfer in transfers for address in transfer[:2]])
+        debits: Dict[str, int] = {}
+        errors: Dict[int, Exception] = {}
+        batch = []
+        minted = 0
+
+        for row, (sender, receiver, amount) in enumerate(transfers):
+            is_minted = sender == BitcoinZNetwork.MINTED
+            try:
+                value = parse_amount(amount)
+            except ValueError as e:
+                errors[row] = e
+                continue
+            if not is_minted and sender not in balances:
+                errors[row] = DepositAddressDoesntExistException(sender)
+                continue
+            if receiver not in balances:
+                errors[row] = DepositAddressDoesntExistException(receiver)
+                continue
+            if not is_minted:
+                debit = debits.get(sender, 0) + value
+                if balances[sender] < debit:
+                    errors[row] = InsufficientBalanceException()
+                    continue
+                debits[sender] = debit
+            else:
+                minted += value
+            batch.append((Transaction(sender, receiver, value), is_minted))
+
+        results: List[Optional[Exception]] = [None] * (len(batch) + len(errors))
+        for row, error in errors.items():
+            results[row] = error
+            self._rejections.labels(_rejection_reason(error)).inc()
+
+        if errors and atomic:
+            raise BatchSendException(errors)
+
+        if batch:
+            # Raises InsufficientBalanceException if a concurrent send drained a sender since validation
+            self.mixer.execute_transactions(batch)
+            self.network_minted_coins.add(minted)
+        return results
 
     def get_transactions(self, address=None) -> str:
         """
@@ -72,6 +187,57 @@ class BitcoinZNetwork:
         """        
         return self.mixer.get_transactions(address)
 
+    def query_transactions(self, address: Optional[str] = None, cursor: int = 0, limit: int = 100,
+                           since: Union[datetime, str, int, None] = None, until: Union[datetime, str, int, None] = None) -> TransactionPage:
+        """
+        Returns one page of structured transaction records associated with a given deposit address, oldest first.
+        If address is None, page through all transactions in Mixer.
+
+        Args:
+            address (str, optional): Deposit address associated with a wallet. Defaults to None.
+            cursor (int, optional): 0 or the next_cursor of the previous page. Defaults to 0.
+            limit (int, optional): Maximum number of records in the page. Defaults to 100.
+            since (datetime, str or int, optional): Only include transactions at or after this UTC time. Defaults to None.
+            until (datetime, str or int, optional): Only include transactions before this UTC time. Defaults to None.
+
+        Returns:
+            TransactionPage: Records of the page and the cursor of the next page.
+        """
+        return self.mixer.query_transactions(address, cursor, limit, since, until)
+
+    def iter_transactions(self, address: Optional[str] = None,
+                          since: Union[datetime, str, int, None] = None, until: Union[datetime, str, int, None] = None) -> Iterator[Dict[str, str]]:
+        """
+        Lazily yields structured transaction records associated with a given deposit address, oldest first.
+        If address is None, yield all transactions in Mixer.
+
+        Args:
+            address (str, optional): Deposit address associated with a wallet. Defaults to None.
+            since (datetime, str or int, optional): Only yield transactions at or after this UTC time. Defaults to None.
+            until (datetime, str or int, optional): Only yield transactions before this UTC time. Defaults to None.
+
+        Returns:
+            Iterator[Dict[str, str]]: Records with timestamp, fromAddress, toAddress and amount.
+        """
+        return self.mixer.iter_transactions(address, since=since, until=until)
+
+    def dump_transactions(self, fp: IO[str], address: Optional[str] = None,
+                          since: Union[datetime, str, int, None] = None, until: Union[datetime, str, int, None] = None) -> int:
+        """
+        Streams transaction records associated with a given deposit address to fp as JSON lines.
+        If address is None, dump all transactions in Mixer.
+
+        Args:
+            fp (IO[str]): Writable text stream.
+            address (str, optional): Deposit address associated with a wallet. Defaults to None.
+            since (datetime, str or int, optional): Only dump transactions at or after this UTC time. Defaults to None.
+            until (datetime, str or int, optional): Only dump transactions before this UTC time. Defaults to None.
+
+        Returns:
+            int: Number of records written.
+        """
+        return self.mixer.dump_transactions(fp, address, since, until)
+
     def mint_coins(self, amount: str) -> None:
         """
         Mint/mine coins from BitcoinZ Network.
@@ -79,7 +245,7 @@ class BitcoinZNetwork:
         Args:
             amount (str): Number of bitcoinzs to mint
         """        
-        self.network_minted_coins += Decimal(amount)
+        self.network_minted_coins.add(parse_amount(amount))
 
     def get_num_coins_minted(self) -> Decimal:
         """
@@ -88,7 +254,38 @@ class BitcoinZNetwork:
         Returns:
             Decimal: Number of bitcoinzs minted so far
         """        
-        return self.network_minted_coins
+        return to_decimal(self.network_minted_coins.value())
+
+    def pending_payouts(self) -> List[ScheduledPayout]:
+        """
+        Installments that have been scheduled by the Mixer but not paid out yet.
+
+        Returns:
+            List[ScheduledPayout]: Pending installments in due order.
+        """
+        return self.mixer.pending_payouts()
+
+    def completed_payouts(self) -> List[ScheduledPayout]:
+        """
+        Most recently paid out installments.
+
+        Returns:
+            List[ScheduledPayout]: Completed installments, oldest first.
+        """
+        return self.mixer.completed_payouts()
+
+    def wait_for_payouts(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until all installments scheduled by the Mixer have been paid out.
+        send() returns as soon as the installments are scheduled, so call this to observe final balances.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if no installments are pending anymore.
+        """
+        return self.mixer.wait_for_payouts(timeout)
 
     def get_fees_collected(self) -> Decimal:
         """
@@ -102,11 +299,28 @@ class BitcoinZNetwork:
 class BitcoinZAPINetwork:
     """
     User-facing network class that interacts with the user's input to call APIBasedMixer.
+    To poll the Jobcoin network for transactions, give the mixer a TransactionMirror: lookups are then
+    answered locally and only transactions added since the last poll are fetched. A DepositWatcher
+    polls the same feed for coins sent to deposit addresses and has the mixer pay them out.
     """
     MINTED = "(new)"
 
-    def __init__(self):        
-        self.mixer = APIBasedMixer()
+    def __init__(self, mixer: Optional[APIBasedMixer] = None, metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            mixer (APIBasedMixer, optional): Mixer executing the sends. Defaults to an APIBasedMixer recording in metrics.
+            metrics (MetricsRegistry, optional): Registry to record rejected sends in. Defaults to recording nothing.
+        """
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.mixer = mixer if mixer is not None else APIBasedMixer(metrics=metrics)
+        self._rejections = _rejections_counter(self.metrics)
+
+    @property
+    def events(self) -> EventBus:
+        """
+        Bus the mixer publishes deposits, installments, completed transactions and fees on, see project.bitcoinz.events.
+        """
+        return self.mixer.events
 
     def add_addresses(self, addresses: List[str]) -> str:
         """
@@ -130,7 +344,11 @@ class BitcoinZAPINetwork:
             amount (str): Amount to be sent
         """                    
         is_minted = sender == BitcoinZAPINetwork.MINTED
-        response = self.mixer.execute_transaction(sender, receiver, amount, is_minted)
+        try:
+            response = self.mixer.execute_transaction(sender, receiver, amount, is_minted)
+        except (InsufficientBalanceException, ValueError) as e:
+            self._rejections.labels(_rejection_reason(e)).inc()
+            raise
         return response
 
     def get_transactions(self, address=None) -> str:
@@ -146,6 +364,37 @@ class BitcoinZAPINetwork:
         """        
         return self.mixer.get_transactions(address)
 
+    def pending_payouts(self) -> List[ScheduledPayout]:
+        """
+        Installments that have been scheduled by the Mixer but not paid out yet.
+
+        Returns:
+            List[ScheduledPayout]: Pending installments in due order.
+        """
+        return self.mixer.pending_payouts()
+
+    def completed_payouts(self) -> List[ScheduledPayout]:
+        """
+        Most recently paid out installments.
+
+        Returns:
+            List[ScheduledPayout]: Completed installments, oldest first.
+        """
+        return self.mixer.completed_payouts()
+
+    def wait_for_payouts(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until all installments scheduled by the Mixer have been paid out.
+        send() returns as soon as the installments are scheduled, so call this to observe final balances.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if no installments are pending anymore.
+        """
+        return self.mixer.wait_for_payouts(timeout)
+
     def get_fees_collected(self) -> Decimal:
         """
         Returns amount of fees that the Mixer has collected so far
@@ -153,4 +402,89 @@ class BitcoinZAPINetwork:
         Returns:
             Decimal: Fees collected so far
         """        
-        return self.mixer.get_fees_collected()
\ No newline at end of file
+        return self.mixer.get_fees_collected()
+
+class AsyncBitcoinZAPINetwork:
+    """
+    asyncio counterpart of BitcoinZAPINetwork. send and get_transactions are awaitable so many
+    transactions can be in flight at once over the mixer's pooled connections.
+    """
+    MINTED = "(new)"
+
+    def __init__(self, mixer: Optional[AsyncAPIBasedMixer] = None, metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            mixer (AsyncAPIBasedMixer, optional): Mixer executing the sends. Defaults to an AsyncAPIBasedMixer recording in metrics.
+            metrics (MetricsRegistry, optional): Registry to record rejected sends in. Defaults to recording nothing.
+        """
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self.mixer = mixer if mixer is not None else AsyncAPIBasedMixer(metrics=metrics)
+        self._rejections = _rejections_counter(self.metrics)
+
+    @property
+    def events(self) -> EventBus:
+        """
+        Bus the mixer publishes deposits, installments, completed transactions and fees on, see project.bitcoinz.events.
+        """
+        return self.mixer.events
+
+    def add_addresses(self, addresses: List[str]) -> str:
+        """
+        Adds a list of addresses to the network and assigns a deposit address.
+
+        Args:
+            addresses (List[str]): A list of user's private addresses
+
+        Returns:
+            str: Unique deposit address allocated by Mixer
+        """
+        return self.mixer.get_deposit_address(addresses)
+
+    async def send(self, sender: str, receiver: str, amount: str) -> None:
+        """
+        Send an amount from sender to receiver.
+
+        Args:
+            sender (str): Sender's deposit address
+            receiver (str): Receiver's deposit address
+            amount (str): Amount to be sent
+        """
+        is_minted = sender == AsyncBitcoinZAPINetwork.MINTED
+        try:
+            await self.mixer.execute_transaction(sender, receiver, amount, is_minted)
+        except (InsufficientBalanceException, ValueError) as e:
+            self._rejections.labels(_rejection_reason(e)).inc()
+            raise
+
+    async def get_transactions(self, address=None):
+        """
+        Returns the balance and transactions of address, or all transactions on the network if address is None.
+
+        Args:
+            address ([type], optional): Deposit address associated with a wallet. Defaults to None.
+
+        Returns:
+            Parsed JSON response of the API.
+        """
+        return await self.mixer.get_transactions(address)
+
+    async def wait_for_payouts(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all installments started by the Mixer have been posted.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if no installments are pending anymore.
+        """
+        return await self.mixer.wait_for_payouts(timeout)
+
+    def get_fees_collected(self) -> Decimal:
+        """
+        Returns amount of fees that the Mixer has collected so far
+
+        Returns:
+            Decimal: Fees collected so far
+        """
+        return self.mixer.get_fees_collected()
@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from project.bitcoinz.metrics import NULL_METRICS, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class _Entry:
+    __slots__ = ("value", "loaded_at")
+
+    def __init__(self, value: Any, loaded_at: float):
+        self.value = value
+        self.loaded_at = loaded_at
+
+
+class _Flight:
+    """
+    A load in progress. Every caller asking for the key meanwhile waits for it instead of loading again.
+    """
+    def __init__(self):
+        self.value = None
+        self.error: Optional[BaseException] = None
+        # Set when the key is invalidated during the load, so its possibly outdated result is not cached
+        self.invalidated = False
+        self.done = threading.Event()
+
+
+class ReadThroughCache:
+    """
+    Bounded LRU cache in front of slow reads, e.g. Jobcoin API lookups.
+
+    A value is fresh for ttl seconds after it was loaded, then served stale for up to stale_ttl more
+    seconds while it is reloaded in the background. Concurrent misses of the same key share one load
+    (single-flight). Writers call invalidate() for the keys they change, and a load that was in flight
+    when its key was invalidated is handed to its waiters but not cached.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float = 1.0, stale_ttl: float = 10.0,
+                 cacheable: Optional[Callable[[Any], bool]] = None, clock: Callable[[], float] = time.monotonic,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            max_entries (int, optional): Entries kept before the least recently used is evicted. Defaults to 1024.
+            ttl (float, optional): Seconds a loaded value is served without reloading. Defaults to 1.
+            stale_ttl (float, optional): Seconds after ttl a value is still served while reloading it. Defaults to 10.
+            cacheable (Callable[[Any], bool], optional): Whether a loaded value may be cached, e.g. not error responses. Defaults to all values.
+            clock (Callable[[], float], optional): Monotonic clock in seconds. Defaults to time.monotonic.
+            metrics (MetricsRegistry, optional): Registry to count hits, stale hits and misses in. Defaults to recording nothing.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.cacheable = cacheable
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._refresher: Optional[ThreadPoolExecutor] = None
+        lookups = (metrics if metrics is not None else NULL_METRICS).counter(
+            "bitcoinz_cache_lookups_total", "Read-through cache lookups by result.", ("result",))
+        self._hits = lookups.labels("hit")
+        self._stale_hits = lookups.labels("stale")
+        self._misses = lookups.labels("miss")
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        The value of key, loaded with loader on a miss.
+
+        Args:
+            key (Hashable): e.g. an address.
+            loader (Callable[[], Any]): Loads the current value. Its exceptions are raised to every caller waiting for it.
+
+        Returns:
+            Any: The cached or loaded value. Cached values are shared, so callers must not modify them.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                age = self.clock() - entry.loaded_at
+                if age < self.ttl:
+                    self._entries.move_to_end(key)
+                    self._hits.inc()
+                    return entry.value
+                if age < self.ttl + self.stale_ttl:
+                    self._entries.move_to_end(key)
+                    if key not in self._flights:
+                        flight = self._flights[key] = _Flight()
+                        self._refresh_executor().submit(self._load, key, loader, flight)
+                    self._stale_hits.inc()
+                    return entry.value
+                del self._entries[key]
+
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        self._misses.inc()
+
+        if leader:
+            self._load(key, loader, flight)
+        else:
+            flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    def invalidate(self, key: Hashable) -> None:
+        """
+        Drop the value of key, so the next get() loads it again.
+
+        Args:
+            key (Hashable): Key whose value changed.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            flight = self._flights.pop(key, None)
+            if flight is not None:
+                flight.invalidated = True
+
+    def clear(self) -> None:
+        """
+        Drop every value.
+        """
+        with self._lock:
+            self._entries.clear()
+            for flight in self._flights.values():
+                flight.invalidated = True
+            self._flights.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def close(self) -> None:
+        """
+        Wait for background reloads to finish.
+        """
+        if self._refresher is not None:
+            self._refresher.shutdown(wait=True)
+
+    def _load(self, key: Hashable, loader: Callable[[], Any], flight: _Flight) -> None:
+        try:
+            flight.value = loader()
+        except Exception as e:
+            flight.error = e
+            logger.debug("cache_load_failed key=%s error=%s", key, e)
+
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if flight.error is None and not flight.invalidated and (self.cacheable is None or self.cacheable(flight.value)):
+                self._entries[key] = _Entry(flight.value, self.clock())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        flight.done.set()
+
+    def _refresh_executor(self) -> ThreadPoolExecutor:
+        # Caller holds the lock
+        if self._refresher is None:
+            self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+        return self._refresher
@@ -0,0 +1,184 @@
+import json
+import shlex
+from typing import IO, Callable, Dict, Iterable, List, Optional, Tuple
+
+from project.bitcoinz.exceptions import BatchSendException
+
+# Characters that need shlex; lines without them are split on whitespace, which is much faster
+_QUOTING = frozenset("'\"\\#")
+
+
+def tokenize(line: str) -> List[str]:
+    """
+    Split a command line into tokens, shell style: quotes group words and # starts a comment.
+
+    Args:
+        line (str): Command line.
+
+    Raises:
+        ValueError: If a quote is not closed.
+
+    Returns:
+        List[str]: Tokens, empty for blank lines and comments.
+    """
+    if _QUOTING.isdisjoint(line):
+        return line.split()
+    return shlex.split(line, comments=True)
+
+
+class BatchRunner:
+    """
+    Runs CLI commands streamed from a file without prompting, writing one JSON line per command:
+    {"line": <line number>, "command": ..., "ok": true, ...} or {"line": ..., "ok": false, "error": ..., "type": ...}.
+
+    Consecutive sends are buffered and sent with one send_many() per batch_size rows where the network
+    supports it, so a long replay costs one ledger commit per batch instead of one per row. Any other
+    command sends the buffered rows first, so commands take effect, and are reported, in file order.
+
+    Commands:
+        add_address address1[,address2,...]     -> {"deposit_address": ...}
+        send [sender] receiver amount           -> {}, sender omitted to mint
+        get_transactions [address]              -> {"transactions": ...}
+        dump_transactions [address]             -> {"records": [...]}
+        metrics                                 -> {"metrics": {...}}
+        wait_for_payouts [timeout]              -> {"drained": ...}
+    """
+    def __init__(self, network, out: IO[str], batch_size: int = 1000):
+        """
+        Args:
+            network: BitcoinZNetwork, BitcoinZAPINetwork or ServiceClient to run the commands against.
+            out (IO[str]): Stream the JSON lines are written to.
+            batch_size (int, optional): Maximum number of sends per send_many(). Defaults to 1000.
+        """
+        self.network = network
+        self.out = out
+        self.batch_size = batch_size
+        self.num_commands = 0
+        self.num_failed = 0
+        self._sends: List[Tuple[int, Tuple[str, str, str]]] = []
+        self._commands: Dict[str, Callable[[List[str]], Dict]] = {
+            "add_address": self._add_address,
+            "get_transactions": self._get_transactions,
+            "dump_transactions": self._dump_transactions,
+            "metrics": self._metrics,
+            "wait_for_payouts": self._wait_for_payouts,
+        }
+
+    def run(self, lines: Iterable[str]) -> int:
+        """
+        Run every command of lines, then send the sends still buffered.
+
+        Args:
+            lines (Iterable[str]): Command lines, e.g. an open file.
+
+        Returns:
+            int: Number of commands that failed.
+        """
+        for number, line in enumerate(lines, 1):
+            self.run_line(number, line)
+        self.flush()
+        return self.num_failed
+
+    def run_line(self, number: int, line: str) -> None:
+        """
+        Run one command line, or buffer it if it is a send. Blank lines and comments are skipped.
+
+        Args:
+            number (int): Line number reported with the result.
+            line (str): Command line.
+        """
+        try:
+            tokens = tokenize(line)
+        except ValueError as e:
+            self.flush()
+            self._report_error(number, None, e)
+            return
+        if not tokens:
+            return
+        command, args = tokens[0], tokens[1:]
+        if command == "send":
+            self._buffer_send(number, args)
+            return
+        self.flush()
+        handler = self._commands.get(command)
+        if handler is None:
+            self._report_error(number, command, NotImplementedError("Command not found: {}".format(command)))
+            return
+        try:
+            self._report(number, command, handler(args))
+        except Exception as e:
+            self._report_error(number, command, e)
+
+    def flush(self) -> None:
+        """
+        Send the buffered sends and report their results.
+        """
+        if not self._sends:
+            return
+        sends, self._sends = self._sends, []
+        if hasattr(self.network, "send_many"):
+            errors = self._send_many([transfer for _, transfer in sends])
+        else:
+            errors = [self._send_one(transfer) for _, transfer in sends]
+        for (number, _), error in zip(sends, errors):
+            if error is None:
+                self._report(number, "send", {})
+            else:
+                self._report_error(number, "send", error)
+
+    def _buffer_send(self, number: int, args: List[str]) -> None:
+        if len(args) == 2:
+            transfer = (self.network.MINTED, args[0], args[1])
+        elif len(args) == 3:
+            transfer = (args[0], args[1], args[2])
+        else:
+            self.flush()
+            self._report_error(number, "send", ValueError("Usage: send [sender] receiver amount"))
+            return
+        self._sends.append((number, transfer))
+        if len(self._sends) >= self.batch_size:
+            self.flush()
+
+    def _send_many(self, transfers: List[Tuple[str, str, str]]) -> List[Optional[Exception]]:
+        try:
+            return self.network.send_many(transfers, atomic=False)
+        except BatchSendException as e:
+            return [e.errors.get(row) for row in range(len(transfers))]
+        except Exception as e:
+            return [e] * len(transfers)
+
+    def _send_one(self, transfer: Tuple[str, str, str]) -> Optional[Exception]:
+        try:
+            self.network.send(*transfer)
+        except Exception as e:
+            return e
+        return None
+
+    def _add_address(self, args: List[str]) -> Dict:
+        addresses = [address for address in ",".join(args).split(",") if address]
+        if not addresses:
+            raise ValueError("Usage: add_address address1[,address2,...]")
+        return {"deposit_address": self.network.add_addresses(addresses)}
+
+    def _get_transactions(self, args: List[str]) -> Dict:
+        return {"transactions": self.network.get_transactions(*args[:1])}
+
+    def _dump_transactions(self, args: List[str]) -> Dict:
+        return {"records": list(self.network.iter_transactions(*args[:1]))}
+
+    def _metrics(self, args: List[str]) -> Dict:
+        return {"metrics": json.loads(self.network.metrics.to_json())}
+
+    def _wait_for_payouts(self, args: List[str]) -> Dict:
+        return {"drained": self.network.wait_for_payouts(float(args[0]) if args else None)}
+
+    def _report(self, number: int, command: str, result: Dict) -> None:
+        self.num_commands += 1
+        result.update(line=number, command=command, ok=True)
+        self.out.write(json.dumps(result) + "\n")
+
+    def _report_error(self, number: int, command: Optional[str], error: Exception) -> None:
+        self.num_commands += 1
+        self.num_failed += 1
+        result = {"line": number, "command": command, "ok": False, "error": str(error), "type": type(error).__name__}
+        self.out.write(json.dumps(result) + "\n")
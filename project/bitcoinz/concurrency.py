@@ -0,0 +1,128 @@
+import threading
+import zlib
+from typing import Iterable, List
+
+
+class StripedLock:
+    """
+    A fixed set of locks, each guarding every key that hashes to it. Threads touching different keys rarely
+    contend, while the memory used stays bounded however many keys there are.
+
+    Several keys are locked with acquire(), which takes their stripes in index order, so two threads locking
+    overlapping sets of keys can never deadlock.
+    """
+    def __init__(self, stripes: int = 64):
+        """
+        Args:
+            stripes (int, optional): Number of locks. Defaults to 64.
+        """
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def stripe_of(self, key: str) -> int:
+        """
+        Index of the lock guarding key.
+
+        Args:
+            key (str): e.g. a deposit address.
+
+        Returns:
+            int: Stripe index.
+        """
+        return zlib.crc32(key.encode()) % len(self._locks)
+
+    def acquire(self, keys: Iterable[str]) -> "_HeldStripes":
+        """
+        Lock the stripes of keys, in index order. Use as a context manager.
+
+        Args:
+            keys (Iterable[str]): Keys to lock.
+
+        Returns:
+            _HeldStripes: Releases the stripes on exit.
+        """
+        return _HeldStripes([self._locks[i] for i in sorted({self.stripe_of(key) for key in keys})])
+
+    def acquire_all(self) -> "_HeldStripes":
+        """
+        Lock every stripe, e.g. for a consistent copy of everything guarded.
+
+        Returns:
+            _HeldStripes: Releases the stripes on exit.
+        """
+        return _HeldStripes(self._locks)
+
+
+class _HeldStripes:
+    def __init__(self, locks: List[threading.Lock]):
+        self._locks = locks
+
+    def __enter__(self) -> "_HeldStripes":
+        for lock in self._locks:
+            lock.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        for lock in reversed(self._locks):
+            lock.release()
+
+
+class _NoLock:
+    """
+    Context manager that locks nothing, for code paths where locking is optional.
+    """
+    def __enter__(self) -> "_NoLock":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+NO_LOCK = _NoLock()
+
+
+class ThreadLocalCounter:
+    """
+    An integer total that many threads add to without contending: each thread adds to its own cell,
+    and reading the value merges the cells.
+    """
+    def __init__(self, initial: int = 0):
+        self._base = initial
+        self._local = threading.local()
+        self._cells: List[List[int]] = []
+        self._lock = threading.Lock()
+
+    def add(self, delta: int) -> None:
+        """
+        Add delta to the total.
+
+        Args:
+            delta (int): Amount to add, may be negative.
+        """
+        cell = getattr(self._local, "cell", None)
+        if cell is None:
+            cell = self._local.cell = [0]
+            with self._lock:
+                self._cells.append(cell)
+        cell[0] += delta
+
+    def value(self) -> int:
+        """
+        Current total of all threads.
+
+        Returns:
+            int: Sum of the initial value and all additions.
+        """
+        with self._lock:
+            return self._base + sum(cell[0] for cell in self._cells)
+
+    def reset(self, value: int) -> None:
+        """
+        Set the total. Caller must make sure no thread is adding concurrently.
+
+        Args:
+            value (int): New total.
+        """
+        with self._lock:
+            self._base = value
+            for cell in self._cells:
+                cell[0] = 0
@@ -0,0 +1,281 @@
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Optional, Tuple
+
+from project.bitcoinz.ledger import _now_ns
+
+logger = logging.getLogger(__name__)
+
+# Kinds of events published by the mixers
+DEPOSIT_RECEIVED = "deposit_received"
+INSTALLMENT_PAID = "installment_paid"
+TRANSACTION_COMPLETED = "transaction_completed"
+FEE_COLLECTED = "fee_collected"
+
+# What a bounded subscription does with an event when its buffer is full
+DROP = "drop"
+BLOCK = "block"
+
+
+class Event:
+    """
+    Something that happened to money in the mixer. Amounts in data are integer base units.
+    """
+    __slots__ = ("kind", "data", "timestamp_ns")
+
+    def __init__(self, kind: str, data: Dict[str, Any], timestamp_ns: Optional[int] = None):
+        self.kind = kind
+        self.data = data
+        self.timestamp_ns = timestamp_ns if timestamp_ns is not None else _now_ns()
+
+    def __repr__(self) -> str:
+        return "Event({!r}, {!r})".format(self.kind, self.data)
+
+
+class Subscription:
+    """
+    A subscriber's interest in some kinds of events (all, if kinds is None) on an EventBus.
+    """
+    def __init__(self, bus: "EventBus", kinds: Optional[Iterable[str]]):
+        self.bus = bus
+        self.kinds: Optional[FrozenSet[str]] = frozenset(kinds) if kinds is not None else None
+        # Events not delivered because the buffer was full
+        self.dropped = 0
+
+    def wants(self, kind: str) -> bool:
+        return self.kinds is None or kind in self.kinds
+
+    def deliver(self, event: Event) -> None:
+        raise NotImplementedError
+
+    def unsubscribe(self) -> None:
+        """
+        Stop receiving events.
+        """
+        self.bus._remove(self)
+
+
+class CallbackSubscription(Subscription):
+    """
+    Calls a function with every event, synchronously on the publishing thread. Exceptions of the callback
+    are logged, so a failing subscriber cannot break the mixer.
+    """
+    def __init__(self, bus: "EventBus", kinds: Optional[Iterable[str]], callback: Callable[[Event], None]):
+        super().__init__(bus, kinds)
+        self.callback = callback
+
+    def deliver(self, event: Event) -> None:
+        try:
+            self.callback(event)
+        except Exception:
+            logger.exception("Event subscriber failed on %s", event.kind)
+
+
+class QueueSubscription(Subscription):
+    """
+    Buffers up to maxsize events for a consuming thread. When the buffer is full, the DROP policy discards
+    new events and counts them in dropped; the BLOCK policy makes the publisher wait for room.
+    """
+    def __init__(self, bus: "EventBus", kinds: Optional[Iterable[str]], maxsize: int = 1000, policy: str = DROP):
+        super().__init__(bus, kinds)
+        if policy not in (DROP, BLOCK):
+            raise ValueError("Unknown policy {}".format(policy))
+        self.maxsize = maxsize
+        self.policy = policy
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def deliver(self, event: Event) -> None:
+        with self._cond:
+            while len(self._buffer) >= self.maxsize and not self._closed:
+                if self.policy == DROP:
+                    self.dropped += 1
+                    return
+                self._cond.wait()
+            if self._closed:
+                return
+            self._buffer.append(event)
+            self._cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[Event]:
+        """
+        Next event, oldest first.
+
+        Args:
+            timeout (float, optional): Seconds to wait for one. Defaults to None (wait forever).
+
+        Returns:
+            Optional[Event]: The event, or None on timeout or after unsubscribe().
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._buffer or self._closed, timeout):
+                return None
+            if not self._buffer:
+                return None
+            event = self._buffer.popleft()
+            self._cond.notify_all()
+            return event
+
+    def __len__(self) -> int:
+        with self._cond:
+            return len(self._buffer)
+
+    def unsubscribe(self) -> None:
+        super().unsubscribe()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class AsyncQueueSubscription(Subscription):
+    """
+    Buffers up to maxsize events for a consumer on an asyncio event loop, which awaits get() or iterates
+    with async for. Events published on other threads are handed to the loop thread-safely. With the BLOCK
+    policy, publishers on other threads wait for room; a publisher on the loop itself cannot wait without
+    stalling the consumer, so it drops instead.
+    """
+    def __init__(self, bus: "EventBus", kinds: Optional[Iterable[str]], maxsize: int = 1000, policy: str = DROP):
+        super().__init__(bus, kinds)
+        if policy not in (DROP, BLOCK):
+            raise ValueError("Unknown policy {}".format(policy))
+        self.maxsize = maxsize
+        self.policy = policy
+        self._loop = asyncio.get_event_loop()
+        self._loop_thread = threading.get_ident()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        # Free places in the buffer, taken by publishers and returned by the consumer
+        self._room = maxsize
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def deliver(self, event: Event) -> None:
+        on_loop = threading.get_ident() == self._loop_thread
+        with self._cond:
+            while self._room == 0 and not self._closed:
+                if self.policy == DROP or on_loop:
+                    self.dropped += 1
+                    return
+                self._cond.wait()
+            if self._closed:
+                return
+            self._room -= 1
+        if on_loop:
+            self._queue.put_nowait(event)
+        else:
+            self._loop.call_soon_threadsafe(self._queue.put_nowait, event)
+
+    async def get(self) -> Event:
+        """
+        Next event, oldest first.
+
+        Returns:
+            Event: The event.
+        """
+        event = await self._queue.get()
+        with self._cond:
+            self._room += 1
+            self._cond.notify()
+        return event
+
+    def unsubscribe(self) -> None:
+        """
+        Stop receiving events. Publishers waiting for room return, dropping their events.
+        """
+        super().unsubscribe()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __aiter__(self) -> "AsyncQueueSubscription":
+        return self
+
+    async def __anext__(self) -> Event:
+        return await self.get()
+
+
+class EventBus:
+    """
+    In-process publish/subscribe of money movements. Publishing costs one check while nobody is
+    subscribed, and one delivery per interested subscriber otherwise.
+    """
+    def __init__(self):
+        # Replaced rather than modified, so publish() iterates without locking
+        self._subscriptions: Tuple[Subscription, ...] = ()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """
+        If anybody is subscribed, so publishers can skip building events otherwise.
+        """
+        return bool(self._subscriptions)
+
+    def subscribe(self, callback: Callable[[Event], None], kinds: Optional[Iterable[str]] = None) -> CallbackSubscription:
+        """
+        Call callback with every event of kinds, on the thread publishing it.
+
+        Args:
+            callback (Callable[[Event], None]): Called with each event; should return quickly.
+            kinds (Iterable[str], optional): Kinds of events wanted, e.g. [DEPOSIT_RECEIVED]. Defaults to all.
+
+        Returns:
+            CallbackSubscription: Call unsubscribe() on it to stop.
+        """
+        return self._add(CallbackSubscription(self, kinds, callback))
+
+    def subscribe_queue(self, kinds: Optional[Iterable[str]] = None, maxsize: int = 1000, policy: str = DROP) -> QueueSubscription:
+        """
+        Buffer the events of kinds for a consuming thread, see QueueSubscription.
+
+        Args:
+            kinds (Iterable[str], optional): Kinds of events wanted. Defaults to all.
+            maxsize (int, optional): Events buffered at most. Defaults to 1000.
+            policy (str, optional): DROP or BLOCK when the buffer is full. Defaults to DROP.
+
+        Returns:
+            QueueSubscription: Consume with get().
+        """
+        return self._add(QueueSubscription(self, kinds, maxsize, policy))
+
+    def subscribe_async(self, kinds: Optional[Iterable[str]] = None, maxsize: int = 1000, policy: str = DROP) -> AsyncQueueSubscription:
+        """
+        Buffer the events of kinds for a consumer on the current event loop, see AsyncQueueSubscription.
+        Call from the loop's thread.
+
+        Args:
+            kinds (Iterable[str], optional): Kinds of events wanted. Defaults to all.
+            maxsize (int, optional): Events buffered at most. Defaults to 1000.
+            policy (str, optional): DROP or BLOCK when the buffer is full. Defaults to DROP.
+
+        Returns:
+            AsyncQueueSubscription: Consume with await get() or async for.
+        """
+        return self._add(AsyncQueueSubscription(self, kinds, maxsize, policy))
+
+    def publish(self, kind: str, **data) -> None:
+        """
+        Deliver an event to every subscriber interested in its kind.
+
+        Args:
+            kind (str): Kind of event, e.g. DEPOSIT_RECEIVED.
+            **data: Details of the event.
+        """
+        subscriptions = self._subscriptions
+        if not subscriptions:
+            return
+        event = Event(kind, data)
+        for subscription in subscriptions:
+            if subscription.wants(kind):
+                subscription.deliver(event)
+
+    def _add(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions = self._subscriptions + (subscription,)
+        return subscription
+
+    def _remove(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
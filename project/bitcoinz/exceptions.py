@@ -3,7 +3,42 @@ class InsufficientBalanceException(Exception):
         message = "Insufficient balance in sender's account"
         super().__init__(message)
 
+    def __reduce__(self):
+        # Picklable, so it can be raised across processes
+        return (type(self), ())
+
 class DepositAddressDoesntExistException(Exception):
     def __init__(self, address):
+        self.address = address
         message = "Deposit address ({}) does not exist in the JobMixer".format(address)
-        super().__init__(message)
\ No newline at end of file
+        super().__init__(message)
+
+    def __reduce__(self):
+        return (type(self), (self.address,))
+
+class BatchSendException(Exception):
+    def __init__(self, errors):
+        """
+        Args:
+            errors (Dict[int, Exception]): Validation error per failed row index of the batch.
+        """
+        self.errors = errors
+        message = "{} transfer(s) in batch failed validation, nothing was sent: {}".format(
+            len(errors), "; ".join("row {}: {}".format(row, error) for row, error in sorted(errors.items())))
+        super().__init__(message)
+
+    def __reduce__(self):
+        return (type(self), (self.errors,))
+
+class CircuitOpenException(Exception):
+    def __init__(self, retry_after):
+        """
+        Args:
+            retry_after (float): Seconds until the circuit breaker lets a request through again.
+        """
+        self.retry_after = retry_after
+        message = "Jobcoin API is unavailable, retry in {:.1f}s".format(retry_after)
+        super().__init__(message)
+
+    def __reduce__(self):
+        return (type(self), (self.retry_after,))
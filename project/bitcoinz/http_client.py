@@ -0,0 +1,330 @@
+import asyncio
+import functools
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Dict, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from project.bitcoinz.exceptions import CircuitOpenException
+from project.bitcoinz.metrics import NULL_METRICS, MetricsRegistry
+from project.bitcoinz.resilience import STATE_VALUES, CircuitBreaker, LatencyWindow
+from project.bitcoinz.throttle import CREATE, GET_ADDRESS, GET_TRANSACTIONS, POST_TRANSACTION, Throttle
+
+
+# (connect, read) timeout in seconds of every call that does not pass its own
+DEFAULT_TIMEOUT = (3.05, 10.0)
+
+
+def _close_response(future: Future) -> None:
+    # Returns the connection of a response nobody reads to the pool
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class JobcoinClient:
+    """
+    Synchronous client for the Jobcoin API endpoints (/create, /api/transactions, /api/addresses/{addr}).
+    All calls share one requests.Session, so TCP/TLS connections are kept alive and reused from a pool.
+    Calls to endpoints with a Throttle wait for its rate cap and adaptive concurrency limit first.
+
+    Every call has a connect and a read timeout. With a CircuitBreaker, calls fail fast with
+    CircuitOpenException while the API is unhealthy; failed calls and 5xx responses count as failures.
+    With hedge_reads, a GET not answered within the hedge_quantile of recent GET latencies is sent a
+    second time and whichever response arrives first is used, which cuts the tail latency of reads.
+    """
+    def __init__(self, base_url: str, pool_size: int = 10, session: Optional[requests.Session] = None,
+                 metrics: Optional[MetricsRegistry] = None, throttles: Optional[Dict[str, Throttle]] = None,
+                 timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT, breaker: Optional[CircuitBreaker] = None,
+                 hedge_reads: bool = False, hedge_quantile: float = 0.95):
+        """
+        Initialize the client.
+
+        Args:
+            base_url (str): Base URL of the Jobcoin API, e.g. http://bitcoinz.gemini.com/iodine-defrost
+            pool_size (int, optional): Maximum number of keep-alive connections per host. Defaults to 10.
+            session (requests.Session, optional): Session to issue requests with. Defaults to a new pooled session.
+            metrics (MetricsRegistry, optional): Registry to record the latency of every call in. Defaults to recording nothing.
+            throttles (Dict[str, Throttle], optional): Throttle per endpoint, keyed by the names in project.bitcoinz.throttle,
+                e.g. {POST_TRANSACTION: Throttle(rate=100)}. A Throttle may be shared by several endpoints. Defaults to none.
+            timeout (float or Tuple[float, float], optional): Seconds to connect and to wait for the response, or (connect, read).
+                Defaults to DEFAULT_TIMEOUT.
+            breaker (CircuitBreaker, optional): Breaker shared by all endpoints. Defaults to None.
+            hedge_reads (bool, optional): Send a second GET when the first is slower than usual. Defaults to False.
+            hedge_quantile (float, optional): Quantile of recent GET latencies after which to hedge. Defaults to 0.95.
+        """
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self.session = session
+        self.metrics = metrics if metrics is not None else NULL_METRICS
+        self._latency_histogram = self.metrics.histogram("bitcoinz_http_request_seconds", "Latency of Jobcoin API calls.",
+                                                         ("method", "status"))
+        self.throttles = dict(throttles) if throttles is not None else {}
+        limit = self.metrics.gauge("bitcoinz_throttle_limit", "Requests in flight allowed by the adaptive limiter, per endpoint.", ("endpoint",))
+        overloaded = self.metrics.gauge("bitcoinz_throttle_overloaded_requests", "Requests answered 429, 5xx or failed, per endpoint.", ("endpoint",))
+        for endpoint, throttle in self.throttles.items():
+            limit.labels(endpoint).set_function(lambda throttle=throttle: throttle.limiter.limit)
+            overloaded.labels(endpoint).set_function(lambda throttle=throttle: throttle.num_overloaded)
+
+        self.timeout = timeout
+        self.breaker = breaker
+        if breaker is not None:
+            self.metrics.gauge("bitcoinz_circuit_breaker_state", "State of the API circuit breaker: 0 closed, 1 half open, 2 open.").set_function(
+                lambda: STATE_VALUES[breaker.state])
+            self.metrics.gauge("bitcoinz_circuit_breaker_rejected_requests", "Calls failed fast by the open circuit breaker.").set_function(
+                lambda: breaker.num_rejected)
+        self.hedge_reads = hedge_reads
+        self.hedge_quantile = hedge_quantile
+        self.read_latencies = LatencyWindow()
+        self._hedge_executor = ThreadPoolExecutor(max_workers=2 * pool_size) if hedge_reads else None
+        self._hedges = self.metrics.counter("bitcoinz_http_hedged_requests_total", "GETs sent a second time because the first was slow.")
+
+    def create(self, address: str) -> requests.Response:
+        """
+        Mint 50 coins to address.
+
+        Args:
+            address (str): Address receiving the minted coins.
+
+        Returns:
+            requests.Response: Response of POST /create
+        """
+        return self.request("POST", "{}/create".format(self.base_url), endpoint=CREATE, data={"address": address})
+
+    def post_transaction(self, from_address: str, to_address: str, amount: str,
+                         idempotency_key: Optional[str] = None) -> requests.Response:
+        """
+        Transfer amount from from_address to to_address.
+
+        Args:
+            from_address (str): Sender's address.
+            to_address (str): Receiver's address.
+            amount (str): Amount to be sent.
+            idempotency_key (str, optional): Sent as Idempotency-Key header, so retries with the same key
+                are applied at most once by servers supporting it. Defaults to None.
+
+        Returns:
+            requests.Response: Response of POST /api/transactions
+        """
+        payload = {"fromAddress": from_address, "toAddress": to_address, "amount": amount}
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key is not None else None
+        return self.request("POST", "{}/api/transactions".format(self.base_url), endpoint=POST_TRANSACTION, data=payload, headers=headers)
+
+    def get_transactions(self, start: Optional[int] = None) -> requests.Response:
+        """
+        Fetch every transaction on the network.
+
+        Args:
+            start (int, optional): Only fetch the body from this byte offset on, with a Range request. Servers
+                supporting it answer 206 with the suffix, others 200 with the whole body. Defaults to None.
+
+        Returns:
+            requests.Response: Response of GET /api/transactions
+        """
+        # Offsets are into the uncompressed body, so ranges are requested without content encoding
+        headers = {"Range": "bytes={}-".format(start), "Accept-Encoding": "identity"} if start is not None else None
+        return self.request("GET", "{}/api/transactions".format(self.base_url), endpoint=GET_TRANSACTIONS, headers=headers)
+
+    def get_address(self, address: str) -> requests.Response:
+        """
+        Fetch balance and transactions of a single address.
+
+        Args:
+            address (str): Address to look up.
+
+        Returns:
+            requests.Response: Response of GET /api/addresses/{address}
+        """
+        return self.request("GET", "{}/api/addresses/{}".format(self.base_url, address), endpoint=GET_ADDRESS)
+
+    def request(self, method: str, url: str, endpoint: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        Issue a request over the pooled session, through the circuit breaker and the throttle of endpoint if there are.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute URL.
+            endpoint (str, optional): Name of the endpoint, e.g. POST_TRANSACTION. Defaults to None.
+
+        Raises:
+            CircuitOpenException: If the circuit breaker is open.
+            requests.RequestException: If the request failed, e.g. timed out.
+
+        Returns:
+            requests.Response: The response.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        breaker = self.breaker
+        if breaker is not None and not breaker.allow():
+            raise CircuitOpenException(breaker.retry_after())
+
+        send = self._send_hedged if self.hedge_reads and method == "GET" else self._send
+        throttle = self.throttles.get(endpoint) if endpoint is not None else None
+        healthy = False
+        try:
+            if throttle is not None:
+                response = throttle.call(lambda: send(method, url, **kwargs))
+            else:
+                response = send(method, url, **kwargs)
+            healthy = response.status_code < 500
+            return response
+        finally:
+            if breaker is not None:
+                breaker.record(healthy)
+
+    def _send_hedged(self, method: str, url: str, **kwargs) -> requests.Response:
+        delay = self.read_latencies.percentile(self.hedge_quantile)
+        if delay is None:
+            # Too few latencies yet to tell a slow response
+            return self._send_timed(method, url, **kwargs)
+        attempts = [self._hedge_executor.submit(self._send_timed, method, url, **kwargs)]
+        done, _ = wait(attempts, timeout=delay)
+        if not done:
+            self._hedges.inc()
+            attempts.append(self._hedge_executor.submit(self._send_timed, method, url, **kwargs))
+
+        error = None
+        pending = attempts
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                for other in pending:
+                    other.add_done_callback(_close_response)
+                return future.result()
+        raise error
+
+    def _send_timed(self, method: str, url: str, **kwargs) -> requests.Response:
+        start = time.perf_counter()
+        response = self._send(method, url, **kwargs)
+        self.read_latencies.observe(time.perf_counter() - start)
+        return response
+
+    def _send(self, method: str, url: str, **kwargs) -> requests.Response:
+        if not self.metrics.enabled:
+            return self.session.request(method, url, **kwargs)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            response = self.session.request(method, url, **kwargs)
+            status = str(response.status_code)
+            return response
+        finally:
+            self._latency_histogram.labels(method, status).observe(time.perf_counter() - start)
+
+    def close(self) -> None:
+        """
+        Close all pooled connections.
+        """
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
+        self.session.close()
+
+
+class AsyncJobcoinClient:
+    """
+    Awaitable counterpart of JobcoinClient for use from an asyncio event loop.
+
+    Requests are issued over the pooled session of a JobcoinClient on a thread pool, and an
+    asyncio.Semaphore per host caps how many of them are in flight at once.
+    """
+    def __init__(self, base_url: str, max_concurrency_per_host: int = 8, client: Optional[JobcoinClient] = None,
+                 executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Initialize the client.
+
+        Args:
+            base_url (str): Base URL of the Jobcoin API.
+            max_concurrency_per_host (int, optional): Maximum number of concurrent requests per host. Defaults to 8.
+            client (JobcoinClient, optional): Synchronous client whose connection pool is shared. Defaults to a new one sized to the concurrency.
+            executor (ThreadPoolExecutor, optional): Executor running the requests. Defaults to one sized to the concurrency.
+        """
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self.client = client if client is not None else JobcoinClient(base_url, pool_size=max_concurrency_per_host)
+        self.base_url = self.client.base_url
+        self._executor = executor if executor is not None else ThreadPoolExecutor(max_workers=max_concurrency_per_host)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def create(self, address: str) -> requests.Response:
+        """
+        Mint 50 coins to address.
+
+        Args:
+            address (str): Address receiving the minted coins.
+
+        Returns:
+            requests.Response: Response of POST /create
+        """
+        return await self.request("POST", "{}/create".format(self.base_url), endpoint=CREATE, data={"address": address})
+
+    async def post_transaction(self, from_address: str, to_address: str, amount: str) -> requests.Response:
+        """
+        Transfer amount from from_address to to_address.
+
+        Args:
+            from_address (str): Sender's address.
+            to_address (str): Receiver's address.
+            amount (str): Amount to be sent.
+
+        Returns:
+            requests.Response: Response of POST /api/transactions
+        """
+        payload = {"fromAddress": from_address, "toAddress": to_address, "amount": amount}
+        return await self.request("POST", "{}/api/transactions".format(self.base_url), endpoint=POST_TRANSACTION, data=payload)
+
+    async def get_transactions(self) -> requests.Response:
+        """
+        Fetch every transaction on the network.
+
+        Returns:
+            requests.Response: Response of GET /api/transactions
+        """
+        return await self.request("GET", "{}/api/transactions".format(self.base_url), endpoint=GET_TRANSACTIONS)
+
+    async def get_address(self, address: str) -> requests.Response:
+        """
+        Fetch balance and transactions of a single address.
+
+        Args:
+            address (str): Address to look up.
+
+        Returns:
+            requests.Response: Response of GET /api/addresses/{address}
+        """
+        return await self.request("GET", "{}/api/addresses/{}".format(self.base_url, address), endpoint=GET_ADDRESS)
+
+    async def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """
+        Issue a request without blocking the event loop, waiting for a free slot of the host first.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Absolute URL.
+
+        Returns:
+            requests.Response: The response.
+        """
+        host = urlsplit(url).netloc
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            semaphore = self._semaphores[host] = asyncio.Semaphore(self.max_concurrency_per_host)
+
+        async with semaphore:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(self.client.request, method, url, **kwargs))
+
+    def close(self) -> None:
+        """
+        Shut down the executor and close all pooled connections.
+        """
+        self._executor.shutdown(wait=True)
+        self.client.close()
@@ -0,0 +1,153 @@
+import time
+from array import array
+from typing import Dict, List, Optional
+
+# time.time_ns is only available from Python 3.7
+_now_ns = getattr(time, "time_ns", lambda: int(time.time() * 10 ** 9))
+
+
+class AddressTable:
+    """
+    Interns address strings to dense integer ids, so every address string is stored only once.
+    """
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._addresses: List[str] = []
+
+    def intern(self, address: str) -> int:
+        """
+        Get the id of address, allocating a new one if it has not been seen before.
+
+        Args:
+            address (str): Address string.
+
+        Returns:
+            int: Address id.
+        """
+        address_id = self._ids.get(address)
+        if address_id is None:
+            address_id = self._ids[address] = len(self._addresses)
+            self._addresses.append(address)
+        return address_id
+
+    def lookup(self, address: str) -> Optional[int]:
+        """
+        Get the id of address without allocating one.
+
+        Args:
+            address (str): Address string.
+
+        Returns:
+            Optional[int]: Address id, None if address has not been interned.
+        """
+        return self._ids.get(address)
+
+    def address(self, address_id: int) -> str:
+        """
+        Get the address string of an id.
+
+        Args:
+            address_id (int): Address id.
+
+        Returns:
+            str: Address string.
+        """
+        return self._addresses[address_id]
+
+    def __len__(self) -> int:
+        return len(self._addresses)
+
+
+class TransactionLog:
+    """
+    Append-only, columnar log of transactions. Each column is a packed array of 64-bit integers:
+    interned sender and receiver ids, amounts in base units and UTC epoch-nanosecond timestamps.
+    A transaction is identified by its row number; see Transaction.at() for an object view of a row.
+    """
+    def __init__(self, addresses: Optional[AddressTable] = None):
+        """
+        Initialize an empty log.
+
+        Args:
+            addresses (AddressTable, optional): Address table to intern addresses with. Defaults to a new table.
+        """
+        self.addresses = addresses if addresses is not None else AddressTable()
+        self.from_ids = array('q')
+        self.to_ids = array('q')
+        self.amounts = array('q')
+        self.timestamps = array('q')
+
+    def append(self, from_address: str, to_address: str, amount: int, timestamp_ns: Optional[int] = None) -> int:
+        """
+        Append a transaction to the log. Timestamps never go backwards, so rows stay sorted by time.
+
+        Args:
+            from_address (str): Sender's address.
+            to_address (str): Receiver's address.
+            amount (int): Amount in base units.
+            timestamp_ns (int, optional): UTC epoch nanoseconds. Defaults to now.
+
+        Returns:
+            int: Row number of the transaction.
+        """
+        if timestamp_ns is None:
+            timestamp_ns = _now_ns()
+        if self.timestamps and timestamp_ns < self.timestamps[-1]:
+            timestamp_ns = self.timestamps[-1]
+
+        self.amounts.append(amount)
+        self.from_ids.append(self.addresses.intern(from_address))
+        self.to_ids.append(self.addresses.intern(to_address))
+        self.timestamps.append(timestamp_ns)
+        return len(self.timestamps) - 1
+
+    def from_address(self, row: int) -> str:
+        """
+        Sender's address of a row.
+
+        Args:
+            row (int): Row number.
+
+        Returns:
+            str: Sender's address.
+        """
+        return self.addresses.address(self.from_ids[row])
+
+    def to_address(self, row: int) -> str:
+        """
+        Receiver's address of a row.
+
+        Args:
+            row (int): Row number.
+
+        Returns:
+            str: Receiver's address.
+        """
+        return self.addresses.address(self.to_ids[row])
+
+    def bisect_timestamp(self, timestamp_ns: int, rows=None, hi: Optional[int] = None) -> int:
+        """
+        Position of the first row at or after timestamp_ns, by binary search.
+
+        Args:
+            timestamp_ns (int): UTC epoch nanoseconds.
+            rows (Sequence[int], optional): Sorted subset of row numbers to search, e.g. a wallet's index. Defaults to all rows.
+            hi (int, optional): Only search positions before hi. Defaults to the end.
+
+        Returns:
+            int: Position within rows (or row number if rows is None).
+        """
+        timestamps = self.timestamps
+        lo = 0
+        if hi is None:
+            hi = len(rows) if rows is not None else len(timestamps)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if timestamps[rows[mid] if rows is not None else mid] < timestamp_ns:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
@@ -0,0 +1,334 @@
+import bisect
+import json
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from project.bitcoinz.concurrency import NO_LOCK, ThreadLocalCounter
+
+# Upper bounds in seconds of the latency histogram buckets, from 100us to 10s
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Metric:
+    """
+    A named metric, optionally with labels. A labelled metric records nothing itself; labels() returns
+    the child recording one combination of label values.
+    """
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+        self._children_lock = threading.Lock()
+
+    def labels(self, *values: str) -> "_Metric":
+        """
+        The child of this metric recording the given label values, in the order of labelnames.
+
+        Returns:
+            _Metric: Child metric of the same kind.
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError("{} expects labels {}".format(self.name, self.labelnames))
+            with self._children_lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = self._children[key] = self._new_child()
+        return child
+
+    def samples(self) -> List[Tuple[Dict[str, str], object]]:
+        """
+        (labels, value) of this metric, or of each of its children if labelled.
+        """
+        if not self.labelnames:
+            return [({}, self._value())]
+        with self._children_lock:
+            children = list(self._children.items())
+        return [(dict(zip(self.labelnames, key)), child._value()) for key, child in children]
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _value(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    A total that only goes up, e.g. number of sends. Threads increment it without contending.
+    """
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._total = ThreadLocalCounter()
+
+    def inc(self, amount: int = 1) -> None:
+        """
+        Add amount to the total.
+
+        Args:
+            amount (int, optional): Non-negative increment. Defaults to 1.
+        """
+        self._total.add(amount)
+
+    def value(self) -> int:
+        return self._total.value()
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.help)
+
+    def _value(self) -> int:
+        return self.value()
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, e.g. queue depth. Either set explicitly, or read from a function when
+    collected, so the hot path does not pay for keeping it current.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._current = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self._current = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """
+        Read the value from function whenever the gauge is collected.
+
+        Args:
+            function (Callable[[], float]): Returns the current value, e.g. scheduler.num_pending.
+        """
+        self._function = function
+
+    def value(self) -> float:
+        return self._function() if self._function is not None else self._current
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.help)
+
+    def _value(self) -> float:
+        return self.value()
+
+
+class Histogram(_Metric):
+    """
+    Distribution of observed values, e.g. latencies in seconds, counted in fixed buckets.
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # One count per bucket plus one for values above the last bound
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """
+        Record one value.
+
+        Args:
+            value (float): Observed value, e.g. seconds.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def time(self) -> "_Timer":
+        """
+        Context manager observing the seconds its block takes.
+
+        Returns:
+            _Timer: Timer of the block.
+        """
+        return _Timer(self)
+
+    def snapshot(self) -> Dict:
+        """
+        Returns:
+            Dict: count, sum and cumulative count per bucket upper bound ("+Inf" for all).
+        """
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = {}
+        running = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            running += count
+            cumulative[_format_bound(bound)] = running
+        return {"count": running, "sum": total, "buckets": cumulative}
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def _value(self) -> Dict:
+        return self.snapshot()
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+        self._start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._histogram.observe(time.perf_counter() - self._start)
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+
+class MetricsRegistry:
+    """
+    The metrics of a process. Metrics are created on first use by name, so components sharing a registry
+    add to the same totals, and exported as a JSON-serializable snapshot or in the Prometheus text format.
+    """
+    enabled = True
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help, labelnames, buckets=buckets)
+
+    def _get_or_create(self, cls, name: str, help: str, labelnames: Sequence[str], **kwargs) -> _Metric:
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError("Metric {} is already registered as a {} with labels {}".format(name, metric.kind, metric.labelnames))
+            return metric
+
+    def collect(self) -> List[_Metric]:
+        """
+        Every registered metric, sorted by name.
+        """
+        with self._lock:
+            return [self._metrics[name] for name in sorted(self._metrics)]
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Current values of every metric.
+
+        Returns:
+            Dict[str, Dict]: {name: {"type": ..., "help": ..., "samples": [{"labels": {...}, "value": ...}]}}.
+            Histogram values are dicts, see Histogram.snapshot().
+        """
+        return {metric.name: {"type": metric.kind, "help": metric.help,
+                              "samples": [{"labels": labels, "value": value} for labels, value in metric.samples()]}
+                for metric in self.collect()}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self) -> str:
+        """
+        Current values of every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: One HELP and TYPE line per metric followed by its samples.
+        """
+        lines = []
+        for metric in self.collect():
+            lines.append("# HELP {} {}".format(metric.name, metric.help))
+            lines.append("# TYPE {} {}".format(metric.name, metric.kind))
+            for labels, value in metric.samples():
+                if metric.kind == "histogram":
+                    for bound, count in value["buckets"].items():
+                        lines.append(_sample_line(metric.name + "_bucket", dict(labels, le=bound), count))
+                    lines.append(_sample_line(metric.name + "_sum", labels, value["sum"]))
+                    lines.append(_sample_line(metric.name + "_count", labels, value["count"]))
+                else:
+                    lines.append(_sample_line(metric.name, labels, value))
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+def _sample_line(name: str, labels: Dict[str, str], value) -> str:
+    if labels:
+        name += "{" + ",".join('{}="{}"'.format(key, str(val).replace("\\", "\\\\").replace('"', '\\"'))
+                               for key, val in labels.items()) + "}"
+    return "{} {}".format(name, value)
+
+
+class _NullMetric:
+    """
+    Stands in for every kind of metric when metrics are disabled; records nothing.
+    """
+    def labels(self, *values: str) -> "_NullMetric":
+        return self
+
+    def inc(self, amount: int = 1) -> None:
+        pass
+
+    def set(self, value: float) -> None:
+        pass
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        pass
+
+    def observe(self, value: float) -> None:
+        pass
+
+    def time(self):
+        return NO_LOCK
+
+
+class NullRegistry:
+    """
+    Registry handing out metrics that record nothing, the default of every component, so instrumentation
+    costs no more than an empty method call when metrics are disabled.
+    """
+    enabled = False
+
+    _METRIC = _NullMetric()
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> _NullMetric:
+        return self._METRIC
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> _NullMetric:
+        return self._METRIC
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> _NullMetric:
+        return self._METRIC
+
+    def collect(self) -> List[_Metric]:
+        return []
+
+    def snapshot(self) -> Dict[str, Dict]:
+        return {}
+
+    def to_json(self) -> str:
+        return "{}"
+
+    def to_prometheus(self) -> str:
+        return ""
+
+
+NULL_METRICS = NullRegistry()
@@ -0,0 +1,203 @@
+import json
+import logging
+import re
+import threading
+from typing import Dict, Iterator, List, Optional
+
+from project.bitcoinz.amount import format_amount, parse_amount
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import NULL_METRICS, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+_SEPARATOR = re.compile(r"[\s,]*")
+
+
+class TransactionMirror:
+    """
+    Local, indexed copy of the transactions of the Jobcoin API, kept up to date incrementally.
+
+    GET /api/transactions returns a JSON array that is only ever appended to. The mirror remembers the byte
+    offset of the array's closing bracket and fetches the body from there on with a Range request, so each
+    sync transfers and parses only the transactions added since the last one. The few bytes before that
+    offset are fetched again and compared, and the mirror is rebuilt from scratch if the remote history
+    was rewritten. Servers ignoring the Range header answer with the whole body, which is then sliced.
+
+    Balances and histories per address are indexed as transactions arrive and answered locally.
+    """
+    # Bytes before the high-water mark that are fetched again to check the history was only appended to, at least 1
+    OVERLAP = 64
+
+    def __init__(self, client: JobcoinClient, metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            client (JobcoinClient): Client of the API to mirror.
+            metrics (MetricsRegistry, optional): Registry to record fetched bytes and rebuilds in. Defaults to recording nothing.
+        """
+        self.client = client
+        self.transactions: List[Dict[str, str]] = []
+        self._balances: Dict[str, int] = {}
+        self._history: Dict[str, List[int]] = {}
+        # Byte offset of the closing "]" of the remote array, 0 before the first sync
+        self._end = 0
+        self._tail = b""
+        # Number of full downloads; positions of transactions seen before the last one are void
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._poller: Optional[threading.Thread] = None
+
+        metrics = metrics if metrics is not None else NULL_METRICS
+        self._fetched_bytes = metrics.counter("bitcoinz_mirror_fetched_bytes_total", "Bytes of the transaction feed fetched by the mirror.")
+        self._rebuilds = metrics.counter("bitcoinz_mirror_rebuilds_total", "Full downloads of the transaction feed by the mirror.")
+        metrics.gauge("bitcoinz_mirror_transactions", "Transactions in the local mirror.").set_function(self.transactions.__len__)
+
+    def sync(self) -> int:
+        """
+        Fetch and index the transactions added remotely since the last sync.
+
+        Raises:
+            requests.HTTPError: If the API answers with an error.
+
+        Returns:
+            int: Number of new transactions.
+        """
+        with self._lock:
+            if self._end == 0:
+                return self._rebuild()
+
+            start = self._end - len(self._tail)
+            response = self.client.get_transactions(start=start)
+            if response.status_code == 416:
+                return self._rebuild()
+            response.raise_for_status()
+            chunk = response.content if response.status_code == 206 else response.content[start:]
+            self._fetched_bytes.inc(len(response.content))
+            if not chunk.startswith(self._tail):
+                logger.info("Remote transaction history changed, rebuilding the mirror")
+                return self._rebuild()
+            return self._append(chunk[len(self._tail):], self._end)
+
+    def lookup(self, address: Optional[str]):
+        """
+        Answer a lookup locally, in the shape of the API's responses.
+
+        Args:
+            address (str, optional): Address to look up, None for all transactions.
+
+        Returns:
+            The transactions as GET /api/transactions would return them, or with an address the balance
+            and transactions as GET /api/addresses/{address} would.
+        """
+        with self._lock:
+            if address is None:
+                return list(self.transactions)
+            return {"balance": format_amount(self._balances.get(address, 0)),
+                    "transactions": [self.transactions[i] for i in self._history.get(address, ())]}
+
+    def transactions_since(self, position: int) -> List[Dict[str, str]]:
+        """
+        Transactions mirrored after the first position ones, oldest first.
+
+        Args:
+            position (int): Number of transactions already seen, e.g. len() of an earlier result.
+
+        Returns:
+            List[Dict[str, str]]: The newer transactions.
+        """
+        with self._lock:
+            return self.transactions[position:]
+
+    def balance(self, address: str) -> int:
+        """
+        Balance of address in base units, as of the last sync.
+        """
+        with self._lock:
+            return self._balances.get(address, 0)
+
+    def start(self, interval: float = 1.0) -> None:
+        """
+        Sync every interval seconds on a background thread until stop() is called.
+
+        Args:
+            interval (float, optional): Seconds between syncs. Defaults to 1.
+        """
+        self._stop.clear()
+        self._poller = threading.Thread(target=self._poll, args=(interval,), name="transaction-mirror", daemon=True)
+        self._poller.start()
+
+    def stop(self) -> None:
+        """
+        Stop the background syncs started by start().
+        """
+        self._stop.set()
+        if self._poller is not None:
+            self._poller.join()
+            self._poller = None
+
+    def _poll(self, interval: float) -> None:
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning("Syncing the transaction mirror failed: %s", e)
+            self._stop.wait(interval)
+
+    def _rebuild(self) -> int:
+        # Caller holds the lock
+        response = self.client.get_transactions()
+        response.raise_for_status()
+        body = response.content
+        self._fetched_bytes.inc(len(body))
+        self._rebuilds.inc()
+        self.generation += 1
+        stripped = body.lstrip()
+        if not stripped.startswith(b"["):
+            raise ValueError("Malformed transaction feed")
+        self.transactions.clear()
+        self._balances.clear()
+        self._history.clear()
+        offset = len(body) - len(stripped) + 1
+        self._tail = body[:offset]
+        return self._append(stripped[1:], offset)
+
+    def _append(self, data: bytes, offset: int) -> int:
+        """
+        Index the elements in data, the remote array from byte offset on up to and including its closing "]".
+        Caller holds the lock.
+        """
+        data = data.rstrip()
+        if not data.endswith(b"]"):
+            raise ValueError("Malformed transaction feed")
+        elements = data[:-1]
+        added = 0
+        for transaction in _parse_elements(elements.decode()):
+            self._index(transaction)
+            added += 1
+        self._tail = (self._tail + elements)[-self.OVERLAP:]
+        self._end = offset + len(elements)
+        return added
+
+    def _index(self, transaction: Dict[str, str]) -> None:
+        row = len(self.transactions)
+        self.transactions.append(transaction)
+        amount = parse_amount(transaction["amount"])
+        sender, receiver = transaction.get("fromAddress"), transaction["toAddress"]
+        if sender is not None:
+            self._balances[sender] = self._balances.get(sender, 0) - amount
+            self._history.setdefault(sender, []).append(row)
+        self._balances[receiver] = self._balances.get(receiver, 0) + amount
+        if receiver != sender:
+            self._history.setdefault(receiver, []).append(row)
+
+
+def _parse_elements(text: str) -> Iterator[Dict[str, str]]:
+    """
+    Yields the JSON values of a comma separated sequence, e.g. the inside of an array or a suffix of it.
+    """
+    decoder = json.JSONDecoder()
+    position = _SEPARATOR.match(text).end()
+    while position < len(text):
+        value, position = decoder.raw_decode(text, position)
+        yield value
+        position = _SEPARATOR.match(text, position).end()
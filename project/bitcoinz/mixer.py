@@ -1,33 +1,164 @@
 import random
-from project.bitcoinz.transaction import Transaction
-from project.bitcoinz.wallet import Wallet
+from project.bitcoinz.transaction import Transaction, TransactionPage, parse_timestamp, transaction_dict
+from project.bitcoinz.storage import (FEES_COLLECTED, HOUSE_BALANCE, MINTED_COINS, InMemoryStorage, LedgerChanges,
+                                      LedgerStorage, TransactionRecord)
+import asyncio
+import json
 import logging
+import threading
 import time
-import time
-from typing import List, Optional
+from collections import deque
+from datetime import datetime
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 import uuid
 import requests
 from decimal import Decimal
-from project.bitcoinz.exceptions import InsufficientBalanceException
+from project.bitcoinz.exceptions import CircuitOpenException, InsufficientBalanceException
+from project.bitcoinz.amount import apply_fee, fee_ratio, format_amount, parse_amount, to_decimal
+from project.bitcoinz.scheduler import PayoutScheduler, ScheduledPayout
+from project.bitcoinz.splitter import InstallmentSplitter
+from project.bitcoinz.rounds import PayoutRounds, RoundTransfer
+from project.bitcoinz.concurrency import NO_LOCK
+from project.bitcoinz.http_client import AsyncJobcoinClient, JobcoinClient
+from project.bitcoinz.metrics import NULL_METRICS, MetricsRegistry
+from project.bitcoinz.cache import ReadThroughCache
+from project.bitcoinz.mirror import TransactionMirror
+from project.bitcoinz.outbox import OutboxEntry, PayoutOutbox
+from project.bitcoinz.throttle import Throttle
+from project.bitcoinz.events import DEPOSIT_RECEIVED, FEE_COLLECTED, INSTALLMENT_PAID, TRANSACTION_COMPLETED, EventBus
+
+logger = logging.getLogger(__name__)
+
+
+def _is_ok_response(lookup: Tuple[int, object]) -> bool:
+    return lookup[0] == requests.codes.ok
+
+
+class _PayoutProgress:
+    """
+    Counts down the installments of one transaction, so TRANSACTION_COMPLETED is published after the last one.
+    """
+    def __init__(self, details: Dict):
+        self.details = details
+        self.remaining = 0
+        self._lock = threading.Lock()
+
+    def paid(self) -> bool:
+        """
+        Record one installment as paid. Returns True for the last one.
+        """
+        with self._lock:
+            self.remaining -= 1
+            return self.remaining == 0
+
+
+def _publish_received(events: EventBus, sender: str, receiver: str, amount: int, fee: int, is_minted: bool) -> _PayoutProgress:
+    """
+    Publish DEPOSIT_RECEIVED and FEE_COLLECTED for a transaction taken into the house account.
+
+    Returns:
+        _PayoutProgress: Progress to pass along with the transaction's installments.
+    """
+    events.publish(DEPOSIT_RECEIVED, sender=sender, deposit_address=receiver, amount=amount, minted=is_minted)
+    events.publish(FEE_COLLECTED, deposit_address=receiver, amount=fee)
+    return _PayoutProgress({"sender": sender, "deposit_address": receiver, "amount": amount, "fee": fee})
+
+
+def _publish_paid(events: EventBus, progress) -> None:
+    """
+    Count an installment paid, publishing TRANSACTION_COMPLETED for the transaction if it was its last one.
+
+    Args:
+        events (EventBus): Bus to publish on.
+        progress: _PayoutProgress of the installment's transaction, None, or a list of them for a transfer of a
+            payout round, which pays one installment of each.
+    """
+    for part in progress if isinstance(progress, list) else (progress,):
+        if part is not None and part.paid():
+            events.publish(TRANSACTION_COMPLETED, **part.details)
+
 
 class Mixer:
     """
     A class that simulates the BitcoinZ Mixer.
     """
-    def __init__(self, fee_percentage: Decimal = Decimal("0.02")):
+    # Installments are paid out at random intervals between 0 and MAX_INSTALLMENT_DELAY seconds
+    MAX_INSTALLMENT_DELAY = 2.5
+
+    def __init__(self, fee_percentage: Decimal = Decimal("0.02"), scheduler: Optional[PayoutScheduler] = None,
+                 storage: Optional[LedgerStorage] = None, rng: Optional[random.Random] = None,
+                 metrics: Optional[MetricsRegistry] = None, events: Optional[EventBus] = None,
+                 splitter: Optional[InstallmentSplitter] = None, round_window: Optional[float] = None):
         """
         Initialize the mixer with a fee percentage
 
         Args:
             fee_percentage (Decimal, optional): Percentage fee to charge per transaction. Defaults to 0.02.
+            scheduler (PayoutScheduler, optional): Scheduler executing delayed installments. Defaults to a background PayoutScheduler.
+            storage (LedgerStorage, optional): Where wallets, balances and transactions are kept. Defaults to an InMemoryStorage.
+                Pass a StripedInMemoryStorage to send from many threads concurrently.
+            rng (random.Random, optional): Source of installment splits and delays, e.g. seeded for benchmarks. Defaults to an unseeded Random.
+            metrics (MetricsRegistry, optional): Registry to record sends, fees and latencies in. Defaults to recording nothing.
+            events (EventBus, optional): Bus to publish deposits, installments, completed transactions and fees on. Defaults to a new one.
+            splitter (InstallmentSplitter, optional): Splits payouts into installments. Defaults to uniform weights drawn from rng.
+            round_window (float, optional): Pay installments in PayoutRounds this many seconds apart, coalesced per receiver,
+                instead of one by one. Defaults to None.
         """                
-        self.deposit_addresses_to_wallet = dict()
-        self._house_address = uuid.uuid4().hex
+        self.scheduler = scheduler if scheduler is not None else PayoutScheduler()
+        self.rng = rng if rng is not None else random.Random()
+        self.splitter = splitter if splitter is not None else InstallmentSplitter(rng=self.rng)
+        self.events = events if events is not None else EventBus()
+        # Set by project.bitcoinz.persistence.open_mixer to make an in-memory ledger durable
+        self.journal = None
+        self._lock = threading.RLock()
+        # Balances and fees are held in integer base units, see project.bitcoinz.amount
+        self.storage = storage if storage is not None else InMemoryStorage()
         self.fee_percentage = Decimal(fee_percentage)
-        print("Fee percentage is", self.fee_percentage)
-        self.house_balance = Decimal(0)
-        self.fees_collected = Decimal(0)
-        self.transaction_queue = []
+        self._fee_ratio = fee_ratio(self.fee_percentage)
+        self._init_metrics(metrics if metrics is not None else NULL_METRICS)
+        self.rounds = None
+        if round_window is not None:
+            self.rounds = PayoutRounds(self.scheduler, self._pay_round, round_window, self.rng, self.metrics)
+        logger.debug("mixer_started fee_percentage=%s storage=%s", self.fee_percentage, type(self.storage).__name__)
+
+    def _init_metrics(self, metrics: MetricsRegistry) -> None:
+        self.metrics = metrics
+        self._sends_counter = metrics.counter("bitcoinz_sends_total", "Transactions executed by the mixer, minted ones included.")
+        self._mints_counter = metrics.counter("bitcoinz_mints_total", "Transactions of minted coins executed by the mixer.")
+        self._fees_counter = metrics.counter("bitcoinz_fees_collected_units_total", "Fees collected, in base units.")
+        self._execute_histogram = metrics.histogram("bitcoinz_execute_transaction_seconds",
+                                                    "Latency of committing a transaction (or batch) and scheduling its installments.")
+        self._installment_histogram = metrics.histogram("bitcoinz_installment_seconds", "Latency of paying out one installment.")
+        metrics.gauge("bitcoinz_payout_queue_depth", "Installments scheduled but not paid out yet.").set_function(self.scheduler.num_pending)
+        metrics.gauge("bitcoinz_wallets", "Wallets in the mixer.").set_function(self.storage.num_wallets)
+
+    def _ledger_lock(self):
+        """
+        Lock serializing changes to the ledger. Thread-safe storage (e.g. StripedInMemoryStorage) does its
+        own finer-grained locking, so the mixer-wide lock is only taken when changes must be journaled in order.
+        """
+        if self.journal is None and self.storage.thread_safe:
+            return NO_LOCK
+        return self._lock
+
+    @property
+    def house_balance(self) -> int:
+        return self.storage.counter(HOUSE_BALANCE)
+
+    @property
+    def fees_collected(self) -> int:
+        return self.storage.counter(FEES_COLLECTED)
+
+    @property
+    def minted_coins(self) -> int:
+        return self.storage.counter(MINTED_COINS)
+
+    @property
+    def payouts_owed(self) -> Dict[str, int]:
+        """
+        Amount after fees still to be paid out per receiver.
+        """
+        return self.storage.owed()
     
     def get_balance(self, address: str) -> Decimal:
         """
@@ -40,10 +171,47 @@ class Mixer:
         Returns:
             Decimal: Balance in wallet associated with deposit address
         """        
-        if address not in self.deposit_addresses_to_wallet:
-            return Decimal(0)
-        return self.deposit_addresses_to_wallet[address].get_balance()
+        return to_decimal(self.get_balance_units(address))
+
+    def get_balance_units(self, address: str) -> int:
+        """
+        Get balance associated with given deposit address in base units.
+        If address does not exist in mixer, return 0.
+
+        Args:
+            address (str): Deposit address associated with wallet
+
+        Returns:
+            int: Balance in base units
+        """
+        return self.storage.balance(address)
+
+    def get_received(self, private_address: str) -> Decimal:
+        """
+        Get the total paid out to a private address. Its wallet's balance includes it.
+        If address is not a private address in mixer, return 0.
+
+        Args:
+            private_address (str): Private address of a wallet.
+
+        Returns:
+            Decimal: Amount paid out to the address
+        """
+        return to_decimal(self.storage.received(private_address))
     
+    def get_wallet_balances(self, addresses: Iterable[str]) -> Dict[str, int]:
+        """
+        Get balances of several deposit addresses in base units at once.
+
+        Args:
+            addresses (Iterable[str]): Deposit addresses.
+
+        Returns:
+            Dict[str, int]: Balance per address that exists in mixer. Unknown addresses are left out.
+        """
+        storage = self.storage
+        return {address: storage.balance(address) for address in set(addresses) if storage.has_wallet(address)}
+
     def get_deposit_address(self, private_addresses: List[str]) -> str:
         """
         Get a fresh deposit address from Mixer.
@@ -51,16 +219,35 @@ class Mixer:
         Args:
             deposit_addresses (List[str]): A list of private addresses.
 
+        Raises:
+            ValueError: If a private address is repeated or already registered with another deposit address.
+
         Returns:
             str: A unique deposit address associated with user's wallet
         """        
-        new_address = uuid.uuid4().hex
-
-        while new_address in self.deposit_addresses_to_wallet:
+        lsn = None
+        with self._ledger_lock():
             new_address = uuid.uuid4().hex
-        
-        self.deposit_addresses_to_wallet[new_address] = Wallet(private_addresses, new_address)
+
+            while self.storage.has_wallet(new_address):
+                new_address = uuid.uuid4().hex
+
+            self._register_wallet(new_address, private_addresses)
+            if self.journal is not None:
+                lsn = self.journal.log_address(new_address, private_addresses)
+        if lsn is not None:
+            self.journal.commit(lsn)
         return new_address
+
+    def _register_wallet(self, deposit_address: str, private_addresses: List[str]) -> None:
+        """
+        Create the wallet of a deposit address.
+
+        Args:
+            deposit_address (str): Fresh deposit address.
+            private_addresses (List[str]): A list of private addresses.
+        """
+        self.storage.add_wallet(deposit_address, private_addresses)
     
     def execute_transaction(self, transaction: Transaction, is_minted: bool = False) -> None:
         """
@@ -70,86 +257,324 @@ class Mixer:
             transaction (Transaction): A valid transaction initiated.
             is_minted (bool, optional): Whether the transaction involvde the coins minted i.e. no sender. Defaults to False.
         """        
-        sender_address: str = transaction.get_from_address()
-        receiver_address: str = transaction.get_to_address()
-        amount: Decimal = Decimal(transaction.get_amount())
+        self.execute_transactions([(transaction, is_minted)])
 
-        fee = amount * self.fee_percentage
-        amount_after_fee = amount - fee
+    def execute_transactions(self, batch: List[Tuple[Transaction, bool]]) -> None:
+        """
+        Execute a batch of validated transactions through the BitcoinZ Mixer as a single storage commit.
+        All senders are debited under one lock acquisition; installments are scheduled afterwards.
 
-        # We also charge the fee for minted transactions
-        self._transfer_amount(sender_address, self._house_address, amount, is_minted)
-        self._transfer_discrete(receiver_address, amount_after_fee)
-        
-        # Global queue of transactions
-        self.transaction_queue.append(transaction)
+        Args:
+            batch (List[Tuple[Transaction, bool]]): (transaction, is_minted) pairs, executed in order.
 
-        if not is_minted:
-            self.deposit_addresses_to_wallet[sender_address].add_transaction(transaction)
+        Raises:
+            InsufficientBalanceException: If a sender cannot cover its debits. Nothing is committed.
+        """
+        with self._execute_histogram.time():
+            self._execute_transactions(batch)
 
-        self.deposit_addresses_to_wallet[receiver_address].add_transaction(transaction)
-        self.fees_collected += fee
-        self.house_balance -= fee
+    def _execute_transactions(self, batch: List[Tuple[Transaction, bool]]) -> None:
+        changes = LedgerChanges()
+        payouts = []
+        lsn = None
+        with self._ledger_lock():
+            for transaction, is_minted in batch:
+                sender_address: str = transaction.get_from_address()
+                receiver_address: str = transaction.get_to_address()
+                amount_after_fee = self._stage_transaction(changes, sender_address, receiver_address, transaction.get_amount(),
+                                                           transaction.timestamp_ns, is_minted)
+                payouts.append((receiver_address, amount_after_fee))
+            self.storage.commit(changes)
 
-    def _transfer_amount(self, sender: str, receiver: str, amt: Decimal, is_minted: bool) -> None:
+            if self.journal is not None:
+                for transaction, is_minted in batch:
+                    lsn = self.journal.log_transaction(transaction.get_from_address(), transaction.get_to_address(),
+                                                       transaction.get_amount(), transaction.timestamp_ns, is_minted)
+                self.journal.maybe_snapshot(self)
+        # Outside the lock, so concurrent batches share the group commit
+        if lsn is not None:
+            self.journal.commit(lsn)
+
+        if self.metrics.enabled:
+            self._sends_counter.inc(len(batch))
+            self._mints_counter.inc(sum(1 for _, is_minted in batch if is_minted))
+            self._fees_counter.inc(changes.counters.get(FEES_COLLECTED, 0))
+        publish = self.events.active
+        destinations = [self.storage.private_addresses(receiver_address) or [receiver_address] for receiver_address, _ in payouts]
+        # One draw of random weights for the whole batch
+        splits = self.splitter.split_many([(amount_after_fee, len(addresses))
+                                           for (_, amount_after_fee), addresses in zip(payouts, destinations)])
+        for (transaction, is_minted), (receiver_address, amount_after_fee), installments, addresses in zip(batch, payouts, splits, destinations):
+            progress = None
+            if publish:
+                amount = transaction.get_amount()
+                progress = _publish_received(self.events, transaction.get_from_address(), receiver_address, amount,
+                                             amount - amount_after_fee, is_minted)
+            self._transfer_discrete(receiver_address, amount_after_fee, progress, installments, addresses)
+
+    def _commit_transaction(self, sender_address: str, receiver_address: str, amount: int, timestamp_ns: int, is_minted: bool) -> int:
         """
-        Transfers an amount from sender to receiver directly. Sender could be house_address.
+        Apply a single transaction to the ledger. Caller must hold the lock.
+
+        Returns:
+            int: Amount after fee in base units, to be paid out to the receiver.
+        """
+        changes = LedgerChanges()
+        amount_after_fee = self._stage_transaction(changes, sender_address, receiver_address, amount, timestamp_ns, is_minted)
+        self.storage.commit(changes)
+        return amount_after_fee
+
+    def _stage_transaction(self, changes: LedgerChanges, sender_address: str, receiver_address: str, amount: int,
+                           timestamp_ns: int, is_minted: bool) -> int:
+        """
+        Add a transaction to changes: debit the sender into the house account, collect the fee and
+        record the amount after fee as owed to the receiver.
+
+        Returns:
+            int: Amount after fee in base units, to be paid out to the receiver.
+        """
+        self._stage_debit(changes, sender_address, amount, is_minted)
+        changes.add_transaction(sender_address, receiver_address, amount, timestamp_ns)
+        return self._stage_credit(changes, receiver_address, amount)
+
+    def _stage_debit(self, changes: LedgerChanges, sender_address: str, amount: int, is_minted: bool) -> None:
+        """
+        Add the sender's side of a transaction to changes: the amount moves into the house account.
+        """
+        self._transfer_amount(changes, sender_address, self.storage.house_address, amount, is_minted)
+        if is_minted:
+            changes.add_counter(MINTED_COINS, amount)
+
+    def _stage_credit(self, changes: LedgerChanges, receiver_address: str, amount: int) -> int:
+        """
+        Add the receiver's side of a transaction to changes: collect the fee and owe the rest to the receiver.
+
+        Returns:
+            int: Amount after fee in base units, to be paid out to the receiver.
+        """
+        # We also charge the fee for minted transactions
+        fee = apply_fee(amount, self._fee_ratio)
+        amount_after_fee = amount - fee
+        changes.add_counter(FEES_COLLECTED, fee)
+        changes.add_counter(HOUSE_BALANCE, -fee)
+        changes.add_owed(receiver_address, amount_after_fee)
+        return amount_after_fee
+
+    def _transfer_amount(self, changes: LedgerChanges, sender: str, receiver: str, amt: int, is_minted: bool) -> None:
+        """
+        Adds a transfer of an amount from sender to receiver to changes. Sender could be house_address.
         If is_minted, receiver receives balance from network.
 
         Args:
+            changes (LedgerChanges): Changes to add the transfer to.
             sender (str): Sender's deposit address. Could be '(new)' if is_minted.
             receiver (str): Receiver's deposit address.
-            amt (Decimal): Amount.
+            amt (int): Amount in base units.
             is_minted (bool): If coins were minted from network.
         """        
+        house_address = self.storage.house_address
         if not is_minted:
-            if sender == self._house_address:
-                self.house_balance -= amt
+            if sender == house_address:
+                changes.add_counter(HOUSE_BALANCE, -amt)
             else:
-                sender_wallet = self.deposit_addresses_to_wallet[sender]
-                sender_wallet.decrease_balance(amt)
+                changes.add_balance(sender, -amt)
 
-        if receiver == self._house_address:
-            self.house_balance += amt
+        if receiver == house_address:
+            changes.add_counter(HOUSE_BALANCE, amt)
         else:
-            receiver_wallet = self.deposit_addresses_to_wallet[receiver]
-            receiver_wallet.increase_balance(amt)
+            changes.add_balance(receiver, amt)
 
 
-    def _get_n_random_proportions(self, n) -> List[Decimal]:
+    def _transfer_discrete(self, receiver: str, amt: int, progress: Optional[_PayoutProgress] = None,
+                           installments: Optional[List[int]] = None, destinations: Optional[List[str]] = None) -> List[ScheduledPayout]:
         """
-        List of n random Decimals that sum exactly to 1.0.
+        Schedules transfers of amount from house_address to the private addresses of receiver in random discrete amounts,
+        intervals, one installment per private address in random order. Returns right away; installments are paid out by the scheduler.
 
         Args:
-            n ([type]): Length of list to be returned
+            receiver (str): Receiver's deposit address. Paid itself if its wallet has no private addresses.
+            amt (int): Amount in base units to be transferred.
+            progress (_PayoutProgress, optional): Progress of the transaction, to publish its completion. Defaults to None.
+            installments (List[int], optional): amt already split. Defaults to splitting it into one installment per private address.
+            destinations (List[str], optional): Private addresses of receiver, if already looked up. Defaults to looking them up.
 
         Returns:
-            List[Decimal]: A list of Decimals that sum to 1.0, e.g. [0.2, 0.65, 0.15]
+            List[ScheduledPayout]: Handles of the scheduled installments, none if they are paid in rounds.
+        """        
+        if destinations is None:
+            destinations = self.storage.private_addresses(receiver) or [receiver]
+        if installments is None:
+            installments = self.splitter.split(amt, len(destinations))
+        if progress is not None:
+            progress.remaining = len(installments)
+        # Installments may be fewer than the addresses, see InstallmentSplitter
+        destinations = self.rng.sample(destinations, len(installments))
+
+        # Random delay between installments of 0 to 2.5 seconds
+        random_delays = [self.rng.uniform(0, self.MAX_INSTALLMENT_DELAY) for _ in range(len(installments)-1)]
+        delays = [0.0]
+        for random_delay in random_delays:
+            delays.append(delays[-1] + random_delay)
+
+        if self.rounds is not None:
+            self.rounds.submit_many([(delay, destination, installment, progress)
+                                     for delay, destination, installment in zip(delays, destinations, installments)])
+            return []
+        return [self.scheduler.schedule(delay, self._pay_installment, destination, installment, progress)
+                for delay, destination, installment in zip(delays, destinations, installments)]
+
+    def _pay_installment(self, receiver: str, amt: int, progress: Optional[_PayoutProgress] = None) -> None:
         """
-        random_props = [random.random() for _ in range(n-1)]
-        random_sum = sum(random_props)
-        random_props = [Decimal(round((random_props[i]/random_sum), 2)) for i in range(len(random_props))]
-        random_props.append(Decimal(1.0) - Decimal(sum(random_props)))
-        return random_props
-    
-    def _transfer_discrete(self, receiver: str, amt: Decimal) -> None:
+        Pays a single installment from house_address to receiver. Run by the scheduler.
+
+        Args:
+            receiver (str): Private address of the receiving wallet.
+            amt (int): Amount of the installment in base units.
+            progress (_PayoutProgress, optional): Progress of the transaction, to publish its completion. Defaults to None.
         """
-        Transfers amount from house_address to receiver in random discrete amounts, intervals.
+        with self._installment_histogram.time():
+            lsn = None
+            with self._ledger_lock():
+                self._apply_installment(receiver, amt)
+                if self.journal is not None:
+                    lsn = self.journal.log_payout(receiver, amt)
+            if lsn is not None:
+                self.journal.commit(lsn)
+        logger.debug("installment_paid receiver=%s amount=%s", receiver, amt)
+        self.events.publish(INSTALLMENT_PAID, address=receiver, amount=amt)
+        _publish_paid(self.events, progress)
+
+    def _pay_round(self, transfers: List[RoundTransfer]) -> None:
+        """
+        Pays the transfers of a payout round from house_address as a single storage commit with one output
+        per private address. Run by the scheduler.
 
         Args:
-            receiver (str): Receiver's deposit address.
-            amt (Decimal): Amount to be transferred.
-        """        
-        num_addresses_receiver = self.deposit_addresses_to_wallet[receiver].get_num_addresses()
-        n_random_proportions = self._get_n_random_proportions(num_addresses_receiver)
+            transfers (List[RoundTransfer]): Installments coalesced per private address, parts holding their progress.
+        """
+        with self._installment_histogram.time():
+            lsn = None
+            with self._ledger_lock():
+                changes = LedgerChanges()
+                for transfer in transfers:
+                    self._stage_payout(changes, transfer.receiver, transfer.amount)
+                self.storage.commit(changes)
+                if self.journal is not None:
+                    for transfer in transfers:
+                        lsn = self.journal.log_payout(transfer.receiver, transfer.amount)
+            if lsn is not None:
+                self.journal.commit(lsn)
+        logger.debug("payout_round_paid transfers=%s", len(transfers))
+        for transfer in transfers:
+            self.events.publish(INSTALLMENT_PAID, address=transfer.receiver, amount=transfer.amount)
+            _publish_paid(self.events, transfer.parts)
+
+    def _apply_installment(self, receiver: str, amt: int) -> None:
+        """
+        Pay an installment from house_address to receiver in its own commit. Caller must hold the lock.
+
+        Args:
+            receiver (str): Private address of the receiving wallet.
+            amt (int): Amount of the installment in base units.
+        """
+        changes = LedgerChanges()
+        self._stage_payout(changes, receiver, amt)
+        self.storage.commit(changes)
+
+    def _stage_payout(self, changes: LedgerChanges, receiver: str, amt: int) -> None:
+        """
+        Add an installment to changes: it moves from house_address to the wallet of receiver, is recorded as
+        paid out to receiver and reduces what is owed to the wallet.
+
+        Args:
+            changes (LedgerChanges): Changes to add the installment to.
+            receiver (str): Private address of the receiving wallet, or a deposit address paid directly, as
+                journaled before installments went to private addresses.
+            amt (int): Amount of the installment in base units.
+        """
+        wallet = self.storage.wallet_of(receiver)
+        if wallet is None:
+            wallet = receiver
+        else:
+            changes.add_payout(receiver, amt)
+        self._transfer_amount(changes, self.storage.house_address, wallet, amt, is_minted=False)
+        changes.add_owed(wallet, -amt)
+
+    def resume_payouts(self) -> List[ScheduledPayout]:
+        """
+        Schedule installments for everything still owed to receivers, e.g. after recovering the ledger from disk.
+
+        Returns:
+            List[ScheduledPayout]: Handles of the scheduled installments.
+        """
+        with self._lock:
+            owed = list(self.storage.owed().items())
+        payouts = []
+        for receiver, amt in owed:
+            payouts.extend(self._transfer_discrete(receiver, amt))
+        return payouts
 
-        # Random sleep time between 0 to 2.5 seconds
-        random_sleep_times = [random.uniform(0, 2.5) for _ in range(num_addresses_receiver-1)]
-        self._transfer_amount(self._house_address, receiver, Decimal(n_random_proportions[0] * amt), is_minted=False)
+    def snapshot_state(self) -> Dict:
+        """
+        Compact, JSON-serializable copy of the ledger, see InMemoryStorage.snapshot_state().
+        Caller must hold the lock for a consistent copy.
+
+        Returns:
+            Dict: Ledger state, see restore_state().
+        """
+        return self.storage.snapshot_state()
+
+    def restore_state(self, state: Dict) -> None:
+        """
+        Replace the ledger with a copy taken by snapshot_state().
+
+        Args:
+            state (Dict): Ledger state.
+        """
+        with self._lock:
+            self.storage.restore_state(state)
+
+    def close(self, drain: bool = True) -> None:
+        """
+        Stop the payout scheduler, flush the journal, if any, and close the storage.
+
+        Args:
+            drain (bool, optional): Pay out scheduled installments first. Defaults to True.
+        """
+        self.scheduler.shutdown(drain)
+        if self.journal is not None:
+            self.journal.close()
+        self.storage.close()
+
+    def pending_payouts(self) -> List[ScheduledPayout]:
+        """
+        Installments that have been scheduled but not paid out yet.
+
+        Returns:
+            List[ScheduledPayout]: Pending installments in due order.
+        """
+        return self.scheduler.pending()
+
+    def completed_payouts(self) -> List[ScheduledPayout]:
+        """
+        Most recently paid out installments.
 
-        for i in range(1, len(n_random_proportions)):
-            time.sleep(random_sleep_times[i-1])
-            self._transfer_amount(self._house_address, receiver, Decimal(n_random_proportions[i] * amt), is_minted=False)
+        Returns:
+            List[ScheduledPayout]: Completed installments, oldest first.
+        """
+        return self.scheduler.completed()
+
+    def wait_for_payouts(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until all scheduled installments have been paid out.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if no installments are pending anymore.
+        """
+        return self.scheduler.drain(timeout)
 
 
     def contains_key(self, address: str) -> bool:
@@ -162,7 +587,7 @@ class Mixer:
         Returns:
             bool: True if exists. False otherwise.
         """        
-        return address in self.deposit_addresses_to_wallet
+        return self.storage.has_wallet(address)
 
     def get_transactions(self, address: str) -> str:
         """
@@ -175,14 +600,87 @@ class Mixer:
         Returns:
             str: A balance and list of transactions associated with address as JSON string. If address is None, get all transactions from mixer.
         """            
-        if address == None:
-            return str([xact.return_transaction() for xact in self.transaction_queue])
-
-        elif address not in self.deposit_addresses_to_wallet:
+        if address is not None and not self.storage.has_wallet(address):
             return str([])
-        
-        else:
-            return self.deposit_addresses_to_wallet[address].get_transaction_history()
+
+        history = [str(transaction_dict(*record)) for _, record in self.storage.scan_transactions(address, 0, None, None)]
+        if address is None:
+            return str(history)
+        # Same summary as Wallet.get_transaction_history
+        return "balance: {}, {}".format(format_amount(self.storage.balance(address)), history)
+
+    def iter_transactions(self, address: Optional[str] = None, cursor: int = 0,
+                          since: Union[datetime, str, int, None] = None, until: Union[datetime, str, int, None] = None) -> Iterator[Dict[str, str]]:
+        """
+        Lazily yields structured records of the transactions associated with address, oldest first.
+        If address is None, yield all transactions in BitcoinZ Mixer.
+        Transactions committed while iterating are not included.
+
+        Args:
+            address (str, optional): Deposit address associated with a wallet. Defaults to None.
+            cursor (int, optional): Position to resume from, as returned in TransactionPage.next_cursor. Defaults to 0.
+            since (datetime, str or int, optional): Only yield transactions at or after this UTC time. Defaults to None.
+            until (datetime, str or int, optional): Only yield transactions before this UTC time. Defaults to None.
+
+        Returns:
+            Iterator[Dict[str, str]]: Records with timestamp, fromAddress, toAddress and amount.
+        """
+        for _, record in self._scan_transactions(address, cursor, since, until):
+            yield transaction_dict(*record)
+
+    def query_transactions(self, address: Optional[str] = None, cursor: int = 0, limit: int = 100,
+                           since: Union[datetime, str, int, None] = None, until: Union[datetime, str, int, None] = None) -> TransactionPage:
+        """
+        Returns one page of structured records of the transactions associated with address, oldest first.
+        If address is None, page through all transactions in BitcoinZ Mixer.
+
+        Args:
+            address (str, optional): Deposit address associated with a wallet. Defaults to None.
+            cursor (int, optional): Position to start from, 0 or the next_cursor of the previous page. Defaults to 0.
+            limit (int, optional): Maximum number of records in the page. Defaults to 100.
+            since (datetime, str or int, optional): Only include transactions at or after this UTC time. Defaults to None.
+            until (datetime, str or int, optional): Only include transactions before this UTC time. Defaults to None.
+
+        Returns:
+            TransactionPage: Records of the page and the cursor of the next page.
+        """
+        records = []
+        for position, record in self._scan_transactions(address, cursor, since, until):
+            if len(records) == limit:
+                return TransactionPage(records, position)
+            records.append(transaction_dict(*record))
+        return TransactionPage(records, None)
+
+    def dump_transactions(self, fp: IO[str], address: Optional[str] = None,
+                          since: Union[datetime, str, int, None] = None, until: Union[datetime, str, int, None] = None) -> int:
+        """
+        Streams the transactions associated with address to fp as JSON lines, one record per line.
+        If address is None, dump all transactions in BitcoinZ Mixer.
+
+        Args:
+            fp (IO[str]): Writable text stream.
+            address (str, optional): Deposit address associated with a wallet. Defaults to None.
+            since (datetime, str or int, optional): Only dump transactions at or after this UTC time. Defaults to None.
+            until (datetime, str or int, optional): Only dump transactions before this UTC time. Defaults to None.
+
+        Returns:
+            int: Number of records written.
+        """
+        written = 0
+        for record in self.iter_transactions(address, since=since, until=until):
+            fp.write(json.dumps(record))
+            fp.write("\n")
+            written += 1
+        return written
+
+    def _scan_transactions(self, address: Optional[str], cursor: int,
+                           since: Union[datetime, str, int, None], until: Union[datetime, str, int, None]) -> Iterator[Tuple[int, TransactionRecord]]:
+        """
+        Yields (cursor, record) pairs of the transactions of address within the time range, starting at cursor.
+        """
+        since_ns = parse_timestamp(since) if since is not None else None
+        until_ns = parse_timestamp(until) if until is not None else None
+        return self.storage.scan_transactions(address, cursor, since_ns, until_ns)
 
     def get_fees_collected(self) -> Decimal:
         """
@@ -191,26 +689,84 @@ class Mixer:
         Returns:
             Decimal: Fees collected from all transactions so far.
         """        
-        return Decimal(self.fees_collected)
+        return to_decimal(self.fees_collected)
 
 
 class APIBasedMixer:
     API_ENV_URL = "http://bitcoinz.gemini.com/iodine-defrost"
+    MAX_INSTALLMENT_DELAY = Mixer.MAX_INSTALLMENT_DELAY
 
     """
     A class that simulates the BitcoinZ Mixer.
     """
-    def __init__(self, fee_percentage: Decimal = Decimal(0.02)):
+    def __init__(self, fee_percentage: Decimal = Decimal("0.02"), scheduler: Optional[PayoutScheduler] = None,
+                 client: Optional[JobcoinClient] = None, rng: Optional[random.Random] = None,
+                 metrics: Optional[MetricsRegistry] = None, cache: Optional[ReadThroughCache] = None,
+                 mirror: Optional[TransactionMirror] = None, events: Optional[EventBus] = None,
+                 outbox: Optional[PayoutOutbox] = None, throttles: Optional[Dict[str, Throttle]] = None,
+                 splitter: Optional[InstallmentSplitter] = None, round_window: Optional[float] = None):
         """
         Initialize the mixer with a fee percentage
 
         Args:
             fee_percentage (Decimal, optional): Percentage fee to charge per transaction. Defaults to 0.02.
+            scheduler (PayoutScheduler, optional): Scheduler executing delayed installments. Defaults to a background PayoutScheduler.
+            client (JobcoinClient, optional): Pooled API client. Defaults to a client for API_ENV_URL recording its calls in metrics.
+            rng (random.Random, optional): Source of installment splits and delays. Defaults to an unseeded Random.
+            metrics (MetricsRegistry, optional): Registry to record sends, fees and latencies in. Defaults to recording nothing.
+            cache (ReadThroughCache, optional): Cache of get_transactions lookups, keyed by address (None for all transactions).
+                Defaults to fresh for 1 second and served stale while reloading for 10 more.
+            mirror (TransactionMirror, optional): Answer lookups from this local mirror, synced incrementally on a miss,
+                instead of fetching them from the API. Defaults to None.
+            events (EventBus, optional): Bus to publish deposits, installments, completed transactions and fees on. Defaults to a new one.
+            outbox (PayoutOutbox, optional): Durably queue installments in this outbox, which retries them until delivered,
+                instead of on the scheduler. Defaults to None.
+            throttles (Dict[str, Throttle], optional): Rate caps and adaptive concurrency limits per endpoint of the default client,
+                see JobcoinClient. Defaults to none.
+            splitter (InstallmentSplitter, optional): Splits payouts into installments. Defaults to uniform weights drawn from rng.
+            round_window (float, optional): Post installments in PayoutRounds this many seconds apart, coalesced per receiver,
+                instead of one by one. Defaults to None.
         """                
+        metrics = metrics if metrics is not None else NULL_METRICS
+        self.events = events if events is not None else EventBus()
+        self.outbox = outbox
+        # Progress per transaction whose installments are queued in the outbox, by batch; for a payout round,
+        # the progress of the installments coalesced into each of its transfers, by private address
+        self._outbox_progress: Dict[str, Union[_PayoutProgress, Dict[str, List[_PayoutProgress]]]] = {}
+        if outbox is not None:
+            outbox.listener = self._outbox_delivered
+        self.scheduler = scheduler if scheduler is not None else PayoutScheduler()
+        self.rng = rng if rng is not None else random.Random()
+        self.splitter = splitter if splitter is not None else InstallmentSplitter(rng=self.rng)
+        self.client = client if client is not None else JobcoinClient(APIBasedMixer.API_ENV_URL, metrics=metrics, throttles=throttles)
         self.deposit_addresses = set()
+        # Private addresses coins sent to a deposit address are paid out to, see mix_deposit(), and the
+        # deposit address per private address
+        self.private_addresses: Dict[str, List[str]] = {}
+        self.owners: Dict[str, str] = {}
         self._house_address = "house_" + uuid.uuid4().hex
         self.fee_percentage = Decimal(fee_percentage)
-        self.fees_collected = Decimal(0)
+        self._fee_ratio = fee_ratio(self.fee_percentage)
+        # Fees are held in integer base units, see project.bitcoinz.amount
+        self.fees_collected = 0
+        # Only successful responses are cached; lookups stay fresh because every transfer posted by the mixer invalidates its addresses
+        self.cache = cache if cache is not None else ReadThroughCache(cacheable=_is_ok_response, metrics=metrics)
+        self.mirror = mirror
+        self._init_metrics(metrics)
+        self.rounds = None
+        if round_window is not None:
+            self.rounds = PayoutRounds(self.scheduler, self._pay_round, round_window, self.rng, metrics)
+
+    def _init_metrics(self, metrics: MetricsRegistry) -> None:
+        self.metrics = metrics
+        self._sends_counter = metrics.counter("bitcoinz_sends_total", "Transactions executed by the mixer, minted ones included.")
+        self._mints_counter = metrics.counter("bitcoinz_mints_total", "Transactions of minted coins executed by the mixer.")
+        self._fees_counter = metrics.counter("bitcoinz_fees_collected_units_total", "Fees collected, in base units.")
+        self._execute_histogram = metrics.histogram("bitcoinz_execute_transaction_seconds",
+                                                    "Latency of posting a transaction to the house address and scheduling its installments.")
+        self._installment_histogram = metrics.histogram("bitcoinz_installment_seconds", "Latency of posting one installment.")
+        metrics.gauge("bitcoinz_payout_queue_depth", "Installments scheduled but not posted yet.").set_function(self.scheduler.num_pending)
+        metrics.gauge("bitcoinz_wallets", "Deposit addresses handed out by the mixer.").set_function(self.deposit_addresses.__len__)
     
     def get_deposit_address(self, private_addresses: List[str]) -> str:
         """
@@ -219,16 +775,62 @@ class APIBasedMixer:
         Args:
             deposit_addresses (List[str]): A list of private addresses.
 
+        Raises:
+            ValueError: If a private address is repeated or already registered with another deposit address.
+
         Returns:
             str: A unique deposit address associated with user's wallet
         """        
+        if len(set(private_addresses)) != len(private_addresses):
+            raise ValueError("Private addresses must be unique: {}".format(", ".join(private_addresses)))
+        for address in private_addresses:
+            if address in self.owners:
+                raise ValueError("Private address {} is already registered".format(address))
+
         new_address = uuid.uuid4().hex
 
         while new_address in self.deposit_addresses:
             new_address = uuid.uuid4().hex
         
+        self.private_addresses[new_address] = list(private_addresses)
+        for address in private_addresses:
+            self.owners[address] = new_address
         self.deposit_addresses.add(new_address)
         return new_address
+
+    @property
+    def house_address(self) -> str:
+        return self._house_address
+
+    def mix_deposit(self, deposit_address: str, amount: int) -> List[ScheduledPayout]:
+        """
+        Mix coins that arrived at a deposit address from outside the mixer, e.g. as found by a DepositWatcher:
+        move them into the house account and pay them out, less the fee, in installments to the wallet's
+        private addresses.
+
+        Args:
+            deposit_address (str): Deposit address the coins arrived at.
+            amount (int): Amount that arrived in base units.
+
+        Raises:
+            InsufficientBalanceException: If the API rejects the transfer to the house address.
+
+        Returns:
+            List[ScheduledPayout]: Handles of the scheduled installments, or their idempotency keys with an outbox.
+        """
+        with self._execute_histogram.time():
+            fee = apply_fee(amount, self._fee_ratio)
+            response = self._transfer_amount(deposit_address, self._house_address, format_amount(amount), False)
+            if response.status_code != requests.codes.ok:
+                raise InsufficientBalanceException
+
+            self.fees_collected += fee
+            progress = None
+            if self.events.active:
+                progress = _publish_received(self.events, None, deposit_address, amount, fee, False)
+            payouts = self._schedule_installments(self._plan_legs(deposit_address, amount - fee), progress)
+        self._record_send(fee, False)
+        return payouts
     
     def execute_transaction(self, sender: str, receiver: str, amount: str, is_minted: bool) -> Optional[str]:
         """
@@ -238,16 +840,28 @@ class APIBasedMixer:
             transaction (Transaction): A valid transaction initiated.
             is_minted (bool, optional): Whether the transaction involvde the coins minted i.e. no sender. Defaults to False.
         """        
-        fee = Decimal(amount) * self.fee_percentage
-        amount_after_fee = Decimal(amount) - fee
+        with self._execute_histogram.time():
+            units = parse_amount(amount)
+            fee = apply_fee(units, self._fee_ratio)
+            amount_after_fee = units - fee
 
-        # We also charge the fee for minted transactions
-        response = self._transfer_amount(sender, self._house_address, amount, is_minted)
-        if response.status_code != requests.codes.ok:
-            raise InsufficientBalanceException
+            # We also charge the fee for minted transactions
+            response = self._transfer_amount(sender, self._house_address, format_amount(units), is_minted)
+            if response.status_code != requests.codes.ok:
+                raise InsufficientBalanceException
 
-        self._transfer_discrete(receiver, amount_after_fee)
-        self.fees_collected += fee
+            progress = None
+            if self.events.active:
+                progress = _publish_received(self.events, sender, receiver, units, fee, is_minted)
+            self._transfer_discrete(receiver, amount_after_fee, progress)
+            self.fees_collected += fee
+        self._record_send(fee, is_minted)
+
+    def _record_send(self, fee: int, is_minted: bool) -> None:
+        self._sends_counter.inc()
+        if is_minted:
+            self._mints_counter.inc()
+        self._fees_counter.inc(fee)
 
     def _transfer_amount(self, sender: str, receiver: str, amt: str, is_minted: bool):
         """
@@ -260,52 +874,197 @@ class APIBasedMixer:
             amt (str): Amount.
             is_minted (bool): If coins were minted from network.
         """   
-        if is_minted:
-            # Run /create call to receiver, sender doesn't matter
-            payload = {"address": receiver}
-            r = requests.post("{}/create".format(APIBasedMixer.API_ENV_URL), data=payload)
-        else:
+        try:
+            if is_minted:
+                # Run /create call to receiver, sender doesn't matter
+                return self.client.create(receiver)
             # Run /post call
-            payload = {"fromAddress": sender, "toAddress": receiver, "amount": amt}
-            r = requests.post("{}/api/transactions".format(APIBasedMixer.API_ENV_URL), data=payload)
+            return self.client.post_transaction(sender, receiver, amt)
+        finally:
+            self._invalidate(None if is_minted else sender, receiver)
 
-        return r
+    def _invalidate(self, sender: Optional[str], receiver: str) -> None:
+        """
+        Drop cached lookups a transfer changed: of sender and receiver, and of all transactions.
+        """
+        if sender is not None:
+            self.cache.invalidate(sender)
+        self.cache.invalidate(receiver)
+        self.cache.invalidate(None)
 
 
-    def _get_n_random_proportions(self, n) -> List[Decimal]:
+    def _transfer_discrete(self, receiver: str, amt: int, progress: Optional[_PayoutProgress] = None) -> List[ScheduledPayout]:
         """
-        List of n random Decimals that sum exactly to 1.0.
+        Schedules transfers of amount from house_address to the private addresses of receiver in random discrete amounts,
+        intervals. Returns right away; installments are posted by the scheduler.
 
         Args:
-            n ([type]): Length of list to be returned
+            receiver (str): Receiver's deposit address.
+            amt (int): Amount in base units to be transferred.
+            progress (_PayoutProgress, optional): Progress of the transaction, to publish its completion. Defaults to None.
 
         Returns:
-            List[Decimal]: A list of Decimals that sum to 1.0, e.g. [0.2, 0.65, 0.15]
+            List[ScheduledPayout]: Handles of the scheduled installments, or their idempotency keys with an outbox.
+        """        
+        return self._schedule_installments(self._plan_legs(receiver, amt), progress)
+
+    def _plan_legs(self, deposit_address: str, amt: int) -> List[Tuple[float, str, str]]:
         """
-        random_props = [Decimal(random.random()) for _ in range(n-1)]
-        random_sum = sum(random_props)
-        random_props = [Decimal(round((random_props[i]/random_sum), 2)) for i in range(len(random_props))]
-        random_props.append(Decimal(1.0) - Decimal(sum(random_props)))
-        return random_props
-    
-    def _transfer_discrete(self, receiver: str, amt: Decimal) -> None:
+        Plans the installments of an amount owed to a deposit address: one per private address of its wallet, in random
+        order, or a single one to the deposit address itself if it has none.
+
+        Returns:
+            List[Tuple[float, str, str]]: (delay in seconds, private address, amount as string) per installment, in payout order.
+        """
+        destinations = self.private_addresses.get(deposit_address) or [deposit_address]
+        plan = self._plan_installments(amt, len(destinations))
+        return [(delay, destination, installment)
+                for (delay, installment), destination in zip(plan, self.rng.sample(destinations, len(plan)))]
+
+    def _schedule_installments(self, legs: List[Tuple[float, str, str]], progress: Optional[_PayoutProgress]) -> List:
         """
-        Transfers amount from house_address to receiver in random discrete amounts, intervals.
+        Schedule (delay, receiver, amount) installments of one transaction on the scheduler, or durably in the outbox.
+        """
+        if progress is not None:
+            progress.remaining = len(legs)
+        if self.rounds is not None:
+            self.rounds.submit_many([(delay, receiver, parse_amount(installment), progress) for delay, receiver, installment in legs])
+            return []
+        if self.outbox is not None:
+            batch = uuid.uuid4().hex
+            if progress is not None:
+                # Registered first, as the outbox may deliver before enqueue() returns
+                self._outbox_progress[batch] = progress
+            return self.outbox.enqueue([(delay, self._house_address, receiver, installment) for delay, receiver, installment in legs], batch)
+        return [self.scheduler.schedule(delay, self._pay_installment, receiver, installment, progress)
+                for delay, receiver, installment in legs]
+
+    def _outbox_delivered(self, entry: OutboxEntry) -> None:
+        """
+        Called by the outbox for every installment it delivered.
+        """
+        self._invalidate(entry.from_address, entry.to_address)
+        if self.events.active:
+            self.events.publish(INSTALLMENT_PAID, address=entry.to_address, amount=parse_amount(entry.amount))
+        progress = self._outbox_progress.get(entry.batch)
+        if isinstance(progress, dict):
+            parts = progress.pop(entry.to_address, None)
+            if not progress:
+                self._outbox_progress.pop(entry.batch, None)
+            _publish_paid(self.events, parts)
+        elif progress is not None and progress.paid():
+            del self._outbox_progress[entry.batch]
+            self.events.publish(TRANSACTION_COMPLETED, **progress.details)
+
+    def _pay_round(self, transfers: List[RoundTransfer]) -> None:
+        """
+        Posts the transfers of a payout round from house_address, or queues them in the outbox as one batch. Run by the scheduler.
 
         Args:
-            receiver (str): Receiver's deposit address.
-            amt (Decimal): Amount to be transferred.
-        """        
-        num_batches = random.randint(2, 6)
-        n_random_proportions = self._get_n_random_proportions(num_batches)
+            transfers (List[RoundTransfer]): Installments coalesced per private address, parts holding their progress.
+        """
+        if self.outbox is not None:
+            batch = uuid.uuid4().hex
+            # Registered first, as the outbox may deliver before enqueue() returns
+            self._outbox_progress[batch] = {transfer.receiver: transfer.parts for transfer in transfers}
+            self.outbox.enqueue([(0.0, self._house_address, transfer.receiver, format_amount(transfer.amount))
+                                 for transfer in transfers], batch)
+            return
+        for transfer in transfers:
+            self._pay_installment(transfer.receiver, format_amount(transfer.amount), transfer.parts)
+
+    def _pay_installment(self, receiver: str, amt: str, progress: Optional[_PayoutProgress] = None):
+        """
+        Posts a single installment from house_address to receiver. Run by the scheduler.
+        While the client's circuit breaker is open, a background scheduler queues the installment again for when it lets calls through.
+
+        Args:
+            receiver (str): Private address of the receiving wallet.
+            amt (str): Amount of the installment.
+            progress (_PayoutProgress, optional): Progress of the transaction, to publish its completion. Defaults to None.
+
+        Returns:
+            requests.Response: Response of the transfer, None if it was queued again.
+        """
+        try:
+            with self._installment_histogram.time():
+                response = self._transfer_amount(self._house_address, receiver, amt, False)
+        except CircuitOpenException as e:
+            # Without a background worker, drain() would retry it right away, over and over
+            if not self.scheduler.background:
+                raise
+            logger.debug("installment_deferred receiver=%s amount=%s retry_after=%s", receiver, amt, e.retry_after)
+            self.scheduler.schedule(e.retry_after, self._pay_installment, receiver, amt, progress)
+            return None
+        self._installment_posted(receiver, amt, response, progress)
+        return response
+
+    def _installment_posted(self, receiver: str, amt: str, response, progress: Optional[_PayoutProgress]) -> None:
+        """
+        Publish INSTALLMENT_PAID for an installment the API accepted, and TRANSACTION_COMPLETED after the last one.
+        """
+        if response.status_code != requests.codes.ok:
+            return
+        if self.events.active:
+            self.events.publish(INSTALLMENT_PAID, address=receiver, amount=parse_amount(amt))
+        _publish_paid(self.events, progress)
 
-        # Random sleep time between 0 to 2.5 seconds
-        random_sleep_times = [random.uniform(0, 2.5) for _ in range(num_batches-1)]
-        self._transfer_amount(self._house_address, receiver, str(Decimal(n_random_proportions[0] * amt)), is_minted=False)
+    def _plan_installments(self, amt: int, num_batches: int) -> List[Tuple[float, str]]:
+        """
+        Splits amount into installments, each with a random delay from now.
 
-        for i in range(1, len(n_random_proportions)):
-            time.sleep(random_sleep_times[i-1])
-            self._transfer_amount(self._house_address, receiver, str(Decimal(n_random_proportions[i] * amt)), is_minted=False)
+        Args:
+            amt (int): Amount in base units to be transferred.
+            num_batches (int): Number of installments wanted, see InstallmentSplitter.split().
+
+        Returns:
+            List[Tuple[float, str]]: (delay in seconds, amount as string) per installment, in payout order.
+        """
+        installments = self.splitter.split(amt, num_batches)
+
+        # Random delay between installments of 0 to 2.5 seconds
+        random_delays = [self.rng.uniform(0, self.MAX_INSTALLMENT_DELAY) for _ in range(len(installments)-1)]
+        delay = 0.0
+        plan = [(delay, format_amount(installments[0]))]
+
+        for i in range(1, len(installments)):
+            delay += random_delays[i-1]
+            plan.append((delay, format_amount(installments[i])))
+        return plan
+
+    def pending_payouts(self) -> List[ScheduledPayout]:
+        """
+        Installments that have been scheduled but not posted yet.
+
+        Returns:
+            List[ScheduledPayout]: Pending installments in due order.
+        """
+        return self.scheduler.pending()
+
+    def completed_payouts(self) -> List[ScheduledPayout]:
+        """
+        Most recently posted installments.
+
+        Returns:
+            List[ScheduledPayout]: Completed installments, oldest first.
+        """
+        return self.scheduler.completed()
+
+    def wait_for_payouts(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until all scheduled installments have been posted, or failed for good if they are in the outbox.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if no installments are pending anymore.
+        """
+        # Payout rounds run on the scheduler and queue their transfers in the outbox
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self.scheduler.drain(timeout):
+            return False
+        return self.outbox is None or self.outbox.drain(None if deadline is None else max(0.0, deadline - time.monotonic()))
 
 
     def get_transactions(self, address: str) -> str:
@@ -319,12 +1078,20 @@ class APIBasedMixer:
         Returns:
             str: A balance and list of transactions associated with address as JSON string. If address is None, get all transactions from mixer.
         """            
-        if address == None:
-            r = requests.get("{}/api/transactions".format(APIBasedMixer.API_ENV_URL))
-        else:
-            r = requests.get("{}/api/addresses/{}".format(APIBasedMixer.API_ENV_URL, address))
+        return self._lookup(address)[1]
 
-        return r.json()
+    def _lookup(self, address: Optional[str]) -> Tuple[int, object]:
+        """
+        (status code, parsed JSON) of the lookup of address, or of all transactions if address is None, through the cache.
+        Lookups shared by concurrent callers and cached ones are the same objects, so they must not be modified.
+        """
+        def load():
+            if self.mirror is not None:
+                self.mirror.sync()
+                return requests.codes.ok, self.mirror.lookup(address)
+            r = self.client.get_transactions() if address is None else self.client.get_address(address)
+            return r.status_code, r.json()
+        return self.cache.get(address, load)
 
     def get_fees_collected(self) -> Decimal:
         """
@@ -333,4 +1100,197 @@ class APIBasedMixer:
         Returns:
             Decimal: Fees collected from all transactions so far.
         """        
-        return self.fees_collected
\ No newline at end of file
+        return to_decimal(self.fees_collected)
+
+
+class AsyncAPIBasedMixer(APIBasedMixer):
+    """
+    asyncio-native variant of APIBasedMixer. send/get_transactions are awaitable, and installments run as
+    concurrent tasks on the event loop so the payouts of many transactions overlap.
+    """
+    def __init__(self, fee_percentage: Decimal = Decimal("0.02"), client: Optional[AsyncJobcoinClient] = None,
+                 max_concurrency_per_host: int = 8, metrics: Optional[MetricsRegistry] = None,
+                 events: Optional[EventBus] = None, splitter: Optional[InstallmentSplitter] = None):
+        """
+        Initialize the mixer with a fee percentage
+
+        Args:
+            fee_percentage (Decimal, optional): Percentage fee to charge per transaction. Defaults to 0.02.
+            client (AsyncJobcoinClient, optional): Awaitable pooled API client. Defaults to a client for API_ENV_URL recording its calls in metrics.
+            max_concurrency_per_host (int, optional): Concurrent requests per host for the default client. Defaults to 8.
+            metrics (MetricsRegistry, optional): Registry to record sends, fees and latencies in. Defaults to recording nothing.
+            events (EventBus, optional): Bus to publish deposits, installments, completed transactions and fees on. Defaults to a new one.
+            splitter (InstallmentSplitter, optional): Splits payouts into installments. Defaults to uniform weights.
+        """
+        if client is None:
+            client = AsyncJobcoinClient(APIBasedMixer.API_ENV_URL, max_concurrency_per_host,
+                                        client=JobcoinClient(APIBasedMixer.API_ENV_URL, pool_size=max_concurrency_per_host, metrics=metrics))
+        self.async_client = client
+        self._payout_tasks: Set[asyncio.Future] = set()
+        self._completed_tasks = deque(maxlen=1000)
+        super().__init__(fee_percentage, scheduler=PayoutScheduler(background=False), client=self.async_client.client, metrics=metrics,
+                         events=events, splitter=splitter)
+
+    def _init_metrics(self, metrics: MetricsRegistry) -> None:
+        super()._init_metrics(metrics)
+        # Installments run as tasks on the event loop rather than on the scheduler
+        metrics.gauge("bitcoinz_payout_queue_depth", "Installments scheduled but not posted yet.").set_function(self._payout_tasks.__len__)
+
+    async def execute_transaction(self, sender: str, receiver: str, amount: str, is_minted: bool) -> None:
+        """
+        Execute a transaction through the BitcoinZ Mixer. Returns once the fee leg has been posted;
+        installments are posted by background tasks.
+
+        Args:
+            sender (str): Sender's address. Could be '(new)' if is_minted.
+            receiver (str): Receiver's deposit address.
+            amount (str): Amount to be sent.
+            is_minted (bool): Whether the transaction involves minted coins i.e. no sender.
+
+        Raises:
+            InsufficientBalanceException: If the API rejects the transfer to the house address.
+        """
+        with self._execute_histogram.time():
+            units = parse_amount(amount)
+            fee = apply_fee(units, self._fee_ratio)
+            amount_after_fee = units - fee
+
+            # We also charge the fee for minted transactions
+            response = await self._transfer_amount(sender, self._house_address, format_amount(units), is_minted)
+            if response.status_code != requests.codes.ok:
+                raise InsufficientBalanceException
+
+            progress = None
+            if self.events.active:
+                progress = _publish_received(self.events, sender, receiver, units, fee, is_minted)
+            self._transfer_discrete(receiver, amount_after_fee, progress)
+            self.fees_collected += fee
+        self._record_send(fee, is_minted)
+
+    async def mix_deposit(self, deposit_address: str, amount: int) -> List[asyncio.Future]:
+        """
+        Mix coins that arrived at a deposit address from outside the mixer: move them into the house account
+        and pay them out, less the fee, by background tasks posting installments to the wallet's private addresses.
+
+        Args:
+            deposit_address (str): Deposit address the coins arrived at.
+            amount (int): Amount that arrived in base units.
+
+        Raises:
+            InsufficientBalanceException: If the API rejects the transfer to the house address.
+
+        Returns:
+            List[asyncio.Future]: Tasks posting the installments.
+        """
+        with self._execute_histogram.time():
+            fee = apply_fee(amount, self._fee_ratio)
+            response = await self._transfer_amount(deposit_address, self._house_address, format_amount(amount), False)
+            if response.status_code != requests.codes.ok:
+                raise InsufficientBalanceException
+
+            self.fees_collected += fee
+            progress = None
+            if self.events.active:
+                progress = _publish_received(self.events, None, deposit_address, amount, fee, False)
+            payouts = self._transfer_discrete(deposit_address, amount - fee, progress)
+        self._record_send(fee, False)
+        return payouts
+
+    async def _transfer_amount(self, sender: str, receiver: str, amt: str, is_minted: bool):
+        """
+        Transfers an amount from sender to receiver directly. Sender could be house_address.
+        If is_minted, receiver receives balance from network.
+
+        Args:
+            sender (str): Sender's deposit address. Could be '(new)' if is_minted.
+            receiver (str): Receiver's deposit address.
+            amt (str): Amount.
+            is_minted (bool): If coins were minted from network.
+        """
+        try:
+            if is_minted:
+                return await self.async_client.create(receiver)
+            return await self.async_client.post_transaction(sender, receiver, amt)
+        finally:
+            self._invalidate(None if is_minted else sender, receiver)
+
+    def _transfer_discrete(self, receiver: str, amt: int, progress: Optional[_PayoutProgress] = None) -> List[asyncio.Future]:
+        """
+        Starts one task per installment from house_address to a private address of receiver, each waiting for its random delay.
+
+        Args:
+            receiver (str): Receiver's deposit address.
+            amt (int): Amount in base units to be transferred.
+            progress (_PayoutProgress, optional): Progress of the transaction, to publish its completion. Defaults to None.
+
+        Returns:
+            List[asyncio.Future]: Tasks posting the installments.
+        """
+        tasks = []
+        legs = self._plan_legs(receiver, amt)
+        if progress is not None:
+            progress.remaining = len(legs)
+        for delay, destination, installment in legs:
+            task = asyncio.ensure_future(self._post_installment(delay, destination, installment, progress))
+            self._payout_tasks.add(task)
+            task.add_done_callback(self._on_payout_done)
+            tasks.append(task)
+        return tasks
+
+    async def _post_installment(self, delay: float, receiver: str, amt: str, progress: Optional[_PayoutProgress] = None):
+        await asyncio.sleep(delay)
+        with self._installment_histogram.time():
+            response = await self._transfer_amount(self._house_address, receiver, amt, False)
+        self._installment_posted(receiver, amt, response, progress)
+        return response
+
+    def _on_payout_done(self, task: asyncio.Future) -> None:
+        self._payout_tasks.discard(task)
+        self._completed_tasks.append(task)
+
+    def pending_payouts(self) -> List[asyncio.Future]:
+        """
+        Installment tasks that have not finished yet.
+
+        Returns:
+            List[asyncio.Future]: Pending installment tasks.
+        """
+        return list(self._payout_tasks)
+
+    def completed_payouts(self) -> List[asyncio.Future]:
+        """
+        Most recently finished installment tasks.
+
+        Returns:
+            List[asyncio.Future]: Finished installment tasks, oldest first.
+        """
+        return list(self._completed_tasks)
+
+    async def wait_for_payouts(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all installment tasks have finished.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if no installments are pending anymore.
+        """
+        if self._payout_tasks:
+            await asyncio.wait(list(self._payout_tasks), timeout=timeout)
+        return not self._payout_tasks
+
+    async def get_transactions(self, address: str):
+        """
+        Returns the balance and transactions of address, or all transactions on the network if address is None.
+
+        Args:
+            address ([type], optional): Deposit address associated with a wallet. Could be None.
+
+        Returns:
+            Parsed JSON response of the API.
+        """
+        # A miss blocks on the shared load, so the lookup runs on a worker thread
+        loop = asyncio.get_event_loop()
+        status, payload = await loop.run_in_executor(None, self._lookup, address)
+        return payload
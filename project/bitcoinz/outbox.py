@@ -0,0 +1,318 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Set, Tuple
+
+import requests
+
+from project.bitcoinz.exceptions import CircuitOpenException
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import NULL_METRICS, MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DELIVERED = "delivered"
+FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    batch TEXT NOT NULL,
+    from_address TEXT NOT NULL,
+    to_address TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    not_before REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, not_before);
+"""
+
+_COLUMNS = "id, idempotency_key, batch, from_address, to_address, amount, not_before, attempts, status, last_error"
+
+
+class OutboxEntry:
+    """
+    A planned transfer in a PayoutOutbox.
+    """
+    __slots__ = ("id", "key", "batch", "from_address", "to_address", "amount", "not_before", "attempts", "status", "last_error")
+
+    def __init__(self, id: int, key: str, batch: str, from_address: str, to_address: str, amount: str,
+                 not_before: float, attempts: int, status: str, last_error: Optional[str]):
+        self.id = id
+        self.key = key
+        self.batch = batch
+        self.from_address = from_address
+        self.to_address = to_address
+        self.amount = amount
+        self.not_before = not_before
+        self.attempts = attempts
+        self.status = status
+        self.last_error = last_error
+
+    def __repr__(self) -> str:
+        return "OutboxEntry({!r}, {} -> {}, {}, {})".format(self.key, self.from_address, self.to_address, self.amount, self.status)
+
+
+class PayoutOutbox:
+    """
+    Durable queue of the installments the API path still has to post, in a SQLite database.
+
+    The installments of a transaction are written in one database transaction before the mixer returns,
+    each with its due time and an idempotency key. Delivery posts them with the key as Idempotency-Key
+    header, so an installment whose response was lost can be retried without paying it twice. Failures
+    that may be transient (connection errors, 429, 5xx) are retried with exponential backoff and full
+    jitter; other rejections and installments out of attempts are marked failed and kept for inspection.
+    While the client's circuit breaker is open, installments wait for it without using up attempts.
+    Whatever was not delivered when the process stopped is delivered after the database is opened again.
+
+    Up to max_in_flight installments are posted concurrently. With background=True a dispatcher thread
+    delivers installments as they become due; otherwise only run_pending() and drain() deliver them.
+    """
+    def __init__(self, path: str, client: JobcoinClient, max_in_flight: int = 8, max_attempts: int = 10,
+                 base_delay: float = 0.1, max_delay: float = 30.0, background: bool = True,
+                 clock: Callable[[], float] = time.time, rng: Optional[random.Random] = None,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Open (and create if needed) an outbox database.
+
+        Args:
+            path (str): Database file path.
+            client (JobcoinClient): Client posting the installments.
+            max_in_flight (int, optional): Installments posted concurrently at most. Defaults to 8.
+            max_attempts (int, optional): Attempts before an installment is marked failed. Defaults to 10.
+            base_delay (float, optional): Longest backoff in seconds after the first failed attempt; doubles with every further one. Defaults to 0.1.
+            max_delay (float, optional): Cap of the backoff in seconds. Defaults to 30.
+            background (bool, optional): Deliver due installments on a dispatcher thread. Defaults to True.
+            clock (Callable[[], float], optional): Wall clock returning seconds, as due times survive restarts. Defaults to time.time.
+            rng (random.Random, optional): Source of the backoff jitter. Defaults to an unseeded Random.
+            metrics (MetricsRegistry, optional): Registry to record delivery attempts and the backlog in. Defaults to recording nothing.
+        """
+        self.path = path
+        self.client = client
+        self.max_in_flight = max_in_flight
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.background = background
+        self.clock = clock
+        self.rng = rng if rng is not None else random.Random()
+        # Called with every delivered entry, e.g. by APIBasedMixer to publish events
+        self.listener: Optional[Callable[[OutboxEntry], None]] = None
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._cond = threading.Condition(threading.RLock())
+        self._in_flight: Set[int] = set()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        self._stopped = False
+
+        metrics = metrics if metrics is not None else NULL_METRICS
+        self._attempts = metrics.counter("bitcoinz_outbox_attempts_total", "Attempts to post installments from the outbox, by result.", ("result",))
+        metrics.gauge("bitcoinz_outbox_pending", "Installments in the outbox not delivered yet.").set_function(self.num_pending)
+
+        self._dispatcher: Optional[threading.Thread] = None
+        if background:
+            # Resume what an earlier process left undelivered
+            self._dispatcher = threading.Thread(target=self._dispatch, name="payout-outbox", daemon=True)
+            self._dispatcher.start()
+
+    def enqueue(self, transfers: List[Tuple[float, str, str, str]], batch: Optional[str] = None) -> List[str]:
+        """
+        Durably add the installments of one transaction.
+
+        Args:
+            transfers (List[Tuple[float, str, str, str]]): (delay in seconds, fromAddress, toAddress, amount) per installment.
+            batch (str, optional): Identifier of the transaction, passed along in OutboxEntry.batch. Defaults to a new one.
+
+        Returns:
+            List[str]: Idempotency key per installment.
+        """
+        now = self.clock()
+        batch = batch if batch is not None else uuid.uuid4().hex
+        rows = [(uuid.uuid4().hex, batch, sender, receiver, amount, now + max(delay, 0.0), PENDING)
+                for delay, sender, receiver, amount in transfers]
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("PayoutOutbox has been closed")
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("INSERT INTO outbox (idempotency_key, batch, from_address, to_address, amount, not_before, status) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+            self._conn.execute("COMMIT")
+            self._cond.notify_all()
+        return [row[0] for row in rows]
+
+    def num_pending(self) -> int:
+        """
+        Number of installments not delivered or failed yet, those being posted included.
+        """
+        with self._cond:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox WHERE status = ?", (PENDING,)).fetchone()[0]
+
+    def entries(self, status: Optional[str] = None) -> List[OutboxEntry]:
+        """
+        Installments in the outbox, oldest first.
+
+        Args:
+            status (str, optional): Only those with this status, PENDING, DELIVERED or FAILED. Defaults to all.
+
+        Returns:
+            List[OutboxEntry]: The installments.
+        """
+        with self._cond:
+            if status is None:
+                rows = self._conn.execute("SELECT {} FROM outbox ORDER BY id".format(_COLUMNS))
+            else:
+                rows = self._conn.execute("SELECT {} FROM outbox WHERE status = ? ORDER BY id".format(_COLUMNS), (status,))
+            return [OutboxEntry(*row) for row in rows]
+
+    def run_pending(self, due_only: bool = True) -> int:
+        """
+        Post every due installment, max_in_flight at a time, and wait for the results.
+
+        Args:
+            due_only (bool, optional): Skip installments whose due time or backoff has not passed. Defaults to True.
+
+        Returns:
+            int: Number of installments attempted.
+        """
+        attempted = 0
+        while True:
+            entries = self._claim(None if due_only else float("inf"))
+            if not entries:
+                return attempted
+            for future in [self._executor.submit(self._deliver, entry) for entry in entries]:
+                future.result()
+            attempted += len(entries)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until no installment is pending anymore. Without a dispatcher thread, pending installments are
+        posted right away regardless of their due time and backoff.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if nothing is pending anymore.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.num_pending():
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            if self.background:
+                with self._cond:
+                    self._cond.wait(remaining if remaining is not None else 1.0)
+            else:
+                self.run_pending(due_only=False)
+        return True
+
+    def close(self) -> None:
+        """
+        Stop delivering and close the database. Undelivered installments stay in it.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+    def _claim(self, now: Optional[float]) -> List[OutboxEntry]:
+        """
+        Mark up to the free places of in-flight installments, due at now, as being posted.
+        """
+        with self._cond:
+            free = self.max_in_flight - len(self._in_flight)
+            if free <= 0:
+                return []
+            now = self.clock() if now is None else now
+            rows = self._conn.execute("SELECT {} FROM outbox WHERE status = ? AND not_before <= ? ORDER BY not_before LIMIT ?".format(_COLUMNS),
+                                      (PENDING, now, free + len(self._in_flight))).fetchall()
+            entries = [OutboxEntry(*row) for row in rows if row[0] not in self._in_flight][:free]
+            self._in_flight.update(entry.id for entry in entries)
+            return entries
+
+    def _deliver(self, entry: OutboxEntry) -> None:
+        try:
+            self._attempt(entry)
+        finally:
+            # Even if recording the attempt failed, so drain() and the dispatcher don't wait for it forever
+            with self._cond:
+                if entry.id in self._in_flight:
+                    self._in_flight.discard(entry.id)
+                    self._cond.notify_all()
+
+    def _attempt(self, entry: OutboxEntry) -> None:
+        try:
+            response = self.client.post_transaction(entry.from_address, entry.to_address, entry.amount, idempotency_key=entry.key)
+            status, error = response.status_code, None
+        except CircuitOpenException as e:
+            # Not an attempt: queue the installment until the breaker lets calls through again
+            self._update(entry, PENDING, entry.attempts, self.clock() + e.retry_after, str(e))
+            self._attempts.labels("deferred").inc()
+            return
+        except requests.RequestException as e:
+            status, error = None, str(e)
+        except Exception as e:
+            # A bug or unexpected response in the client: a failed attempt, retried like a network error
+            logger.exception("Posting installment %s failed", entry.key)
+            status, error = None, "{}: {}".format(type(e).__name__, e)
+
+        attempts = entry.attempts + 1
+        if status == requests.codes.ok:
+            result = DELIVERED
+            self._update(entry, DELIVERED, attempts, entry.not_before, None)
+        elif (status is None or status == 429 or status >= 500) and attempts < self.max_attempts:
+            result = "retried"
+            backoff = self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+            self._update(entry, PENDING, attempts, self.clock() + backoff, error or "HTTP {}".format(status))
+        else:
+            result = FAILED
+            error = error or "HTTP {}".format(status)
+            logger.error("Installment %s of %s to %s failed after %s attempts: %s", entry.key, entry.amount, entry.to_address, attempts, error)
+            self._update(entry, FAILED, attempts, entry.not_before, error)
+        self._attempts.labels(result).inc()
+
+        if result == DELIVERED and self.listener is not None:
+            entry.status, entry.attempts = DELIVERED, attempts
+            try:
+                self.listener(entry)
+            except Exception:
+                logger.exception("Outbox listener failed on %s", entry.key)
+
+    def _update(self, entry: OutboxEntry, status: str, attempts: int, not_before: float, error: Optional[str]) -> None:
+        with self._cond:
+            self._conn.execute("UPDATE outbox SET status = ?, attempts = ?, not_before = ?, last_error = ? WHERE id = ?",
+                               (status, attempts, not_before, error, entry.id))
+            self._in_flight.discard(entry.id)
+            self._cond.notify_all()
+
+    def _dispatch(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                entries = self._claim(None)
+                if not entries:
+                    # Woken up by new installments and finished attempts, or when the next one is due
+                    wait_time = 1.0
+                    if len(self._in_flight) < self.max_in_flight:
+                        now = self.clock()
+                        row = self._conn.execute("SELECT MIN(not_before) FROM outbox WHERE status = ? AND not_before > ?",
+                                                 (PENDING, now)).fetchone()
+                        if row[0] is not None:
+                            wait_time = min(wait_time, row[0] - now)
+                    self._cond.wait(wait_time)
+                    continue
+            for entry in entries:
+                self._executor.submit(self._deliver, entry)
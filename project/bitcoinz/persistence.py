@@ -0,0 +1,384 @@
+import glob
+import json
+import logging
+import mmap
+import os
+import threading
+from typing import Dict, Iterator, Optional
+
+from project.bitcoinz.mixer import Mixer
+
+logger = logging.getLogger(__name__)
+
+WAL_PATTERN = "wal-{:020d}.log"
+SNAPSHOT_PATTERN = "snapshot-{:020d}.json"
+
+
+class WriteAheadLog:
+    """
+    Append-only log of JSON records, one per line, each tagged with a log sequence number (lsn).
+
+    Appends are buffered and written with a single write + fsync per group (group commit): when a caller
+    waits for its record in sync(), when batch_size records are buffered, when flush_interval seconds have
+    passed, or when flush() is called. Only one group is written at a time; records appended meanwhile
+    are buffered for the next group, so concurrent committers waiting in sync() share one fsync.
+    """
+    def __init__(self, path: str, start_lsn: int, batch_size: int = 256, flush_interval: float = 0.005, fsync: bool = True):
+        """
+        Open a log segment for appending.
+
+        Args:
+            path (str): Segment file path.
+            start_lsn (int): Sequence number of the next record.
+            batch_size (int, optional): Number of buffered records that forces a group commit. Defaults to 256.
+            flush_interval (float, optional): Maximum seconds a record stays buffered. Defaults to 0.005.
+            fsync (bool, optional): fsync after every group commit. Defaults to True.
+        """
+        self.path = path
+        self.next_lsn = start_lsn
+        self.synced_lsn = start_lsn - 1
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.num_commits = 0
+        self._file = open(path, "ab")
+        self._buffer = []
+        self._cond = threading.Condition(threading.Lock())
+        # If a group is being written outside the lock
+        self._flushing = False
+        self._stopped = threading.Event()
+        self._flusher = threading.Thread(target=self._flush_periodically, args=(flush_interval,), name="wal-flusher", daemon=True)
+        self._flusher.start()
+
+    def append(self, record: Dict) -> int:
+        """
+        Buffer a record for the next group commit. It is not durable before sync() returns for its lsn.
+
+        Args:
+            record (Dict): JSON-serializable record. Its "lsn" key is set by the log.
+
+        Returns:
+            int: Sequence number of the record.
+        """
+        with self._cond:
+            lsn = record["lsn"] = self.next_lsn
+            self.next_lsn += 1
+            line = json.dumps(record, separators=(",", ":")).encode() + b"\n"
+            self._buffer.append(line)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.sync(lsn)
+        return lsn
+
+    def sync(self, lsn: int) -> int:
+        """
+        Block until the record lsn (and every record before it) is durable. The first waiter writes and fsyncs
+        everything buffered as one group while later waiters wait for it, or for the group after it.
+
+        Args:
+            lsn (int): Sequence number returned by append().
+
+        Returns:
+            int: Sequence number of the last durable record.
+        """
+        with self._cond:
+            while self.synced_lsn < lsn:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                if not self._buffer:
+                    break
+                group, self._buffer = self._buffer, []
+                last_lsn = self.next_lsn - 1
+                self._flushing = True
+                written = False
+                self._cond.release()
+                try:
+                    self._write(group)
+                    written = True
+                finally:
+                    self._cond.acquire()
+                    self._flushing = False
+                    if written:
+                        self.synced_lsn = last_lsn
+                        self.num_commits += 1
+                    self._cond.notify_all()
+            return self.synced_lsn
+
+    def flush(self) -> int:
+        """
+        Write and fsync all buffered records.
+
+        Returns:
+            int: Sequence number of the last durable record.
+        """
+        with self._cond:
+            lsn = self.next_lsn - 1
+        return self.sync(lsn)
+
+    def close(self) -> None:
+        """
+        Flush buffered records and close the segment.
+        """
+        self._stopped.set()
+        self._flusher.join()
+        self.flush()
+        with self._cond:
+            self._file.close()
+
+    def _write(self, group) -> None:
+        self._file.write(b"".join(group))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _flush_periodically(self, interval: float) -> None:
+        while not self._stopped.wait(interval):
+            self.flush()
+
+
+def read_records(path: str) -> Iterator[Dict]:
+    """
+    Read the records of a log segment through a read-only memory map.
+    Stops at the first torn (partially written) record at the tail.
+
+    Args:
+        path (str): Segment file path.
+
+    Returns:
+        Iterator[Dict]: Records in log order.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            while True:
+                line = mm.readline()
+                if not line.endswith(b"\n"):
+                    return
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    logger.warning("Ignoring torn record at the end of %s", path)
+                    return
+
+
+class MixerJournal:
+    """
+    Durable journal of a Mixer: a write-ahead log of every new deposit address, transaction and paid
+    installment, plus periodic compact snapshots of the whole ledger.
+
+    On startup, recover() loads the latest snapshot and replays only the log records written after it.
+    Records are appended while the Mixer holds its lock, so the log order is the order changes were applied.
+    Only meant for mixers with an InMemoryStorage; a SQLiteStorage is durable on its own.
+
+    With sync_commit (the default), the Mixer waits in commit() after releasing its lock until its records
+    are durable, so a send returns only once it survives a crash; concurrent sends share group commits.
+    Without it, sends return as soon as their records are buffered: a crash loses the changes of up to the
+    last flush_interval seconds (or batch_size records), even though their callers were told they succeeded.
+    """
+    def __init__(self, directory: str, batch_size: int = 256, flush_interval: float = 0.005,
+                 snapshot_interval: int = 100000, fsync: bool = True, sync_commit: bool = True):
+        """
+        Initialize the journal.
+
+        Args:
+            directory (str): Directory holding log segments and snapshots. Created if missing.
+            batch_size (int, optional): Group commit size of the write-ahead log. Defaults to 256.
+            flush_interval (float, optional): Maximum seconds a record stays unflushed. Defaults to 0.005.
+            snapshot_interval (int, optional): Take a snapshot after this many records. Defaults to 100000.
+            fsync (bool, optional): fsync log and snapshots. Defaults to True.
+            sync_commit (bool, optional): Make commit() wait until records are durable. Defaults to True;
+                False trades the data-loss window described above for latency.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.fsync = fsync
+        self.sync_commit = sync_commit
+        self.records_since_snapshot = 0
+        self.wal: Optional[WriteAheadLog] = None
+        self._closed_segment_commits = 0
+
+    @property
+    def num_commits(self) -> int:
+        """
+        Number of group commits (write + fsync) since the journal was opened.
+        """
+        return self._closed_segment_commits + (self.wal.num_commits if self.wal is not None else 0)
+
+    def log_address(self, deposit_address: str, private_addresses) -> int:
+        """
+        Record a new deposit address and its private addresses. Returns the record's lsn.
+        """
+        return self._append({"op": "address", "address": deposit_address, "private": list(private_addresses)})
+
+    def log_transaction(self, sender: str, receiver: str, amount: int, timestamp_ns: int, is_minted: bool) -> int:
+        """
+        Record a transaction committed by Mixer.execute_transactions. Amount is in base units. Returns the record's lsn.
+        """
+        return self._append({"op": "transaction", "from": sender, "to": receiver, "amount": amount, "ts": timestamp_ns,
+                             "minted": is_minted})
+
+    def log_payout(self, receiver: str, amount: int) -> int:
+        """
+        Record an installment paid out from the house address. Amount is in base units. Returns the record's lsn.
+        """
+        return self._append({"op": "payout", "to": receiver, "amount": amount})
+
+    def commit(self, lsn: int) -> None:
+        """
+        With sync_commit, block until the record lsn is durable. Call it without holding the mixer's lock,
+        so other sends can append to the same group commit meanwhile.
+
+        Args:
+            lsn (int): Sequence number returned by one of the log methods.
+        """
+        wal = self.wal
+        if self.sync_commit and wal is not None:
+            # Records of segments replaced by a snapshot were flushed before it was taken
+            wal.sync(lsn)
+
+    def maybe_snapshot(self, mixer: Mixer) -> None:
+        """
+        Take a snapshot if snapshot_interval records have been logged since the last one. Caller must hold the mixer's lock.
+
+        Args:
+            mixer (Mixer): Journaled mixer.
+        """
+        if self.records_since_snapshot >= self.snapshot_interval:
+            self.snapshot(mixer)
+
+    def snapshot(self, mixer: Mixer) -> int:
+        """
+        Write a snapshot of mixer and start a new log segment, deleting segments and snapshots it supersedes.
+
+        Args:
+            mixer (Mixer): Journaled mixer.
+
+        Returns:
+            int: Sequence number of the last record reflected in the snapshot.
+        """
+        with mixer._lock:
+            lsn = self.wal.flush() if self.wal is not None else self._latest_lsn()
+            state = mixer.snapshot_state()
+            state["lsn"] = lsn
+
+            path = os.path.join(self.directory, SNAPSHOT_PATTERN.format(lsn))
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, separators=(",", ":"))
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+
+            if self.wal is not None:
+                self.wal.close()
+                self._closed_segment_commits += self.wal.num_commits
+            self._open_segment(lsn + 1)
+            for old in self._segments() + self._snapshots():
+                if old != path and old != self.wal.path:
+                    os.remove(old)
+            self.records_since_snapshot = 0
+        return lsn
+
+    def recover(self, mixer: Mixer) -> int:
+        """
+        Load the latest snapshot into mixer, replay the log records written after it and open a new log segment.
+
+        Args:
+            mixer (Mixer): A fresh mixer without journal.
+
+        Returns:
+            int: Number of log records replayed.
+        """
+        snapshot_lsn = 0
+        snapshots = self._snapshots()
+        if snapshots:
+            with open(snapshots[-1]) as f:
+                state = json.load(f)
+            mixer.restore_state(state)
+            snapshot_lsn = state["lsn"]
+
+        replayed = 0
+        last_lsn = snapshot_lsn
+        with mixer._lock:
+            for segment in self._segments():
+                for record in read_records(segment):
+                    if record["lsn"] <= snapshot_lsn:
+                        continue
+                    self._apply(mixer, record)
+                    last_lsn = record["lsn"]
+                    replayed += 1
+
+        self._open_segment(last_lsn + 1)
+        self.records_since_snapshot = replayed
+        return replayed
+
+    def close(self) -> None:
+        """
+        Flush and close the current log segment.
+        """
+        if self.wal is not None:
+            self.wal.close()
+            self._closed_segment_commits += self.wal.num_commits
+            self.wal = None
+
+    def _append(self, record: Dict) -> int:
+        self.records_since_snapshot += 1
+        return self.wal.append(record)
+
+    @staticmethod
+    def _apply(mixer: Mixer, record: Dict) -> None:
+        op = record["op"]
+        if op == "address":
+            mixer._register_wallet(record["address"], record["private"])
+        elif op == "transaction":
+            mixer._commit_transaction(record["from"], record["to"], record["amount"], record["ts"], record["minted"])
+        elif op == "payout":
+            mixer._apply_installment(record["to"], record["amount"])
+        else:
+            raise ValueError("Unknown journal record ({})".format(op))
+
+    def _open_segment(self, start_lsn: int) -> None:
+        path = os.path.join(self.directory, WAL_PATTERN.format(start_lsn))
+        self.wal = WriteAheadLog(path, start_lsn, self.batch_size, self.flush_interval, self.fsync)
+
+    def _latest_lsn(self) -> int:
+        lsn = 0
+        for segment in self._segments():
+            for record in read_records(segment):
+                lsn = record["lsn"]
+        return lsn
+
+    def _segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "wal-*.log")))
+
+    def _snapshots(self):
+        return sorted(glob.glob(os.path.join(self.directory, "snapshot-*.json")))
+
+
+def open_mixer(directory: str, journal_options: Optional[Dict] = None, **mixer_options) -> Mixer:
+    """
+    Open a durable Mixer whose ledger is journaled to directory, recovering any state already there.
+    Installments that were still owed when the previous process stopped are scheduled again.
+    Every change is durable when the call making it returns, unless journal_options has sync_commit=False,
+    which loses up to flush_interval seconds of acknowledged changes on a crash, see MixerJournal.
+
+    Args:
+        directory (str): Journal directory.
+        journal_options (Dict, optional): Keyword arguments of MixerJournal. Defaults to None.
+        mixer_options: Keyword arguments of Mixer.
+
+    Returns:
+        Mixer: The recovered mixer, journaling every change.
+    """
+    mixer = Mixer(**mixer_options)
+    journal = MixerJournal(directory, **(journal_options or {}))
+    replayed = journal.recover(mixer)
+    logger.info("Recovered mixer from %s, replayed %d journal records", directory, replayed)
+    mixer.journal = journal
+    mixer.resume_payouts()
+    return mixer
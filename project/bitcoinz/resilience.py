@@ -0,0 +1,131 @@
+import math
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+
+# Values of the bitcoinz_circuit_breaker_state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast while the API looks unhealthy. After failure_threshold failures in a row the breaker
+    opens and rejects every call for reset_timeout seconds; then it lets a single probe through (half open),
+    closing again if the probe succeeds and reopening if it fails.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            failure_threshold (int, optional): Consecutive failures opening the breaker. Defaults to 5.
+            reset_timeout (float, optional): Seconds the breaker stays open before probing. Defaults to 5.
+            clock (Callable[[], float], optional): Monotonic clock returning seconds. Defaults to time.monotonic.
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.num_rejected = 0
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """
+        CLOSED, HALF_OPEN (probing, or ready to probe) or OPEN.
+        """
+        with self._lock:
+            if self._state == OPEN and self.clock() >= self._opened_at + self.reset_timeout:
+                return HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        """
+        Seconds until the breaker lets a call through again, 0 if it does now. While a probe is in flight
+        its outcome is unknown, so callers are told to wait reset_timeout rather than to retry at once.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return 0.0
+            if self._state == HALF_OPEN and self._probing:
+                return self.reset_timeout
+            return max(0.0, self._opened_at + self.reset_timeout - self.clock())
+
+    def allow(self) -> bool:
+        """
+        If a call may be made now. Every allowed call must be followed by record().
+
+        Returns:
+            bool: False while the breaker is open, or half open with its probe in flight.
+        """
+        with self._lock:
+            if self._state == OPEN and self.clock() >= self._opened_at + self.reset_timeout:
+                self._state = HALF_OPEN
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.num_rejected += 1
+            return False
+
+    def record(self, success: bool) -> None:
+        """
+        Record the outcome of an allowed call.
+
+        Args:
+            success (bool): False if the call failed in a way that suggests the API is unhealthy.
+        """
+        with self._lock:
+            if success:
+                self.failures = 0
+                if self._state == HALF_OPEN:
+                    self._state = CLOSED
+                    self._probing = False
+                return
+            self.failures += 1
+            if self._state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._state = OPEN
+                self._opened_at = self.clock()
+                self._probing = False
+
+
+class LatencyWindow:
+    """
+    Latencies of the most recent calls, to derive percentiles from, e.g. the delay before hedging a request.
+    """
+    def __init__(self, size: int = 200, min_samples: int = 20):
+        """
+        Args:
+            size (int, optional): Latencies kept. Defaults to 200.
+            min_samples (int, optional): Latencies needed before percentile() answers. Defaults to 20.
+        """
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float) -> None:
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        The q-quantile of the recent latencies.
+
+        Args:
+            q (float): Quantile between 0 and 1, e.g. 0.95.
+
+        Returns:
+            Optional[float]: Seconds, or None with fewer than min_samples latencies.
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
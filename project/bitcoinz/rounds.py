@@ -0,0 +1,127 @@
+import heapq
+import itertools
+import random
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from project.bitcoinz.metrics import NULL_METRICS, MetricsRegistry
+from project.bitcoinz.scheduler import PayoutScheduler
+
+
+class RoundTransfer:
+    """
+    One transfer of a payout round: every installment due to receiver in the round, coalesced.
+    parts holds what was submitted along with each installment, e.g. the progress of its transaction.
+    """
+    __slots__ = ("receiver", "amount", "parts")
+
+    def __init__(self, receiver: str, amount: int, parts: List[Any]):
+        self.receiver = receiver
+        self.amount = amount
+        self.parts = parts
+
+    def __repr__(self):
+        return "RoundTransfer({!r}, {}, {} installments)".format(self.receiver, self.amount, len(self.parts))
+
+
+class PayoutRounds:
+    """
+    Pays installments in rounds instead of one by one: installments submitted with a delay wait for the
+    first round at or after their due time. A round coalesces the installments due to the same receiver
+    into one transfer, shuffles the transfers and hands them to execute as one batch, so under load many
+    installments cost one house transfer per receiver per round, and the order of payouts no longer
+    follows the order of the deposits.
+
+    Rounds run every window seconds on the scheduler while installments are pending, so
+    PayoutScheduler.drain() also waits for (or, without a background worker, runs) every round.
+    """
+    def __init__(self, scheduler: PayoutScheduler, execute: Callable[[List[RoundTransfer]], Any], window: float = 1.0,
+                 rng: Optional[random.Random] = None, metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            scheduler (PayoutScheduler): Scheduler running the rounds.
+            execute (Callable[[List[RoundTransfer]], Any]): Pays the transfers of a round.
+            window (float, optional): Seconds between rounds. Defaults to 1.
+            rng (random.Random, optional): Source of the order of transfers. Defaults to an unseeded Random.
+            metrics (MetricsRegistry, optional): Registry to record rounds and transfers in. Defaults to recording nothing.
+        """
+        if window <= 0:
+            raise ValueError("Round window must be positive, not {}".format(window))
+        self.scheduler = scheduler
+        self.execute = execute
+        self.window = window
+        self.rng = rng if rng is not None else random.Random()
+        self._heap: List[Tuple[float, int, str, int, Any]] = []
+        self._counter = itertools.count()
+        self._next_round: Optional[float] = None
+        self._lock = threading.Lock()
+
+        metrics = metrics if metrics is not None else NULL_METRICS
+        self._rounds = metrics.counter("bitcoinz_payout_rounds_total", "Payout rounds executed.")
+        self._installments = metrics.counter("bitcoinz_payout_round_installments_total", "Installments paid in payout rounds.")
+        self._transfers = metrics.counter("bitcoinz_payout_round_transfers_total",
+                                          "Transfers executed by payout rounds, after coalescing installments per receiver.")
+        metrics.gauge("bitcoinz_payout_round_pending", "Installments waiting for a payout round.").set_function(self.num_pending)
+
+    def submit(self, delay: float, receiver: str, amount: int, part: Any = None) -> None:
+        """
+        Queue an installment for the first round at least delay seconds from now.
+
+        Args:
+            delay (float): Seconds from now after which the installment is due.
+            receiver (str): Receiver of the installment.
+            amount (int): Amount in base units.
+            part (Any, optional): Passed along in RoundTransfer.parts. Defaults to None.
+        """
+        self.submit_many([(delay, receiver, amount, part)])
+
+    def submit_many(self, installments: Iterable[Tuple[float, str, int, Any]]) -> None:
+        """
+        Queue (delay, receiver, amount, part) installments, see submit().
+        """
+        now = self.scheduler.clock()
+        with self._lock:
+            for delay, receiver, amount, part in installments:
+                heapq.heappush(self._heap, (now + max(delay, 0.0), next(self._counter), receiver, amount, part))
+            if self._next_round is None and self._heap:
+                self._schedule_round(now + self.window)
+
+    def num_pending(self) -> int:
+        """
+        Number of installments waiting for a round.
+        """
+        with self._lock:
+            return len(self._heap)
+
+    def _schedule_round(self, round_time: float) -> None:
+        self._next_round = round_time
+        self.scheduler.schedule(round_time - self.scheduler.clock(), self._run_round, round_time)
+
+    def _run_round(self, round_time: float) -> List[RoundTransfer]:
+        # Takes the installments due by the round's planned time rather than by the clock: drain() without
+        # a background worker runs rounds early, and later rounds must still make progress
+        transfers: Dict[str, RoundTransfer] = {}
+        num_installments = 0
+        with self._lock:
+            while self._heap and self._heap[0][0] <= round_time:
+                _, _, receiver, amount, part = heapq.heappop(self._heap)
+                num_installments += 1
+                transfer = transfers.get(receiver)
+                if transfer is None:
+                    transfers[receiver] = RoundTransfer(receiver, amount, [part])
+                else:
+                    transfer.amount += amount
+                    transfer.parts.append(part)
+            if self._heap:
+                self._schedule_round(max(round_time + self.window, self._heap[0][0]))
+            else:
+                self._next_round = None
+
+        batch = list(transfers.values())
+        self.rng.shuffle(batch)
+        self._rounds.inc()
+        self._installments.inc(num_installments)
+        self._transfers.inc(len(batch))
+        if batch:
+            self.execute(batch)
+        return batch
@@ -0,0 +1,230 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledPayout:
+    """
+    A delayed installment queued on a PayoutScheduler. Callers can wait on it to find out when it was paid.
+    """
+    def __init__(self, due: float, seq: int, callback: Callable[..., Any], args: tuple):
+        self.due = due
+        self.seq = seq
+        self.callback = callback
+        self.args = args
+        self.result = None
+        self.error: Optional[BaseException] = None
+        self._done = threading.Event()
+
+    def __lt__(self, other: "ScheduledPayout") -> bool:
+        return (self.due, self.seq) < (other.due, other.seq)
+
+    def is_done(self) -> bool:
+        """
+        If the installment has been executed (successfully or not).
+
+        Returns:
+            bool: True if executed. False otherwise.
+        """
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until the installment has been executed.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if the installment was executed within timeout.
+        """
+        return self._done.wait(timeout)
+
+    def _run(self) -> None:
+        try:
+            self.result = self.callback(*self.args)
+        except Exception as e:
+            self.error = e
+            logger.exception("Scheduled payout %s failed", self.seq)
+        finally:
+            self._done.set()
+
+
+class PayoutScheduler:
+    """
+    Timer-heap scheduler that executes delayed payout installments on a background worker thread,
+    so callers queueing installments return right away.
+
+    With background=False no thread is started and installments only run through run_pending() or drain().
+    """
+    def __init__(self, clock: Callable[[], float] = time.monotonic, background: bool = True, history_size: int = 1000):
+        """
+        Initialize the scheduler.
+
+        Args:
+            clock (Callable[[], float], optional): Monotonic clock returning seconds. Defaults to time.monotonic.
+            background (bool, optional): Whether to run due installments on a worker thread. Defaults to True.
+            history_size (int, optional): Number of completed installments to keep around. Defaults to 1000.
+        """
+        self.clock = clock
+        self.background = background
+        self._heap: List[ScheduledPayout] = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._running = 0
+        self._completed = deque(maxlen=history_size)
+        self.num_completed = 0
+        self._worker: Optional[threading.Thread] = None
+        self._stopped = False
+
+    def schedule(self, delay: float, callback: Callable[..., Any], *args) -> ScheduledPayout:
+        """
+        Queue callback(*args) to run after delay seconds.
+
+        Args:
+            delay (float): Number of seconds from now after which the installment is due.
+            callback (Callable[..., Any]): Function executing the installment.
+
+        Returns:
+            ScheduledPayout: Handle that can be waited on.
+        """
+        with self._cond:
+            if self._stopped:
+                raise RuntimeError("PayoutScheduler has been shut down")
+            payout = ScheduledPayout(self.clock() + max(delay, 0.0), next(self._counter), callback, args)
+            heapq.heappush(self._heap, payout)
+            if self.background and self._worker is None:
+                self._worker = threading.Thread(target=self._work, name="payout-scheduler", daemon=True)
+                self._worker.start()
+            self._cond.notify_all()
+        return payout
+
+    def pending(self) -> List[ScheduledPayout]:
+        """
+        Installments that have been queued but not executed yet, in due order.
+
+        Returns:
+            List[ScheduledPayout]: Pending installments.
+        """
+        with self._cond:
+            return sorted(self._heap)
+
+    def completed(self) -> List[ScheduledPayout]:
+        """
+        Most recently executed installments, oldest first (bounded by history_size).
+
+        Returns:
+            List[ScheduledPayout]: Completed installments.
+        """
+        with self._cond:
+            return list(self._completed)
+
+    def num_pending(self) -> int:
+        """
+        Number of installments queued or currently executing.
+
+        Returns:
+            int: Number of pending installments.
+        """
+        with self._cond:
+            return len(self._heap) + self._running
+
+    def run_pending(self) -> int:
+        """
+        Execute every installment that is due according to the clock on the calling thread.
+
+        Returns:
+            int: Number of installments executed.
+        """
+        executed = 0
+        while True:
+            payout = self._pop(due_only=True)
+            if payout is None:
+                return executed
+            self._execute(payout)
+            executed += 1
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every queued installment has been executed.
+        Without a background worker, remaining installments are executed immediately regardless of their due time.
+
+        Args:
+            timeout (float, optional): Maximum number of seconds to wait. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if no installments are pending anymore.
+        """
+        if not self.background:
+            while True:
+                payout = self._pop(due_only=False)
+                if payout is None:
+                    return True
+                self._execute(payout)
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._heap or self._running:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, drain: bool = True, timeout: Optional[float] = None) -> bool:
+        """
+        Stop accepting installments and stop the worker thread.
+
+        Args:
+            drain (bool, optional): Execute pending installments before stopping. Defaults to True.
+            timeout (float, optional): Maximum number of seconds to wait for draining. Defaults to None.
+
+        Returns:
+            bool: True if no installments were left pending.
+        """
+        drained = self.drain(timeout) if drain else False
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+            drained = drained or not self._heap
+        if self._worker is not None:
+            self._worker.join(timeout)
+        return drained
+
+    def _pop(self, due_only: bool) -> Optional[ScheduledPayout]:
+        with self._cond:
+            if not self._heap or (due_only and self._heap[0].due > self.clock()):
+                return None
+            self._running += 1
+            return heapq.heappop(self._heap)
+
+    def _execute(self, payout: ScheduledPayout) -> None:
+        payout._run()
+        with self._cond:
+            self._running -= 1
+            self._completed.append(payout)
+            self.num_completed += 1
+            self._cond.notify_all()
+
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped:
+                    if self._heap:
+                        wait_time = self._heap[0].due - self.clock()
+                        if wait_time <= 0:
+                            break
+                        self._cond.wait(wait_time)
+                    else:
+                        self._cond.wait()
+                if self._stopped:
+                    return
+                self._running += 1
+                payout = heapq.heappop(self._heap)
+            self._execute(payout)
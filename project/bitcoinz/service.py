@@ -0,0 +1,506 @@
+import asyncio
+import contextlib
+import json
+import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+from project.bitcoinz.exceptions import (BatchSendException, CircuitOpenException, DepositAddressDoesntExistException,
+                                         InsufficientBalanceException)
+from project.bitcoinz.transaction import TransactionPage
+
+logger = logging.getLogger(__name__)
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 422: "Unprocessable Entity", 500: "Internal Server Error",
+            503: "Service Unavailable"}
+
+# (status, JSON payload, or bytes sent as text)
+Response = Tuple[int, Any]
+
+
+def _error_payload(error: Exception) -> Dict[str, Any]:
+    payload = {"error": str(error), "type": type(error).__name__}
+    if isinstance(error, DepositAddressDoesntExistException):
+        payload["address"] = error.address
+    elif isinstance(error, CircuitOpenException):
+        payload["retry_after"] = error.retry_after
+    elif isinstance(error, BatchSendException):
+        payload["errors"] = {str(row): _error_payload(e) for row, e in error.errors.items()}
+    return payload
+
+
+def _error_from_payload(payload: Dict[str, Any]) -> Exception:
+    kind = payload.get("type")
+    if kind == "DepositAddressDoesntExistException":
+        return DepositAddressDoesntExistException(payload["address"])
+    if kind == "InsufficientBalanceException":
+        return InsufficientBalanceException()
+    if kind == "CircuitOpenException":
+        return CircuitOpenException(payload["retry_after"])
+    if kind == "BatchSendException":
+        return BatchSendException({int(row): _error_from_payload(e) for row, e in payload["errors"].items()})
+    if kind == "ValueError":
+        return ValueError(payload["error"])
+    return RuntimeError(payload.get("error", "Mixer service error"))
+
+
+def _status_of(error: Exception) -> int:
+    if isinstance(error, DepositAddressDoesntExistException):
+        return 404
+    if isinstance(error, (InsufficientBalanceException, BatchSendException)):
+        return 422
+    if isinstance(error, CircuitOpenException):
+        return 503
+    if isinstance(error, (ValueError, KeyError, TypeError)):
+        return 400
+    return 500
+
+
+class _Request:
+    __slots__ = ("method", "path", "query", "body", "keep_alive")
+
+    def __init__(self, method: str, path: str, query: Dict[str, str], body: bytes, keep_alive: bool):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.body = body
+        self.keep_alive = keep_alive
+
+
+class MixerService:
+    """
+    Serves a BitcoinZNetwork or BitcoinZAPINetwork to local clients over HTTP/1.1 with JSON bodies, on a TCP
+    port or a Unix socket, so one long-running process keeps the mixer's state and many clients share it.
+
+    Connections are kept alive and may pipeline requests: each connection reads ahead up to PIPELINE_DEPTH
+    requests as they arrive and handles them one at a time, in request order, on a thread pool, so every
+    request sees the effects of the ones sent before it. Requests of different connections run concurrently. stop()
+    shuts down gracefully: no new connections are accepted, requests being handled are answered, and the
+    mixer's pending payouts are drained before it returns.
+
+    Endpoints:
+        POST /addresses {"addresses": [...]}                      -> {"deposit_address": ...}
+        POST /send {"sender", "receiver", "amount"}               -> {"status": "OK"}, sender null to mint
+        POST /send_many {"transfers": [[s, r, a], ...], "atomic"} -> {"errors": [null or error, ...]}
+        GET  /transactions[?address=]                             -> {"transactions": ...} as get_transactions() returns them
+        GET  /records[?address=&cursor=&limit=]                   -> {"records": [...], "next_cursor": ...}
+        GET  /fees                                                -> {"fees_collected": "..."}
+        POST /wait_for_payouts {"timeout"}                        -> {"drained": true or false}
+        GET  /metrics[?format=json]                               -> Prometheus text format, or JSON
+        GET  /health                                              -> {"status": "ok" or "stopping"}
+    Errors are answered with {"error", "type"} and a 4xx or 5xx status.
+    """
+    PIPELINE_DEPTH = 64
+
+    def __init__(self, network, host: str = "127.0.0.1", port: int = 0, path: Optional[str] = None, workers: int = 8):
+        """
+        Configure the service. Call start() (or use running()) to listen.
+
+        Args:
+            network: BitcoinZNetwork or BitcoinZAPINetwork to serve.
+            host (str, optional): Interface to listen on. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on, 0 for a free one. Defaults to 0.
+            path (str, optional): Listen on this Unix socket instead of a TCP port. Defaults to None.
+            workers (int, optional): Threads handling requests. Defaults to 8.
+        """
+        self.network = network
+        self.host = host
+        self.port = port
+        self.path = path
+        self.num_requests = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._server = None
+        self._writers = set()
+        self._active = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._stopping = False
+        self._stopped: Optional[asyncio.Event] = None
+        self._routes: Dict[Tuple[str, str], Callable[[_Request], Response]] = {
+            ("POST", "/addresses"): self._add_addresses,
+            ("POST", "/send"): self._send,
+            ("POST", "/send_many"): self._send_many,
+            ("GET", "/transactions"): self._transactions,
+            ("GET", "/records"): self._records,
+            ("GET", "/fees"): self._fees,
+            ("POST", "/wait_for_payouts"): self._wait_for_payouts,
+            ("GET", "/metrics"): self._metrics,
+            ("GET", "/health"): self._health,
+        }
+
+    @property
+    def url(self) -> str:
+        """
+        Address to give to ServiceClient.
+        """
+        if self.path is not None:
+            return "unix://" + self.path
+        return "http://{}:{}".format(self.host, self.port)
+
+    async def start(self) -> None:
+        """
+        Start listening. If port was 0, self.port is set to the port picked.
+        """
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._stopped = asyncio.Event()
+        if self.path is not None:
+            self._server = await asyncio.start_unix_server(self._serve_connection, self.path)
+        else:
+            self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+            self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Mixer service listening on %s", self.url)
+
+    async def stop(self, drain_timeout: Optional[float] = None) -> bool:
+        """
+        Shut down gracefully: stop accepting connections, answer the requests being handled, close the
+        connections and drain the mixer's pending payouts.
+
+        Args:
+            drain_timeout (float, optional): Maximum number of seconds to wait for payouts. Defaults to None (wait forever).
+
+        Returns:
+            bool: True if no payouts were left pending.
+        """
+        self._stopping = True
+        self._server.close()
+        await self._server.wait_closed()
+        await self._idle.wait()
+        for writer in list(self._writers):
+            writer.close()
+        loop = asyncio.get_event_loop()
+        drained = await loop.run_in_executor(self._executor, self.network.wait_for_payouts, drain_timeout)
+        self._executor.shutdown(wait=True)
+        self._stopped.set()
+        logger.info("Mixer service stopped, payouts drained: %s", drained)
+        return drained
+
+    async def wait_stopped(self) -> None:
+        """
+        Wait until stop() has finished.
+        """
+        await self._stopped.wait()
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._writers.add(writer)
+        # Requests read ahead, handled in order; bounded, so a client pipelining faster than it reads is pushed back
+        requests: asyncio.Queue = asyncio.Queue(maxsize=self.PIPELINE_DEPTH)
+        handler = asyncio.ensure_future(self._handle_requests(requests, writer))
+        try:
+            while not self._stopping:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                self._begin()
+                await requests.put(request)
+                if not request.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            await requests.put(None)
+            await handler
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _handle_requests(self, requests: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_event_loop()
+        broken = False
+        while True:
+            request = await requests.get()
+            if request is None:
+                return
+            try:
+                status, payload = await loop.run_in_executor(self._executor, self._handle, request)
+                if not broken:
+                    writer.write(_encode_response(status, payload, request.keep_alive and not self._stopping))
+                    await writer.drain()
+            except ConnectionError:
+                broken = True
+            finally:
+                self._end()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[_Request]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, target, version = request_line.decode("latin-1").split()
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+        url = urlsplit(target)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        return _Request(method, url.path.rstrip("/") or "/", query, body, keep_alive)
+
+    def _begin(self) -> None:
+        self._active += 1
+        self.num_requests += 1
+        self._idle.clear()
+
+    def _end(self) -> None:
+        self._active -= 1
+        if self._active == 0:
+            self._idle.set()
+
+    def _handle(self, request: _Request) -> Response:
+        route = self._routes.get((request.method, request.path))
+        if route is None:
+            return 404, {"error": "Not Found", "type": "NotFound"}
+        try:
+            return route(request)
+        except Exception as e:
+            status = _status_of(e)
+            if status == 500:
+                logger.exception("Request %s %s failed", request.method, request.path)
+            return status, _error_payload(e)
+
+    def _add_addresses(self, request: _Request) -> Response:
+        return 200, {"deposit_address": self.network.add_addresses(_json(request)["addresses"])}
+
+    def _send(self, request: _Request) -> Response:
+        body = _json(request)
+        sender = body.get("sender") or self.network.MINTED
+        self.network.send(sender, body["receiver"], body["amount"])
+        return 200, {"status": "OK"}
+
+    def _send_many(self, request: _Request) -> Response:
+        body = _json(request)
+        if not hasattr(self.network, "send_many"):
+            return 404, {"error": "The network does not support batched sends", "type": "NotFound"}
+        transfers = [(sender or self.network.MINTED, receiver, amount) for sender, receiver, amount in body["transfers"]]
+        errors = self.network.send_many(transfers, atomic=body.get("atomic", True))
+        return 200, {"errors": [None if error is None else _error_payload(error) for error in errors]}
+
+    def _transactions(self, request: _Request) -> Response:
+        return 200, {"transactions": self.network.get_transactions(request.query.get("address"))}
+
+    def _records(self, request: _Request) -> Response:
+        if not hasattr(self.network, "query_transactions"):
+            return 404, {"error": "The network does not support transaction records", "type": "NotFound"}
+        page = self.network.query_transactions(request.query.get("address"), int(request.query.get("cursor", 0)),
+                                               int(request.query.get("limit", 100)))
+        return 200, {"records": page.records, "next_cursor": page.next_cursor}
+
+    def _fees(self, request: _Request) -> Response:
+        return 200, {"fees_collected": str(self.network.get_fees_collected())}
+
+    def _wait_for_payouts(self, request: _Request) -> Response:
+        return 200, {"drained": self.network.wait_for_payouts(_json(request).get("timeout"))}
+
+    def _metrics(self, request: _Request) -> Response:
+        if request.query.get("format") == "json":
+            return 200, self.network.metrics.snapshot()
+        return 200, self.network.metrics.to_prometheus().encode()
+
+    def _health(self, request: _Request) -> Response:
+        return 200, {"status": "stopping" if self._stopping else "ok"}
+
+
+def _json(request: _Request) -> Dict[str, Any]:
+    return json.loads(request.body.decode()) if request.body else {}
+
+
+def _encode_response(status: int, payload, keep_alive: bool) -> bytes:
+    # bytes payloads are text, e.g. metrics in the Prometheus format
+    if isinstance(payload, bytes):
+        body, content_type = payload, "text/plain; charset=utf-8"
+    else:
+        body, content_type = json.dumps(payload).encode(), "application/json"
+    head = "HTTP/1.1 {} {}\r\nContent-Type: {}\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n".format(
+        status, _REASONS.get(status, ""), content_type, len(body), "keep-alive" if keep_alive else "close")
+    return head.encode("latin-1") + body
+
+
+@contextlib.contextmanager
+def running(service: MixerService, drain_timeout: Optional[float] = None) -> Iterator[MixerService]:
+    """
+    Serve from an event loop on a background thread for the duration of the with block, stopping gracefully after.
+
+    Args:
+        service (MixerService): Service to run.
+        drain_timeout (float, optional): Maximum number of seconds to wait for payouts when stopping. Defaults to None.
+
+    Returns:
+        Iterator[MixerService]: The listening service.
+    """
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(service.start())
+    thread = threading.Thread(target=loop.run_forever, name="mixer-service", daemon=True)
+    thread.start()
+    try:
+        yield service
+    finally:
+        asyncio.run_coroutine_threadsafe(service.stop(drain_timeout), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+class _RemoteMetrics:
+    """
+    The metrics of a MixerService, in the interface of MetricsRegistry the CLIs use.
+    """
+    def __init__(self, client: "ServiceClient"):
+        self._client = client
+
+    def to_json(self) -> str:
+        return json.dumps(self._client.call("GET", "/metrics?format=json"))
+
+    def to_prometheus(self) -> str:
+        return self._client.call("GET", "/metrics")
+
+
+class ServiceClient:
+    """
+    Client of a MixerService with the interface of BitcoinZNetwork the CLIs use, over one kept-alive
+    connection. pipeline() sends many requests before reading any response, saving a round trip per request.
+    Errors of the service are raised as the exceptions the network raised, e.g. InsufficientBalanceException.
+    """
+    MINTED = "(new)"
+
+    def __init__(self, url: str, timeout: Optional[float] = 60.0):
+        """
+        Args:
+            url (str): URL of the service, http://host:port or unix:///path/to/socket.
+            timeout (float, optional): Seconds to wait for the service on the socket. Defaults to 60.
+        """
+        self.url = url
+        self.timeout = timeout
+        self.metrics = _RemoteMetrics(self)
+        self._socket: Optional[socket.socket] = None
+        self._file = None
+        self._lock = threading.Lock()
+
+    def add_addresses(self, addresses: List[str]) -> str:
+        return self.call("POST", "/addresses", {"addresses": list(addresses)})["deposit_address"]
+
+    def send(self, sender: str, receiver: str, amount: str) -> None:
+        self.call("POST", "/send", {"sender": None if sender == self.MINTED else sender, "receiver": receiver, "amount": amount})
+
+    def send_many(self, transfers, atomic: bool = True) -> List[Optional[Exception]]:
+        transfers = [[None if sender == self.MINTED else sender, receiver, amount] for sender, receiver, amount in transfers]
+        errors = self.call("POST", "/send_many", {"transfers": transfers, "atomic": atomic})["errors"]
+        return [None if error is None else _error_from_payload(error) for error in errors]
+
+    def get_transactions(self, address: Optional[str] = None):
+        return self.call("GET", _with_query("/transactions", address=address))["transactions"]
+
+    def query_transactions(self, address: Optional[str] = None, cursor: int = 0, limit: int = 100) -> TransactionPage:
+        page = self.call("GET", _with_query("/records", address=address, cursor=cursor, limit=limit))
+        return TransactionPage(page["records"], page["next_cursor"])
+
+    def iter_transactions(self, address: Optional[str] = None) -> Iterator[Dict[str, str]]:
+        cursor = 0
+        while cursor is not None:
+            page = self.query_transactions(address, cursor, 1000)
+            yield from page.records
+            cursor = page.next_cursor
+
+    def get_fees_collected(self) -> str:
+        return self.call("GET", "/fees")["fees_collected"]
+
+    def wait_for_payouts(self, timeout: Optional[float] = None) -> bool:
+        return self.call("POST", "/wait_for_payouts", {"timeout": timeout})["drained"]
+
+    def call(self, method: str, path: str, payload: Optional[Dict] = None):
+        """
+        Make one request.
+
+        Raises:
+            Exception: The error the service answered with, see MixerService.
+
+        Returns:
+            The parsed JSON body, or the text of a text response.
+        """
+        return self.pipeline([(method, path, payload)], raise_errors=True)[0]
+
+    def pipeline(self, requests: List[Tuple[str, str, Optional[Dict]]], raise_errors: bool = False) -> List[Union[Any, Exception]]:
+        """
+        Send all requests at once and read their responses, in order.
+
+        Args:
+            requests (List[Tuple[str, str, Optional[Dict]]]): (method, path with query, JSON payload or None) per request.
+            raise_errors (bool, optional): Raise the first error instead of returning it. Defaults to False.
+
+        Returns:
+            List: Parsed body per request, or the exception it failed with.
+        """
+        data = b"".join(_encode_request(method, path, payload) for method, path, payload in requests)
+        with self._lock:
+            if self._socket is None:
+                self._connect()
+            try:
+                self._socket.sendall(data)
+                responses = [self._read_response() for _ in requests]
+            except (OSError, ValueError):
+                self.close()
+                raise
+        results = []
+        for status, body in responses:
+            if status >= 400:
+                error = _error_from_payload(body if isinstance(body, dict) else {"error": body})
+                if raise_errors:
+                    raise error
+                results.append(error)
+            else:
+                results.append(body)
+        return results
+
+    def close(self) -> None:
+        """
+        Close the connection; the next request opens a new one.
+        """
+        if self._socket is not None:
+            self._file.close()
+            self._socket.close()
+            self._socket = self._file = None
+
+    def _connect(self) -> None:
+        url = urlsplit(self.url)
+        if url.scheme == "unix":
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(url.path)
+        else:
+            sock = socket.create_connection((url.hostname, url.port), self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._socket = sock
+        self._file = sock.makefile("rb")
+
+    def _read_response(self) -> Tuple[int, Any]:
+        status_line = self._file.readline()
+        if not status_line:
+            raise ConnectionError("Mixer service closed the connection")
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = self._file.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = self._file.read(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        if headers.get("content-type", "").startswith("application/json"):
+            return status, json.loads(body.decode())
+        return status, body.decode()
+
+
+def _with_query(path: str, **params) -> str:
+    params = {name: value for name, value in params.items() if value is not None}
+    return "{}?{}".format(path, urlencode(params)) if params else path
+
+
+def _encode_request(method: str, path: str, payload: Optional[Dict]) -> bytes:
+    body = json.dumps(payload).encode() if payload is not None else b""
+    head = "{} {} HTTP/1.1\r\nHost: mixer\r\nContent-Type: application/json\r\nContent-Length: {}\r\n\r\n".format(method, path, len(body))
+    return head.encode("latin-1") + body
@@ -0,0 +1,479 @@
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import pickle
+import threading
+import uuid
+import zlib
+from datetime import datetime
+from decimal import Decimal
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from project.bitcoinz.amount import to_decimal
+from project.bitcoinz.events import EventBus
+from project.bitcoinz.metrics import NULL_METRICS
+from project.bitcoinz.mixer import Mixer
+from project.bitcoinz.scheduler import ScheduledPayout
+from project.bitcoinz.storage import LedgerChanges, SQLiteStorage
+from project.bitcoinz.transaction import Transaction, TransactionPage, parse_timestamp, transaction_dict
+
+logger = logging.getLogger(__name__)
+
+# (sender, receiver, amount in base units, UTC epoch nanoseconds)
+Transfer = Tuple[str, str, int, int]
+
+
+class ShardMixer(Mixer):
+    """
+    The Mixer of one shard, run in a worker process by ShardedMixer.
+
+    A cross-shard send is split in two phases through the house account: apply_transfers() on the sender's
+    shard moves the amount into its house account, then credit_transfers() on the receiver's shard charges the
+    fee and pays out the rest from its house account. The house accounts of all shards sum up to the house
+    account of a single Mixer. Both shards record the transaction in their own wallet's history.
+    Deposits and fees of these transfers are not published on its EventBus, see ShardedMixer.events.
+    """
+    def register_wallet(self, deposit_address: str, private_addresses: List[str]) -> bool:
+        """
+        Create the wallet of a deposit address picked by ShardedMixer.
+
+        Returns:
+            bool: False if the address is already taken.
+        """
+        with self._lock:
+            if self.storage.has_wallet(deposit_address):
+                return False
+            self._register_wallet(deposit_address, private_addresses)
+        return True
+
+    def registered(self, private_addresses: List[str]) -> List[str]:
+        """
+        The private addresses that already belong to a wallet of this shard.
+        """
+        return [address for address in private_addresses if self.storage.wallet_of(address) is not None]
+
+    def apply_transfers(self, local: List[Tuple[str, str, int, int, bool]], prepares: List[Transfer]) -> None:
+        """
+        Commit the shard's part of a batch at once: sends within the shard (or minted) and the prepare
+        phase of sends to other shards. If any sender cannot cover its debits, nothing is committed.
+
+        Args:
+            local (List[Tuple[str, str, int, int, bool]]): (sender, receiver, amount, timestamp_ns, is_minted) rows within the shard.
+            prepares (List[Transfer]): Rows whose sender is in this shard and receiver in another one.
+        """
+        changes = LedgerChanges()
+        payouts = []
+        with self._lock:
+            for sender, receiver, amount, timestamp_ns, is_minted in local:
+                payouts.append((receiver, self._stage_transaction(changes, sender, receiver, amount, timestamp_ns, is_minted)))
+            for sender, receiver, amount, timestamp_ns in prepares:
+                self._stage_debit(changes, sender, amount, False)
+                changes.add_transaction(sender, receiver, amount, timestamp_ns)
+            self.storage.commit(changes)
+
+        for receiver, amount_after_fee in payouts:
+            self._transfer_discrete(receiver, amount_after_fee)
+
+    def credit_transfers(self, credits: List[Transfer]) -> None:
+        """
+        Second phase of sends from other shards: the receivers of this shard are owed the amounts after fees.
+
+        Args:
+            credits (List[Transfer]): Rows prepared on the senders' shards.
+        """
+        changes = LedgerChanges()
+        payouts = []
+        with self._lock:
+            for sender, receiver, amount, timestamp_ns in credits:
+                changes.add_transaction(sender, receiver, amount, timestamp_ns)
+                payouts.append((receiver, self._stage_credit(changes, receiver, amount)))
+            self.storage.commit(changes)
+
+        for receiver, amount_after_fee in payouts:
+            self._transfer_discrete(receiver, amount_after_fee)
+
+    def abort_transfers(self, prepares: List[Transfer]) -> None:
+        """
+        Undo prepared sends whose credit failed: each sender is refunded from the house account and
+        a reversing transaction is recorded.
+
+        Args:
+            prepares (List[Transfer]): Rows passed to apply_transfers().
+        """
+        changes = LedgerChanges()
+        with self._lock:
+            for sender, receiver, amount, timestamp_ns in prepares:
+                self._transfer_amount(changes, self.storage.house_address, sender, amount, False)
+                changes.add_transaction(receiver, sender, amount, timestamp_ns)
+            self.storage.commit(changes)
+
+    def scan_page(self, address: Optional[str], cursor: int, limit: int, since_ns: Optional[int],
+                  until_ns: Optional[int]) -> Tuple[List[Tuple[int, str, str, int]], Optional[int]]:
+        """
+        One page of raw transaction records. When address is None, only transactions received by
+        this shard's wallets are included, so every transaction is listed by exactly one shard.
+
+        Returns:
+            Tuple[List[Tuple[int, str, str, int]], Optional[int]]: (timestamp_ns, fromAddress, toAddress, amount) records and the next cursor.
+        """
+        records = []
+        for position, (from_address, to_address, amount, timestamp_ns) in self.storage.scan_transactions(address, cursor, since_ns, until_ns):
+            if address is None and not self.storage.has_wallet(to_address):
+                continue
+            if len(records) == limit:
+                return records, position
+            records.append((timestamp_ns, from_address, to_address, amount))
+        return records, None
+
+    def counter(self, name: str) -> int:
+        return self.storage.counter(name)
+
+    def owed(self) -> Dict[str, int]:
+        return self.storage.owed()
+
+    def payout_summaries(self, pending: bool) -> List[Tuple[float, int, tuple, bool]]:
+        """
+        Picklable (due, seq, args, done) summaries of pending or completed installments.
+        """
+        payouts = self.pending_payouts() if pending else self.completed_payouts()
+        return [(payout.due, payout.seq, payout.args, payout.is_done()) for payout in payouts]
+
+
+def _serve_shard(conn, options: Dict) -> None:
+    """
+    Worker process loop: execute (method, args) requests on the shard's mixer and reply ("ok", result) or ("error", exception).
+    """
+    storage_path = options.pop("storage_path", None)
+    if storage_path is not None:
+        options["storage"] = SQLiteStorage(storage_path)
+    mixer = ShardMixer(**options)
+    try:
+        while True:
+            try:
+                request = conn.recv()
+            except EOFError:
+                break
+            if request is None:
+                break
+            method, args = request
+            try:
+                reply = ("ok", getattr(mixer, method)(*args))
+            except Exception as e:
+                reply = ("error", e)
+            try:
+                conn.send(reply)
+            except (pickle.PicklingError, TypeError, AttributeError) as e:
+                conn.send(("error", RuntimeError("Unpicklable reply to {}: {}".format(method, e))))
+    finally:
+        mixer.close()
+        conn.close()
+
+
+class ShardedMixer:
+    """
+    A Mixer partitioned across worker processes, so independent sends run on separate CPU cores.
+    Deposit addresses are assigned to shards by hash, int(address, 16) % num_shards.
+
+    Sends within a shard execute locally; sends across shards use a two-phase transfer through the
+    house account (see ShardMixer). Batches are split per shard and every shard commits its part in
+    parallel, so a batch is atomic per shard but not across shards. Offers the interface of Mixer
+    used by BitcoinZNetwork, except events: the shards execute sends and pay installments in their
+    worker processes, whose events and metrics are not forwarded to this process.
+    """
+    def __init__(self, num_shards: Optional[int] = None, fee_percentage: Decimal = Decimal("0.02"),
+                 storage_directory: Optional[str] = None, mp_context=None):
+        """
+        Start the shard processes.
+
+        Args:
+            num_shards (int, optional): Number of worker processes. Defaults to the number of CPUs.
+            fee_percentage (Decimal, optional): Percentage fee to charge per transaction. Defaults to 0.02.
+            storage_directory (str, optional): Keep each shard's ledger in a SQLite database in this directory. Defaults to in memory.
+            mp_context (optional): multiprocessing context to start workers with. Defaults to the default context.
+        """
+        self.num_shards = num_shards or os.cpu_count() or 1
+        self.fee_percentage = Decimal(fee_percentage)
+        context = mp_context if mp_context is not None else multiprocessing.get_context()
+        if storage_directory is not None:
+            os.makedirs(storage_directory, exist_ok=True)
+
+        self._conns = []
+        self._locks = []
+        self._processes = []
+        for shard in range(self.num_shards):
+            options = {"fee_percentage": self.fee_percentage}
+            if storage_directory is not None:
+                options["storage_path"] = os.path.join(storage_directory, "shard-{:03d}.db".format(shard))
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_serve_shard, args=(child_conn, options), name="mixer-shard-{}".format(shard), daemon=True)
+            process.start()
+            child_conn.close()
+            self._conns.append(parent_conn)
+            self._locks.append(threading.Lock())
+            self._processes.append(process)
+        # Known deposit addresses, so existence checks rarely need a round trip
+        self._known: set = set()
+        # Private addresses are checked on every shard, then registered on one; nothing may register in between
+        self._registering = threading.Lock()
+        # Sends and installments are recorded in the shard processes only
+        self.metrics = NULL_METRICS
+
+    @property
+    def events(self) -> EventBus:
+        """
+        Not available: events are published in the shard processes, and nothing forwards them here.
+
+        Raises:
+            NotImplementedError: Always, so subscribers fail loudly instead of never hearing from the mixer.
+        """
+        raise NotImplementedError("A ShardedMixer publishes no events, use a Mixer to subscribe to them")
+
+    def shard_of(self, address: str) -> int:
+        """
+        Shard index of a deposit address.
+
+        Args:
+            address (str): Deposit address.
+
+        Returns:
+            int: Index of the shard owning address.
+        """
+        try:
+            return int(address, 16) % self.num_shards
+        except ValueError:
+            return zlib.crc32(address.encode()) % self.num_shards
+
+    @property
+    def house_balance(self) -> int:
+        return sum(self._broadcast("counter", ("house_balance",)))
+
+    @property
+    def fees_collected(self) -> int:
+        return sum(self._broadcast("counter", ("fees_collected",)))
+
+    @property
+    def minted_coins(self) -> int:
+        return sum(self._broadcast("counter", ("minted_coins",)))
+
+    @property
+    def payouts_owed(self) -> Dict[str, int]:
+        owed = {}
+        for shard_owed in self._broadcast("owed", ()):
+            owed.update(shard_owed)
+        return owed
+
+    def get_balance(self, address: str) -> Decimal:
+        return to_decimal(self.get_balance_units(address))
+
+    def get_balance_units(self, address: str) -> int:
+        return self._call(self.shard_of(address), "get_balance_units", address)
+
+    def get_wallet_balances(self, addresses: Iterable[str]) -> Dict[str, int]:
+        by_shard: Dict[int, List[str]] = {}
+        for address in set(addresses):
+            by_shard.setdefault(self.shard_of(address), []).append(address)
+        balances = {}
+        for shard_balances in self._call_many({shard: ("get_wallet_balances", (group,)) for shard, group in by_shard.items()}).values():
+            balances.update(shard_balances)
+        return balances
+
+    def get_deposit_address(self, private_addresses: List[str]) -> str:
+        """
+        Get a fresh deposit address on the shard it hashes to.
+
+        Args:
+            private_addresses (List[str]): A list of private addresses.
+
+        Raises:
+            ValueError: If a private address is repeated or already registered with another deposit address, on any shard.
+
+        Returns:
+            str: A unique deposit address associated with user's wallet
+        """
+        private_addresses = list(private_addresses)
+        with self._registering:
+            for registered in self._broadcast("registered", (private_addresses,)):
+                if registered:
+                    raise ValueError("Private address {} is already registered".format(registered[0]))
+            while True:
+                new_address = uuid.uuid4().hex
+                if self._call(self.shard_of(new_address), "register_wallet", new_address, private_addresses):
+                    self._known.add(new_address)
+                    return new_address
+
+    def contains_key(self, address: str) -> bool:
+        if address in self._known:
+            return True
+        if self._call(self.shard_of(address), "contains_key", address):
+            self._known.add(address)
+            return True
+        return False
+
+    def execute_transaction(self, transaction: Transaction, is_minted: bool = False) -> None:
+        self.execute_transactions([(transaction, is_minted)])
+
+    def execute_transactions(self, batch: List[Tuple[Transaction, bool]]) -> None:
+        """
+        Execute a batch of validated transactions. Every shard commits its part in parallel, then the
+        receivers' shards are credited with the sends prepared on other shards.
+
+        Args:
+            batch (List[Tuple[Transaction, bool]]): (transaction, is_minted) pairs.
+
+        Raises:
+            InsufficientBalanceException: If a sender could not cover its debits. That sender's shard commits nothing.
+        """
+        local: Dict[int, List[Tuple[str, str, int, int, bool]]] = {}
+        prepares: Dict[int, List[Transfer]] = {}
+        for transaction, is_minted in batch:
+            sender, receiver = transaction.get_from_address(), transaction.get_to_address()
+            row = (sender, receiver, transaction.get_amount(), transaction.timestamp_ns)
+            receiver_shard = self.shard_of(receiver)
+            if is_minted or self.shard_of(sender) == receiver_shard:
+                local.setdefault(receiver_shard, []).append(row + (is_minted,))
+            else:
+                prepares.setdefault(self.shard_of(sender), []).append(row)
+
+        shards = set(local) | set(prepares)
+        replies = self._exchange({shard: ("apply_transfers", (local.get(shard, []), prepares.get(shard, []))) for shard in shards})
+
+        credits: Dict[int, List[Transfer]] = {}
+        for shard, rows in prepares.items():
+            if replies[shard][0] == "ok":
+                for row in rows:
+                    credits.setdefault(self.shard_of(row[1]), []).append(row)
+        if credits:
+            credit_replies = self._exchange({shard: ("credit_transfers", (rows,)) for shard, rows in credits.items()})
+            self._abort_failed_credits(credits, credit_replies)
+
+        errors = [value for status, value in replies.values() if status == "error"]
+        if errors:
+            raise errors[0]
+
+    def _abort_failed_credits(self, credits: Dict[int, List[Transfer]], replies: Dict[int, Tuple[str, Any]]) -> None:
+        aborts: Dict[int, List[Transfer]] = {}
+        for shard, (status, error) in replies.items():
+            if status == "error":
+                logger.error("Crediting shard %d failed, refunding senders: %s", shard, error)
+                for row in credits[shard]:
+                    aborts.setdefault(self.shard_of(row[0]), []).append(row)
+        if aborts:
+            self._call_many({shard: ("abort_transfers", (rows,)) for shard, rows in aborts.items()})
+            raise next(error for status, error in replies.values() if status == "error")
+
+    def get_transactions(self, address: Optional[str]) -> str:
+        if address is not None:
+            return self._call(self.shard_of(address), "get_transactions", address)
+        return str([str(record) for record in self.iter_transactions()])
+
+    def iter_transactions(self, address: Optional[str] = None, cursor: int = 0,
+                          since: Union[datetime, str, int, None] = None, until: Union[datetime, str, int, None] = None) -> Iterator[Dict[str, str]]:
+        """
+        Lazily yields structured records of the transactions associated with address, oldest first.
+        Without address, the shards' transactions are merged by time and cursor counts records to skip.
+        """
+        since_ns = parse_timestamp(since) if since is not None else None
+        until_ns = parse_timestamp(until) if until is not None else None
+        if address is not None:
+            records = self._iter_shard(self.shard_of(address), address, cursor, since_ns, until_ns)
+        else:
+            merged = heapq.merge(*[self._iter_shard(shard, None, 0, since_ns, until_ns) for shard in range(self.num_shards)])
+            records = itertools.islice(merged, max(cursor, 0), None)
+        for timestamp_ns, from_address, to_address, amount in records:
+            yield transaction_dict(from_address, to_address, amount, timestamp_ns)
+
+    def query_transactions(self, address: Optional[str] = None, cursor: int = 0, limit: int = 100,
+                           since: Union[datetime, str, int, None] = None, until: Union[datetime, str, int, None] = None) -> TransactionPage:
+        if address is not None:
+            return self._call(self.shard_of(address), "query_transactions", address, cursor, limit, since, until)
+        records = list(itertools.islice(self.iter_transactions(None, cursor, since, until), limit + 1))
+        if len(records) > limit:
+            return TransactionPage(records[:limit], max(cursor, 0) + limit)
+        return TransactionPage(records, None)
+
+    def dump_transactions(self, fp: IO[str], address: Optional[str] = None,
+                          since: Union[datetime, str, int, None] = None, until: Union[datetime, str, int, None] = None) -> int:
+        written = 0
+        for record in self.iter_transactions(address, since=since, until=until):
+            fp.write(json.dumps(record))
+            fp.write("\n")
+            written += 1
+        return written
+
+    def get_fees_collected(self) -> Decimal:
+        return to_decimal(self.fees_collected)
+
+    def pending_payouts(self) -> List[ScheduledPayout]:
+        return self._payout_handles(True)
+
+    def completed_payouts(self) -> List[ScheduledPayout]:
+        return self._payout_handles(False)
+
+    def wait_for_payouts(self, timeout: Optional[float] = None) -> bool:
+        return all(self._broadcast("wait_for_payouts", (timeout,)))
+
+    def close(self, drain: bool = True) -> None:
+        """
+        Stop the shard processes.
+
+        Args:
+            drain (bool, optional): Pay out scheduled installments first. Defaults to True.
+        """
+        if drain:
+            self.wait_for_payouts()
+        for conn, lock in zip(self._conns, self._locks):
+            with lock:
+                conn.send(None)
+                conn.close()
+        for process in self._processes:
+            process.join()
+
+    def _payout_handles(self, pending: bool) -> List[ScheduledPayout]:
+        # Detached copies of the shards' installments; they cannot be waited on
+        handles = []
+        for summaries in self._broadcast("payout_summaries", (pending,)):
+            for due, seq, args, done in summaries:
+                payout = ScheduledPayout(due, seq, None, args)
+                if done:
+                    payout._done.set()
+                handles.append(payout)
+        return sorted(handles) if pending else handles
+
+    def _iter_shard(self, shard: int, address: Optional[str], cursor: Optional[int],
+                    since_ns: Optional[int], until_ns: Optional[int], page_size: int = 1000) -> Iterator[Tuple[int, str, str, int]]:
+        while cursor is not None:
+            records, cursor = self._call(shard, "scan_page", address, cursor, page_size, since_ns, until_ns)
+            yield from records
+
+    def _call(self, shard: int, method: str, *args) -> Any:
+        return self._call_many({shard: (method, args)})[shard]
+
+    def _broadcast(self, method: str, args: tuple) -> List[Any]:
+        replies = self._call_many({shard: (method, args) for shard in range(self.num_shards)})
+        return [replies[shard] for shard in range(self.num_shards)]
+
+    def _call_many(self, calls: Dict[int, Tuple[str, tuple]]) -> Dict[int, Any]:
+        replies = self._exchange(calls)
+        for status, value in replies.values():
+            if status == "error":
+                raise value
+        return {shard: value for shard, (status, value) in replies.items()}
+
+    def _exchange(self, calls: Dict[int, Tuple[str, tuple]]) -> Dict[int, Tuple[str, Any]]:
+        """
+        Send one request to each shard, then collect the replies, so the shards work in parallel.
+        Shard locks are taken in index order to avoid deadlocks between threads.
+        """
+        shards = sorted(calls)
+        for shard in shards:
+            self._locks[shard].acquire()
+        try:
+            for shard in shards:
+                self._conns[shard].send(calls[shard])
+            return {shard: self._conns[shard].recv() for shard in shards}
+        finally:
+            for shard in shards:
+                self._locks[shard].release()
@@ -0,0 +1,159 @@
+import random
+from array import array
+from itertools import accumulate
+from typing import List, Optional, Sequence, Tuple
+
+# Weights are drawn as 32-bit integers, keeping splits exact without going through floats
+_WEIGHT_BITS = 32
+_WEIGHT_RANGE = 1 << _WEIGHT_BITS
+# Typecode of an array of unsigned 32-bit integers, "I" on all mainstream platforms
+_UINT32 = next(code for code in "IL" if array(code).itemsize == 4)
+
+
+def _random_words(rng: random.Random, count: int) -> array:
+    """
+    count uniform random 32-bit integers, drawn with one call to the generator instead of one per value.
+    """
+    words = array(_UINT32)
+    if count:
+        words.frombytes(rng.getrandbits(_WEIGHT_BITS * count).to_bytes(4 * count, "little"))
+    return words
+
+
+class Distribution:
+    """
+    How an amount is shared among the installments of a split: draws integer weights, to which the
+    installments are proportional.
+    """
+    def weights(self, rng: random.Random, counts: Sequence[int]) -> List[Sequence[int]]:
+        """
+        Draw the weights of many splits at once.
+
+        Args:
+            rng (random.Random): Source of randomness.
+            counts (Sequence[int]): Number of installments per split, each at least 1.
+
+        Returns:
+            List[Sequence[int]]: Non-negative integer weights per split, one per installment.
+        """
+        raise NotImplementedError
+
+
+class UniformWeights(Distribution):
+    """
+    Independent uniform weights per installment. Installments are rarely tiny, e.g. mostly within 10% and
+    90% of the amount for two installments.
+    """
+    def weights(self, rng: random.Random, counts: Sequence[int]) -> List[Sequence[int]]:
+        words = _random_words(rng, sum(counts))
+        splits = []
+        offset = 0
+        for count in counts:
+            splits.append(words[offset:offset + count])
+            offset += count
+        return splits
+
+
+class UniformBreakpoints(Distribution):
+    """
+    Cuts the amount at count - 1 uniform random points, making every split equally likely (a flat Dirichlet).
+    Installments vary more than with UniformWeights.
+    """
+    def weights(self, rng: random.Random, counts: Sequence[int]) -> List[Sequence[int]]:
+        words = _random_words(rng, sum(counts) - len(counts))
+        splits = []
+        offset = 0
+        for count in counts:
+            cuts = sorted(words[offset:offset + count - 1])
+            cuts.append(_WEIGHT_RANGE)
+            splits.append([cut - previous for previous, cut in zip([0] + cuts, cuts)])
+            offset += count - 1
+        return splits
+
+
+class Dirichlet(Distribution):
+    """
+    Weights drawn from a symmetric Dirichlet distribution. A concentration alpha above 1 makes installments
+    more even, below 1 more lopsided; 1 is the same as UniformBreakpoints.
+    """
+    def __init__(self, alpha: float = 1.0):
+        """
+        Args:
+            alpha (float, optional): Concentration, greater than 0. Defaults to 1.
+        """
+        if alpha <= 0:
+            raise ValueError("Dirichlet concentration must be positive, not {}".format(alpha))
+        self.alpha = alpha
+
+    def weights(self, rng: random.Random, counts: Sequence[int]) -> List[Sequence[int]]:
+        splits = []
+        for count in counts:
+            draws = [rng.gammavariate(self.alpha, 1.0) for _ in range(count)]
+            total = sum(draws)
+            splits.append([int(draw * _WEIGHT_RANGE / total) for draw in draws] if total > 0 else [1] * count)
+        return splits
+
+
+class InstallmentSplitter:
+    """
+    Splits amounts into random installments of integer base units that sum exactly to the amount, each of
+    at least min_installment. An amount too small for that many minimums is split into fewer installments.
+
+    split_many() splits a whole batch with one draw of random weights, see Distribution.
+    """
+    def __init__(self, distribution: Optional[Distribution] = None, min_installment: int = 1,
+                 rng: Optional[random.Random] = None):
+        """
+        Args:
+            distribution (Distribution, optional): How amounts are shared among installments. Defaults to UniformWeights.
+            min_installment (int, optional): Smallest installment in base units. Defaults to 1, i.e. no empty installments.
+            rng (random.Random, optional): Source of randomness, e.g. seeded for benchmarks. Defaults to an unseeded Random.
+        """
+        if min_installment < 0:
+            raise ValueError("Minimum installment cannot be negative")
+        self.distribution = distribution if distribution is not None else UniformWeights()
+        self.min_installment = min_installment
+        self.rng = rng if rng is not None else random.Random()
+
+    def split(self, units: int, n: int) -> List[int]:
+        """
+        Split an amount into up to n installments.
+
+        Args:
+            units (int): Amount in base units.
+            n (int): Number of installments wanted.
+
+        Returns:
+            List[int]: Installments in base units, e.g. [20, 65, 15] for 100.
+        """
+        return self.split_many([(units, n)])[0]
+
+    def split_many(self, amounts: Sequence[Tuple[int, int]]) -> List[List[int]]:
+        """
+        Split many amounts at once.
+
+        Args:
+            amounts (Sequence[Tuple[int, int]]): (amount in base units, number of installments wanted) per split.
+
+        Returns:
+            List[List[int]]: Installments per split.
+        """
+        floor = self.min_installment
+        counts = [max(1, min(n, units // floor)) if floor else max(n, 1) for units, n in amounts]
+        weights = self.distribution.weights(self.rng, counts)
+        splits = []
+        for (units, _), count, split_weights in zip(amounts, counts, weights):
+            if count == 1:
+                splits.append([units])
+                continue
+            # Cut the amount at the cumulative weights, rounded down: shares sum exactly to the amount
+            # and each is within one base unit of its exact proportion
+            units -= floor * count
+            bounds = list(accumulate(split_weights))
+            total = bounds[-1]
+            if total == 0:
+                bounds = [0] * (count - 1) + [units]
+            else:
+                bounds = [units * bound // total for bound in bounds]
+            splits.append([bound - previous + floor for previous, bound in zip([0] + bounds, bounds)])
+        return splits
@@ -0,0 +1,617 @@
+import base64
+import json
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from project.bitcoinz.concurrency import StripedLock, ThreadLocalCounter
+from project.bitcoinz.exceptions import InsufficientBalanceException
+from project.bitcoinz.ledger import TransactionLog
+from project.bitcoinz.transaction import Transaction
+from project.bitcoinz.wallet import Wallet
+
+# (fromAddress, toAddress, amount in base units, UTC epoch nanoseconds)
+TransactionRecord = Tuple[str, str, int, int]
+
+HOUSE_BALANCE = "house_balance"
+FEES_COLLECTED = "fees_collected"
+MINTED_COINS = "minted_coins"
+COUNTERS = (HOUSE_BALANCE, FEES_COLLECTED, MINTED_COINS)
+
+
+class LedgerChanges:
+    """
+    A batch of changes to the ledger, applied by LedgerStorage.commit() all at once.
+    Balance, counter, owed and payout changes are accumulated as deltas per key.
+    """
+    def __init__(self):
+        self.balances: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+        self.owed: Dict[str, int] = {}
+        self.payouts: Dict[str, int] = {}
+        self.transactions: List[TransactionRecord] = []
+
+    def add_balance(self, address: str, delta: int) -> None:
+        self.balances[address] = self.balances.get(address, 0) + delta
+
+    def add_counter(self, name: str, delta: int) -> None:
+        self.counters[name] = self.counters.get(name, 0) + delta
+
+    def add_owed(self, address: str, delta: int) -> None:
+        self.owed[address] = self.owed.get(address, 0) + delta
+
+    def add_payout(self, private_address: str, delta: int) -> None:
+        self.payouts[private_address] = self.payouts.get(private_address, 0) + delta
+
+    def add_transaction(self, from_address: str, to_address: str, amount: int, timestamp_ns: int) -> None:
+        self.transactions.append((from_address, to_address, amount, timestamp_ns))
+
+
+class LedgerStorage:
+    """
+    Interface of the storage behind a Mixer: wallets and their balances, the transaction history,
+    the house/fee/minted counters, what is still owed to receivers and what was paid out to each private
+    address. All amounts are in base units.
+
+    A wallet's balance is what its private addresses hold together, so a payout to a private address
+    credits both the address and its wallet. Every private address belongs to one wallet only, and
+    wallet_of() finds it without scanning the wallets.
+    """
+    house_address: str
+    # If commit() and the reads may be called from several threads without the Mixer's lock
+    thread_safe = False
+
+    def add_wallet(self, deposit_address: str, private_addresses: List[str]) -> None:
+        """
+        Store a new wallet with zero balance.
+
+        Raises:
+            ValueError: If a private address is repeated or already belongs to another wallet. Nothing is stored.
+        """
+        raise NotImplementedError
+
+    def has_wallet(self, address: str) -> bool:
+        """
+        If a wallet exists for deposit address.
+        """
+        raise NotImplementedError
+
+    def private_addresses(self, address: str) -> List[str]:
+        """
+        Private addresses of the wallet of deposit address.
+        """
+        raise NotImplementedError
+
+    def wallet_of(self, private_address: str) -> Optional[str]:
+        """
+        Deposit address of the wallet a private address belongs to, None if it is not registered.
+        """
+        raise NotImplementedError
+
+    def balance(self, address: str) -> int:
+        """
+        Balance of the wallet of deposit address, 0 if it does not exist.
+        """
+        raise NotImplementedError
+
+    def received(self, private_address: str) -> int:
+        """
+        Total paid out to a private address, 0 if nothing was.
+        """
+        raise NotImplementedError
+
+    def counter(self, name: str) -> int:
+        """
+        Value of one of COUNTERS.
+        """
+        raise NotImplementedError
+
+    def owed(self) -> Dict[str, int]:
+        """
+        Amount still to be paid out per receiver.
+        """
+        raise NotImplementedError
+
+    def num_wallets(self) -> int:
+        raise NotImplementedError
+
+    def num_transactions(self) -> int:
+        raise NotImplementedError
+
+    def commit(self, changes: LedgerChanges) -> None:
+        """
+        Apply changes atomically.
+
+        Raises:
+            InsufficientBalanceException: If a wallet balance would become negative. Nothing is applied.
+        """
+        raise NotImplementedError
+
+    def scan_transactions(self, address: Optional[str], cursor: int, since_ns: Optional[int],
+                          until_ns: Optional[int]) -> Iterator[Tuple[int, TransactionRecord]]:
+        """
+        Yields (cursor, record) pairs of the transactions of address (all if None) within [since_ns, until_ns),
+        oldest first, starting at cursor. A yielded cursor resumes the scan at its record.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class InMemoryStorage(LedgerStorage):
+    """
+    Ledger held in process memory: Wallet objects indexing into a columnar TransactionLog.
+    """
+    def __init__(self):
+        self.house_address = uuid.uuid4().hex
+        self.wallets: Dict[str, Wallet] = dict()
+        # Deposit address of the wallet per private address
+        self.owners: Dict[str, str] = {}
+        self.log = TransactionLog()
+        self.counters: Dict[str, int] = {name: 0 for name in COUNTERS}
+        self.payouts_owed: Dict[str, int] = {}
+        self.payouts_received: Dict[str, int] = {}
+
+    def add_wallet(self, deposit_address: str, private_addresses: List[str]) -> None:
+        owners = self.owners
+        if len(set(private_addresses)) != len(private_addresses):
+            raise ValueError("Private addresses must be unique: {}".format(", ".join(private_addresses)))
+        for address in private_addresses:
+            if address in owners:
+                raise ValueError("Private address {} is already registered".format(address))
+        self.wallets[deposit_address] = Wallet(private_addresses, deposit_address, self.log)
+        for address in private_addresses:
+            owners[address] = deposit_address
+
+    def has_wallet(self, address: str) -> bool:
+        return address in self.wallets
+
+    def private_addresses(self, address: str) -> List[str]:
+        return self.wallets[address].private_addresses
+
+    def wallet_of(self, private_address: str) -> Optional[str]:
+        return self.owners.get(private_address)
+
+    def balance(self, address: str) -> int:
+        wallet = self.wallets.get(address)
+        return wallet.get_balance() if wallet is not None else 0
+
+    def received(self, private_address: str) -> int:
+        return self.payouts_received.get(private_address, 0)
+
+    def counter(self, name: str) -> int:
+        return self.counters[name]
+
+    def owed(self) -> Dict[str, int]:
+        return dict(self.payouts_owed)
+
+    def num_wallets(self) -> int:
+        return len(self.wallets)
+
+    def num_transactions(self) -> int:
+        return len(self.log)
+
+    def commit(self, changes: LedgerChanges) -> None:
+        self._apply(changes)
+        for name, delta in changes.counters.items():
+            self.counters[name] += delta
+
+    def _apply(self, changes: LedgerChanges) -> None:
+        """
+        Apply the wallet, transaction and owed changes of a commit.
+        """
+        wallets = self.wallets
+        for address, delta in changes.balances.items():
+            if delta < 0 and wallets[address].get_balance() + delta < 0:
+                raise InsufficientBalanceException()
+
+        for address, delta in changes.balances.items():
+            if delta < 0:
+                wallets[address].decrease_balance(-delta)
+            else:
+                wallets[address].increase_balance(delta)
+
+        for from_address, to_address, amount, timestamp_ns in changes.transactions:
+            transaction = Transaction.at(self.log, self._append_transaction(from_address, to_address, amount, timestamp_ns))
+            # Either side may live in another shard, see project.bitcoinz.sharding
+            if from_address in wallets:
+                wallets[from_address].add_transaction(transaction)
+            if to_address in wallets:
+                wallets[to_address].add_transaction(transaction)
+
+        for address, delta in changes.owed.items():
+            owed = self.payouts_owed.get(address, 0) + delta
+            if owed > 0:
+                self.payouts_owed[address] = owed
+            else:
+                self.payouts_owed.pop(address, None)
+
+        for address, delta in changes.payouts.items():
+            self.payouts_received[address] = self.payouts_received.get(address, 0) + delta
+
+    def _append_transaction(self, from_address: str, to_address: str, amount: int, timestamp_ns: int) -> int:
+        return self.log.append(from_address, to_address, amount, timestamp_ns)
+
+    def scan_transactions(self, address: Optional[str], cursor: int, since_ns: Optional[int],
+                          until_ns: Optional[int]) -> Iterator[Tuple[int, TransactionRecord]]:
+        log = self.log
+        if address is None:
+            rows = None
+            end = len(log)
+        elif address in self.wallets:
+            rows = self.wallets[address].transactions
+            end = len(rows)
+        else:
+            return
+
+        # Log rows are sorted by time, so the range bounds are found by binary search
+        if until_ns is not None:
+            end = log.bisect_timestamp(until_ns, rows, end)
+        start = max(cursor, 0)
+        if since_ns is not None:
+            start = max(start, log.bisect_timestamp(since_ns, rows, end))
+
+        for position in range(start, end):
+            row = rows[position] if rows is not None else position
+            yield position, (log.from_address(row), log.to_address(row), log.amounts[row], log.timestamps[row])
+
+    def snapshot_state(self) -> Dict:
+        """
+        Compact, JSON-serializable copy of the ledger. Transaction log columns and wallet indexes are stored
+        as base64 encoded packed arrays.
+
+        Returns:
+            Dict: Ledger state, see restore_state().
+        """
+        log = self.log
+        addresses = log.addresses
+        return {
+            "byteorder": sys.byteorder,
+            "house_address": self.house_address,
+            "counters": {name: self.counter(name) for name in COUNTERS},
+            "payouts_owed": dict(self.payouts_owed),
+            "payouts_received": dict(self.payouts_received),
+            "addresses": [addresses.address(i) for i in range(len(addresses))],
+            "columns": {name: _encode_array(getattr(log, name)) for name in ("from_ids", "to_ids", "amounts", "timestamps")},
+            "wallets": [[wallet.deposit_address, wallet.private_addresses, wallet.balance, _encode_array(wallet.transactions)]
+                        for wallet in self.wallets.values()],
+        }
+
+    def restore_state(self, state: Dict) -> None:
+        """
+        Replace the ledger with a copy taken by snapshot_state().
+
+        Args:
+            state (Dict): Ledger state.
+        """
+        swap = state["byteorder"] != sys.byteorder
+        self.house_address = state["house_address"]
+        self.counters = dict(state["counters"])
+        self.payouts_owed = dict(state["payouts_owed"])
+        # Snapshots taken before payouts went to private addresses have none
+        self.payouts_received = dict(state.get("payouts_received", {}))
+
+        log = self.log = TransactionLog()
+        for address in state["addresses"]:
+            log.addresses.intern(address)
+        for name, encoded in state["columns"].items():
+            setattr(log, name, _decode_array(encoded, swap))
+
+        self.wallets = dict()
+        self.owners = {}
+        for deposit_address, private_addresses, balance, rows in state["wallets"]:
+            wallet = self.wallets[deposit_address] = Wallet(private_addresses, deposit_address, log)
+            wallet.balance = balance
+            wallet.transactions = _decode_array(rows, swap)
+            for address in private_addresses:
+                self.owners[address] = deposit_address
+
+
+class StripedInMemoryStorage(InMemoryStorage):
+    """
+    InMemoryStorage that many threads can commit to at once. A commit locks only the stripes of the
+    wallets it touches (see StripedLock), checks and debits the senders' balances while holding them and
+    adds its house, fee and minted totals to per-thread counters that are merged when read.
+    """
+    thread_safe = True
+
+    def __init__(self, stripes: int = 64):
+        """
+        Args:
+            stripes (int, optional): Number of wallet locks. Defaults to 64.
+        """
+        super().__init__()
+        self.stripes = StripedLock(stripes)
+        self._log_lock = threading.Lock()
+        self._totals = {name: ThreadLocalCounter() for name in COUNTERS}
+
+    def add_wallet(self, deposit_address: str, private_addresses: List[str]) -> None:
+        # The stripes of the private addresses serialize registrations of the same address
+        with self.stripes.acquire([deposit_address] + list(private_addresses)):
+            super().add_wallet(deposit_address, private_addresses)
+
+    def counter(self, name: str) -> int:
+        return self._totals[name].value()
+
+    def owed(self) -> Dict[str, int]:
+        with self.stripes.acquire_all():
+            return dict(self.payouts_owed)
+
+    def commit(self, changes: LedgerChanges) -> None:
+        touched = set(changes.balances)
+        touched.update(changes.owed)
+        touched.update(changes.payouts)
+        for from_address, to_address, _, _ in changes.transactions:
+            touched.add(from_address)
+            touched.add(to_address)
+        with self.stripes.acquire(touched):
+            self._apply(changes)
+        for name, delta in changes.counters.items():
+            self._totals[name].add(delta)
+
+    def _append_transaction(self, from_address: str, to_address: str, amount: int, timestamp_ns: int) -> int:
+        with self._log_lock:
+            return self.log.append(from_address, to_address, amount, timestamp_ns)
+
+    def snapshot_state(self) -> Dict:
+        with self.stripes.acquire_all():
+            return super().snapshot_state()
+
+    def restore_state(self, state: Dict) -> None:
+        with self.stripes.acquire_all():
+            super().restore_state(state)
+            for name, counter in self._totals.items():
+                counter.reset(self.counters[name])
+
+
+def _encode_array(values: array) -> str:
+    return base64.b64encode(values.tobytes()).decode("ascii")
+
+
+def _decode_array(encoded: str, swap: bool) -> array:
+    values = array('q')
+    values.frombytes(base64.b64decode(encoded))
+    if swap:
+        values.byteswap()
+    return values
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS wallets (
+    address TEXT PRIMARY KEY,
+    private_addresses TEXT NOT NULL,
+    balance INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS transactions (
+    id INTEGER PRIMARY KEY,
+    from_address TEXT NOT NULL,
+    to_address TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    timestamp_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_from_address ON transactions (from_address, id);
+CREATE INDEX IF NOT EXISTS transactions_to_address ON transactions (to_address, id);
+CREATE INDEX IF NOT EXISTS transactions_timestamp ON transactions (timestamp_ns);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS payouts_owed (address TEXT PRIMARY KEY, amount INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS private_addresses (
+    address TEXT PRIMARY KEY,
+    wallet TEXT NOT NULL,
+    received INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+_SCAN_COLUMNS = "SELECT id, from_address, to_address, amount, timestamp_ns FROM transactions"
+_SCAN_RANGE = "id >= ? AND timestamp_ns >= ? AND timestamp_ns < ?"
+_SCAN_ALL = "{} WHERE {} ORDER BY id LIMIT ?".format(_SCAN_COLUMNS, _SCAN_RANGE)
+# The UNION lets each half use its own address index
+_SCAN_ADDRESS = "{0} WHERE from_address = ? AND {1} UNION {0} WHERE to_address = ? AND {1} ORDER BY id LIMIT ?".format(
+    _SCAN_COLUMNS, _SCAN_RANGE)
+
+
+class SQLiteStorage(LedgerStorage):
+    """
+    Ledger stored in a SQLite database in WAL mode, so several processes on one host can share it and
+    it can grow beyond memory. Every commit is a single IMMEDIATE transaction of batched statements;
+    sqlite3 keeps the prepared statements of the constant SQL below in its statement cache.
+
+    Wallet balances are served from a bounded in-process LRU cache. Commits of this connection update it
+    in place; it is dropped once another connection has committed to the database, which is checked through
+    PRAGMA data_version at most every validate_interval seconds. So a balance read here can miss another
+    process's commit for up to validate_interval seconds. Commits check and debit balances in SQL, so a stale
+    read can at worst let a send pass the fail-fast check and then fail on commit, never overdraw a wallet.
+    """
+    SCAN_CHUNK = 1000
+    thread_safe = True
+
+    def __init__(self, path: str, cache_size: int = 10000, timeout: float = 30.0, validate_interval: float = 0.1):
+        """
+        Open (and create if needed) a ledger database.
+
+        Args:
+            path (str): Database file path.
+            cache_size (int, optional): Maximum number of cached wallet balances. Defaults to 10000.
+            timeout (float, optional): Seconds to wait for another process's write lock. Defaults to 30.
+            validate_interval (float, optional): Seconds between checks for other connections' commits; 0 checks
+                on every read. Defaults to 0.1.
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.validate_interval = validate_interval
+        self._validated_at = time.monotonic()
+        self._lock = threading.RLock()
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.executemany("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", [(name,) for name in COUNTERS])
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('house_address', ?)", (uuid.uuid4().hex,))
+            if self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('private_index', '1')").rowcount == 1:
+                # Index the private addresses of wallets created before the private_addresses table existed
+                self._conn.executemany("INSERT OR IGNORE INTO private_addresses (address, wallet) VALUES (?, ?)",
+                                       [(private_address, address)
+                                        for address, private_addresses in self._conn.execute("SELECT address, private_addresses FROM wallets").fetchall()
+                                        for private_address in json.loads(private_addresses)])
+            self._conn.execute("COMMIT")
+            self.house_address = self._conn.execute("SELECT value FROM meta WHERE key = 'house_address'").fetchone()[0]
+            self._data_version = self._fetch_data_version()
+
+    def add_wallet(self, deposit_address: str, private_addresses: List[str]) -> None:
+        conn = self._conn
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("INSERT INTO wallets (address, private_addresses) VALUES (?, ?)",
+                             (deposit_address, json.dumps(list(private_addresses))))
+                try:
+                    conn.executemany("INSERT INTO private_addresses (address, wallet) VALUES (?, ?)",
+                                     [(address, deposit_address) for address in private_addresses])
+                except sqlite3.IntegrityError:
+                    raise ValueError("Private addresses must be unique and not registered yet: {}".format(", ".join(private_addresses)))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self._cache_put(deposit_address, 0)
+
+    def has_wallet(self, address: str) -> bool:
+        with self._lock:
+            self._validate_cache()
+            if address in self._cache:
+                return True
+            row = self._conn.execute("SELECT balance FROM wallets WHERE address = ?", (address,)).fetchone()
+            if row is None:
+                return False
+            self._cache_put(address, row[0])
+            return True
+
+    def private_addresses(self, address: str) -> List[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT private_addresses FROM wallets WHERE address = ?", (address,)).fetchone()
+        if row is None:
+            raise KeyError(address)
+        return json.loads(row[0])
+
+    def wallet_of(self, private_address: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT wallet FROM private_addresses WHERE address = ?", (private_address,)).fetchone()
+        return row[0] if row is not None else None
+
+    def balance(self, address: str) -> int:
+        with self._lock:
+            self._validate_cache()
+            balance = self._cache.get(address)
+            if balance is not None:
+                self._cache.move_to_end(address)
+                return balance
+            row = self._conn.execute("SELECT balance FROM wallets WHERE address = ?", (address,)).fetchone()
+            if row is None:
+                return 0
+            self._cache_put(address, row[0])
+            return row[0]
+
+    def received(self, private_address: str) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT received FROM private_addresses WHERE address = ?", (private_address,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def counter(self, name: str) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+
+    def owed(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._conn.execute("SELECT address, amount FROM payouts_owed"))
+
+    def num_wallets(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM wallets").fetchone()[0]
+
+    def num_transactions(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+    def commit(self, changes: LedgerChanges) -> None:
+        debits = [(delta, address, delta) for address, delta in changes.balances.items() if delta < 0]
+        credits = [(delta, address) for address, delta in changes.balances.items() if delta >= 0]
+        conn = self._conn
+        with self._lock:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Check-and-debit in one statement, so concurrent processes can never overdraw a wallet
+                for debit in debits:
+                    if conn.execute("UPDATE wallets SET balance = balance + ? WHERE address = ? AND balance + ? >= 0", debit).rowcount != 1:
+                        raise InsufficientBalanceException()
+                conn.executemany("UPDATE wallets SET balance = balance + ? WHERE address = ?", credits)
+                conn.executemany("INSERT INTO transactions (from_address, to_address, amount, timestamp_ns) VALUES (?, ?, ?, ?)",
+                                 changes.transactions)
+                conn.executemany("UPDATE counters SET value = value + ? WHERE name = ?",
+                                 [(delta, name) for name, delta in changes.counters.items()])
+                if changes.owed:
+                    conn.executemany("INSERT OR IGNORE INTO payouts_owed (address, amount) VALUES (?, 0)", [(a,) for a in changes.owed])
+                    conn.executemany("UPDATE payouts_owed SET amount = amount + ? WHERE address = ?",
+                                     [(delta, address) for address, delta in changes.owed.items()])
+                    conn.execute("DELETE FROM payouts_owed WHERE amount <= 0")
+                conn.executemany("UPDATE private_addresses SET received = received + ? WHERE address = ?",
+                                 [(delta, address) for address, delta in changes.payouts.items()])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+            # data_version only changes with other connections' commits, so this one's stay in the cache
+            for address, delta in changes.balances.items():
+                if address in self._cache:
+                    self._cache[address] += delta
+
+    def scan_transactions(self, address: Optional[str], cursor: int, since_ns: Optional[int],
+                          until_ns: Optional[int]) -> Iterator[Tuple[int, TransactionRecord]]:
+        # Cursors are transaction ids. Rows are fetched in chunks so no statement stays open while iterating.
+        since_ns = since_ns if since_ns is not None else -2 ** 63
+        until_ns = until_ns if until_ns is not None else 2 ** 63 - 1
+        next_id = max(cursor, 0)
+        while True:
+            with self._lock:
+                if address is None:
+                    rows = self._conn.execute(_SCAN_ALL, (next_id, since_ns, until_ns, self.SCAN_CHUNK)).fetchall()
+                else:
+                    rows = self._conn.execute(_SCAN_ADDRESS, (address, next_id, since_ns, until_ns,
+                                                              address, next_id, since_ns, until_ns, self.SCAN_CHUNK)).fetchall()
+            for row in rows:
+                yield row[0], tuple(row[1:])
+            if len(rows) < self.SCAN_CHUNK:
+                return
+            next_id = rows[-1][0] + 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _fetch_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _validate_cache(self) -> None:
+        now = time.monotonic()
+        if now - self._validated_at < self.validate_interval:
+            return
+        self._validated_at = now
+        data_version = self._fetch_data_version()
+        if data_version != self._data_version:
+            self._cache.clear()
+            self._data_version = data_version
+
+    def _cache_put(self, address: str, balance: int) -> None:
+        self._cache[address] = balance
+        self._cache.move_to_end(address)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
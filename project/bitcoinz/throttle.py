@@ -0,0 +1,184 @@
+import threading
+import time
+from typing import Callable, Optional
+
+import requests
+
+# Names of the Jobcoin API endpoints, the keys of the throttles of a JobcoinClient
+CREATE = "create"
+POST_TRANSACTION = "post_transaction"
+GET_TRANSACTIONS = "get_transactions"
+GET_ADDRESS = "get_address"
+
+
+class TokenBucket:
+    """
+    Allows rate calls per second on average, with bursts of up to burst calls. Callers beyond that reserve
+    a future token and sleep until it is due, so waiting callers are served in arrival order.
+    """
+    def __init__(self, rate: float, burst: Optional[float] = None, clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Args:
+            rate (float): Tokens added per second.
+            burst (float, optional): Tokens held at most. Defaults to rate, at least 1.
+            clock (Callable[[], float], optional): Monotonic clock returning seconds. Defaults to time.monotonic.
+            sleep (Callable[[float], None], optional): Waits for the given seconds. Defaults to time.sleep.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take a token, waiting until one is available.
+
+        Returns:
+            float: Seconds waited.
+        """
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class AdaptiveLimiter:
+    """
+    Limits the calls in flight at once, adapting the limit AIMD-style: every call completing normally
+    raises it by 1/limit (about one per limit calls), and an overloaded one multiplies it by backoff, at
+    most once per round trip so one burst of failures does not collapse it.
+
+    A call counts as overloaded if the caller says so (e.g. it was throttled or failed) or if it took more
+    than latency_tolerance times the baseline, the lowest latency in the current or previous window of
+    window calls, so the limit also backs off when the server starts queueing before it starts failing.
+    """
+    def __init__(self, initial_limit: int = 8, min_limit: int = 1, max_limit: int = 64, backoff: float = 0.5,
+                 latency_tolerance: float = 2.0, window: int = 100, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            initial_limit (int, optional): Calls in flight allowed at first. Defaults to 8.
+            min_limit (int, optional): Lowest limit. Defaults to 1.
+            max_limit (int, optional): Highest limit. Defaults to 64.
+            backoff (float, optional): Factor the limit is multiplied by when overloaded. Defaults to 0.5.
+            latency_tolerance (float, optional): Latency over the baseline that counts as overloaded, None to ignore latency. Defaults to 2.
+            window (int, optional): Calls per window of the latency baseline. Defaults to 100.
+            clock (Callable[[], float], optional): Monotonic clock returning seconds. Defaults to time.monotonic.
+        """
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_tolerance = latency_tolerance
+        self.window = window
+        self.clock = clock
+        self.in_flight = 0
+        self._window_min = float("inf")
+        self._previous_min = float("inf")
+        self._window_count = 0
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+
+    @property
+    def baseline(self) -> float:
+        """
+        Lowest latency of the current and previous window, inf before the first call.
+        """
+        return min(self._window_min, self._previous_min)
+
+    def acquire(self) -> None:
+        """
+        Wait until fewer calls than the limit are in flight, and count the caller's call in.
+        """
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, latency: float, overloaded: bool = False) -> None:
+        """
+        Count a call acquired before out, and adapt the limit to how it went.
+
+        Args:
+            latency (float): Seconds the call took.
+            overloaded (bool, optional): If the call was throttled or failed. Defaults to False.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if self.latency_tolerance is not None and not overloaded:
+                overloaded = latency > self.latency_tolerance * self.baseline
+            self._observe(latency)
+            if overloaded:
+                now = self.clock()
+                if now - self._last_decrease >= latency:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                    self._last_decrease = now
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
+    def _observe(self, latency: float) -> None:
+        self._window_min = min(self._window_min, latency)
+        self._window_count += 1
+        if self._window_count >= self.window:
+            self._previous_min, self._window_min, self._window_count = self._window_min, float("inf"), 0
+
+
+class Throttle:
+    """
+    Client-side flow control of one endpoint: an optional TokenBucket capping the request rate, and an
+    AdaptiveLimiter capping the requests in flight. Responses with 429 or a 5xx status and failed
+    requests count as overloaded.
+    """
+    def __init__(self, rate: Optional[float] = None, burst: Optional[float] = None,
+                 limiter: Optional[AdaptiveLimiter] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate (float, optional): Requests per second allowed, None for no cap. Defaults to None.
+            burst (float, optional): Burst size of the rate cap. Defaults to rate.
+            limiter (AdaptiveLimiter, optional): Limiter of the requests in flight. Defaults to an AdaptiveLimiter with its defaults.
+            clock (Callable[[], float], optional): Monotonic clock returning seconds. Defaults to time.monotonic.
+        """
+        self.bucket = TokenBucket(rate, burst, clock) if rate is not None else None
+        self.limiter = limiter if limiter is not None else AdaptiveLimiter(clock=clock)
+        self.clock = clock
+        # Requests answered as overloaded, and seconds spent waiting for tokens
+        self.num_overloaded = 0
+        self.waited = 0.0
+        # Callers share the throttle, and += on an attribute is not atomic
+        self._lock = threading.Lock()
+
+    def call(self, send: Callable[[], requests.Response]) -> requests.Response:
+        """
+        Send a request once the rate cap and the limiter allow it.
+
+        Args:
+            send (Callable[[], requests.Response]): Issues the request.
+
+        Returns:
+            requests.Response: Its response.
+        """
+        if self.bucket is not None:
+            waited = self.bucket.acquire()
+            with self._lock:
+                self.waited += waited
+        self.limiter.acquire()
+        start = self.clock()
+        overloaded = True
+        try:
+            response = send()
+            overloaded = response.status_code == 429 or response.status_code >= 500
+            return response
+        finally:
+            if overloaded:
+                with self._lock:
+                    self.num_overloaded += 1
+            self.limiter.release(self.clock() - start, overloaded)
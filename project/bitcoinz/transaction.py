@@ -1,14 +1,153 @@
-from datetime import datetime, timezone
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional
+from project.bitcoinz.amount import format_amount
+from project.bitcoinz.ledger import TransactionLog, _now_ns
+
+
+def format_timestamp(timestamp_ns: int) -> str:
+    """
+    Format UTC epoch nanoseconds as an ISO 8601 timestamp, e.g. '2022-02-08T04:59:10.709213+00:00'.
+
+    Args:
+        timestamp_ns (int): UTC epoch nanoseconds.
+
+    Returns:
+        str: ISO 8601 timestamp with microseconds.
+    """
+    seconds, nanoseconds = divmod(timestamp_ns, 10 ** 9)
+    moment = datetime.fromtimestamp(seconds, timezone.utc).replace(microsecond=nanoseconds // 1000)
+    return moment.isoformat(sep='T', timespec='microseconds')
+
+
+# datetime.fromisoformat is only available from Python 3.7
+_ISO_TIMESTAMP = re.compile(r"(\d{4})-(\d{2})-(\d{2})"
+                            r"(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:\.(\d{1,6})\d*)?)?)?"
+                            r"(Z|[+-]\d{2}:?\d{2})?$")
+
+
+def _parse_iso_timestamp(text: str) -> datetime:
+    """
+    Parse an ISO 8601 timestamp as written by format_timestamp(), e.g. '2022-02-08T04:59:10.709213+00:00'.
+    Time, fraction and offset are optional.
+
+    Raises:
+        ValueError: If text is not an ISO 8601 timestamp.
+    """
+    match = _ISO_TIMESTAMP.match(text.strip())
+    if match is None:
+        raise ValueError("Invalid ISO 8601 timestamp: {!r}".format(text))
+    year, month, day, hour, minute, second, fraction, offset = match.groups()
+    tzinfo = None
+    if offset == "Z":
+        tzinfo = timezone.utc
+    elif offset is not None:
+        sign = -1 if offset[0] == "-" else 1
+        digits = offset[1:].replace(":", "")
+        tzinfo = timezone(sign * timedelta(hours=int(digits[:2]), minutes=int(digits[2:])))
+    return datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                    int((fraction or "0").ljust(6, "0")), tzinfo)
+
+
+def parse_timestamp(moment) -> int:
+    """
+    Convert a datetime, ISO 8601 string or epoch-nanosecond int to UTC epoch nanoseconds.
+    Naive datetimes are taken to be in UTC.
+
+    Args:
+        moment (datetime, str or int): Point in time.
+
+    Returns:
+        int: UTC epoch nanoseconds.
+    """
+    if isinstance(moment, int):
+        return moment
+    if isinstance(moment, str):
+        moment = _parse_iso_timestamp(moment)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86400 + delta.seconds) * 10 ** 9 + delta.microseconds * 1000
+
+
+def transaction_dict(from_address: str, to_address: str, amount: int, timestamp_ns: int) -> Dict[str, str]:
+    """
+    Structured record of a transaction in the shape used by the Jobcoin API.
+
+    Args:
+        from_address (str): Sender's address.
+        to_address (str): Receiver's address.
+        amount (int): Amount in base units.
+        timestamp_ns (int): UTC epoch nanoseconds.
+
+    Returns:
+        Dict[str, str]: timestamp, fromAddress, toAddress and amount (formatted in coins).
+    """
+    return {"timestamp": format_timestamp(timestamp_ns), "fromAddress": from_address, "toAddress": to_address,
+            "amount": format_amount(amount)}
+
 
 class Transaction:
     """
     Captures a transaction on the bitcoinz Network. Transaction validity has been verified by network.
+
+    A Transaction constructed directly holds its fields until the Mixer appends it to its own log;
+    Transaction.at() gives a lightweight view over one row of a TransactionLog instead.
     """    
-    def __init__(self, fromAddress: str, toAddress: str, amount: str):
-        self.fromAddress = fromAddress
-        self.toAddress = toAddress
-        self.amount = amount
-        self.timestamp = datetime.now(timezone.utc).isoformat(sep='T')
+    __slots__ = ("_log", "row", "_from_address", "_to_address", "_amount", "_timestamp_ns")
+
+    def __init__(self, fromAddress: str, toAddress: str, amount: int, timestamp_ns: Optional[int] = None):
+        self._log: Optional[TransactionLog] = None
+        self.row: Optional[int] = None
+        self._from_address = fromAddress
+        self._to_address = toAddress
+        self._amount = amount
+        self._timestamp_ns = timestamp_ns if timestamp_ns is not None else _now_ns()
+
+    @classmethod
+    def at(cls, log: TransactionLog, row: int) -> "Transaction":
+        """
+        View of a row of a TransactionLog.
+
+        Args:
+            log (TransactionLog): Log holding the transaction.
+            row (int): Row number.
+
+        Returns:
+            Transaction: View over the row.
+        """
+        transaction = cls.__new__(cls)
+        transaction._log = log
+        transaction.row = row
+        return transaction
+
+    @property
+    def fromAddress(self) -> str:
+        if self._log is None:
+            return self._from_address
+        return self._log.from_address(self.row)
+
+    @property
+    def toAddress(self) -> str:
+        if self._log is None:
+            return self._to_address
+        return self._log.to_address(self.row)
+
+    @property
+    def amount(self) -> int:
+        if self._log is None:
+            return self._amount
+        return self._log.amounts[self.row]
+
+    @property
+    def timestamp_ns(self) -> int:
+        if self._log is None:
+            return self._timestamp_ns
+        return self._log.timestamps[self.row]
+
+    @property
+    def timestamp(self) -> str:
+        return format_timestamp(self.timestamp_ns)
     
     def get_from_address(self) -> str:
         """
@@ -28,12 +167,12 @@ class Transaction:
         """        
         return self.toAddress
     
-    def get_amount(self) -> str:
+    def get_amount(self) -> int:
         """
         Amount associated with transaction.
 
         Returns:
-            str: Amount as string.
+            int: Amount in base units.
         """        
         return self.amount
 
@@ -45,4 +184,22 @@ class Transaction:
             str: Summary of transaction
             example: {'timestamp': '2022-02-08T04:59:10.709213+00:00', 'fromAddress': '8b..a9', 'toAddress': 'a3..86', 'amount': '90.0'}
         """        
-        return str(dict(zip(["timestamp", "fromAddress", "toAddress", "amount"], [self.timestamp, self.fromAddress, self.toAddress, self.amount])))
\ No newline at end of file
+        return str(dict(zip(["timestamp", "fromAddress", "toAddress", "amount"], [self.timestamp, self.fromAddress, self.toAddress, format_amount(self.amount)])))
+
+    def to_dict(self) -> Dict[str, str]:
+        """
+        Structured record of transaction in the shape used by the Jobcoin API.
+
+        Returns:
+            Dict[str, str]: timestamp, fromAddress, toAddress and amount (formatted in coins).
+        """
+        return transaction_dict(self.fromAddress, self.toAddress, self.amount, self.timestamp_ns)
+
+
+class TransactionPage(NamedTuple):
+    """
+    A page of transaction records returned by a paginated query.
+    next_cursor is None when there are no more matching transactions.
+    """
+    records: List[Dict[str, str]]
+    next_cursor: Optional[int]
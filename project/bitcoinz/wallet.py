@@ -1,17 +1,24 @@
-from typing import List
+import logging
+from array import array
+from typing import Iterator, List, Optional
 
 from project.bitcoinz.transaction import Transaction
-from decimal import Decimal
+from project.bitcoinz.amount import format_amount
+from project.bitcoinz.ledger import TransactionLog
+
+logger = logging.getLogger(__name__)
 
 class Wallet:
     """
     A wallet is owned by a user, who provides a list of unique private addresses.
+    Its transactions are kept as an index of row numbers into the Mixer's TransactionLog.
     """
-    def __init__(self, private_addresses: List[str], deposit_address: str):
+    def __init__(self, private_addresses: List[str], deposit_address: str, log: Optional[TransactionLog] = None):
         self.private_addresses = private_addresses
         self.deposit_address = deposit_address
-        self.balance = Decimal(0)
-        self.transactions = []
+        self.balance = 0
+        self.log = log if log is not None else TransactionLog()
+        self.transactions = array('q')
 
     def get_num_addresses(self) -> int:
         """
@@ -22,43 +29,56 @@ class Wallet:
         """        
         return len(self.private_addresses)
 
-    def get_balance(self) -> Decimal:
+    def get_balance(self) -> int:
         """
         Get balance of wallet.
 
         Returns:
-            Decimal: Wallet balance as Decimal.
+            int: Wallet balance in base units.
         """        
         return self.balance
     
-    def increase_balance(self, amount: Decimal) -> None:
+    def increase_balance(self, amount: int) -> None:
         """
         Add amount to wallet balance.
 
         Args:
-            amount (Decimal): Amount to be deposited in wallet.
+            amount (int): Amount in base units to be deposited in wallet.
         """        
         self.balance += amount
-        print("Balance becomes", self.balance)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("balance_changed address=%s delta=%s balance=%s", self.deposit_address, format_amount(amount), format_amount(self.balance))
 
-    def decrease_balance(self, amount: Decimal):
+    def decrease_balance(self, amount: int):
         """
         Deduct amount from wallet balance.
 
         Args:
-            amount (Decimal): Amount to be withdrawn from wallet.
+            amount (int): Amount in base units to be withdrawn from wallet.
         """        
         self.balance -= amount
-        print("Balance becomes", self.balance)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("balance_changed address=%s delta=-%s balance=%s", self.deposit_address, format_amount(amount), format_amount(self.balance))
     
     def add_transaction(self, transaction: Transaction) -> None:
         """
         Add transaction to list of transactions associated with wallet.
 
         Args:
-            transaction (Transaction): Valid transaction.
+            transaction (Transaction): Valid transaction, a view over a row of the wallet's log.
         """        
-        self.transactions.append(transaction)
+        self.transactions.append(transaction.row)
+
+    def iter_transactions(self) -> Iterator[Transaction]:
+        """
+        Iterate over the transactions associated with wallet, oldest first.
+
+        Returns:
+            Iterator[Transaction]: Views over the wallet's rows of the log.
+        """
+        log = self.log
+        for row in self.transactions:
+            yield Transaction.at(log, row)
     
     def get_transaction_history(self):
         """
@@ -68,4 +88,4 @@ class Wallet:
             str: Summary of wallet including current balance and a list of transaction summaries.
             example: "balance: 88.2, ["{'timestamp': '2022-02-08T05:04:06.631305+00:00', 'fromAddress': '65..34', 'toAddress': '1e..1b', 'amount': '90.0'"
         """           
-        return "balance: {}, {}".format(self.balance, [xact.return_transaction() for xact in self.transactions])
\ No newline at end of file
+        return "balance: {}, {}".format(format_amount(self.balance), [xact.return_transaction() for xact in self.iter_transactions()])
\ No newline at end of file
@@ -0,0 +1,156 @@
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from project.bitcoinz.amount import parse_amount
+from project.bitcoinz.exceptions import InsufficientBalanceException
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.mirror import TransactionMirror
+from project.bitcoinz.mixer import APIBasedMixer, AsyncAPIBasedMixer
+
+logger = logging.getLogger(__name__)
+
+
+class DepositWatcher:
+    """
+    Detects coins sent to the deposit addresses of an APIBasedMixer and has the mixer mix them.
+
+    Every cycle makes one incremental sync of a TransactionMirror of the whole feed and matches the new
+    transactions against the set of deposit addresses, so the requests and work per cycle depend on the
+    number of new transactions, not on the number of addresses watched. Deposits to the same address
+    within a cycle are mixed together. Transfers from the house account (the mixer's own installments)
+    are not deposits.
+
+    The poll interval adapts: it drops to min_interval while deposits keep arriving and doubles up to
+    max_interval while the feed is quiet. Back-pressure: at most max_mixes_per_cycle deposit addresses are
+    mixed per cycle, and none while the mixer has more than max_pending_payouts installments queued, in its
+    scheduler or its outbox; the rest waits in a backlog for later cycles.
+    """
+    def __init__(self, mixer: APIBasedMixer, mirror: Optional[TransactionMirror] = None, min_interval: float = 0.25,
+                 max_interval: float = 5.0, max_mixes_per_cycle: int = 100, max_pending_payouts: int = 10000,
+                 metrics: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            mixer (APIBasedMixer): Mixer whose deposit addresses are watched; every address it hands out is watched.
+            mirror (TransactionMirror, optional): Mirror of the feed to scan. Defaults to the mixer's mirror, or a new one over its client.
+            min_interval (float, optional): Seconds between polls while deposits arrive. Defaults to 0.25.
+            max_interval (float, optional): Longest interval between polls while the feed is quiet. Defaults to 5.
+            max_mixes_per_cycle (int, optional): Deposit addresses mixed per cycle at most. Defaults to 100.
+            max_pending_payouts (int, optional): Mix nothing while more installments than this are queued. Defaults to 10000.
+            metrics (MetricsRegistry, optional): Registry to record detected deposits and the backlog in. Defaults to the mixer's.
+
+        Raises:
+            TypeError: If mixer is an AsyncAPIBasedMixer, whose awaitable mix_deposit() cannot be called from the polling thread.
+        """
+        if isinstance(mixer, AsyncAPIBasedMixer):
+            raise TypeError("DepositWatcher needs a synchronous APIBasedMixer, await AsyncAPIBasedMixer.mix_deposit() instead")
+        self.mixer = mixer
+        if mirror is None:
+            mirror = mixer.mirror if mixer.mirror is not None else TransactionMirror(mixer.client, metrics=metrics)
+        self.mirror = mirror
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_mixes_per_cycle = max_mixes_per_cycle
+        self.max_pending_payouts = max_pending_payouts
+        self.interval = min_interval
+        # Amount in base units detected but not mixed yet per deposit address, oldest first
+        self.backlog: "OrderedDict[str, int]" = OrderedDict()
+        self._position = 0
+        self._generation = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        metrics = metrics if metrics is not None else mixer.metrics
+        self._deposits = metrics.counter("bitcoinz_deposits_detected_total", "Transfers to deposit addresses detected by the watcher.")
+        self._deposit_units = metrics.counter("bitcoinz_deposits_detected_units_total", "Amount detected at deposit addresses, in base units.")
+        metrics.gauge("bitcoinz_deposit_backlog", "Deposit addresses with coins detected but not mixed yet.").set_function(self.backlog.__len__)
+        metrics.gauge("bitcoinz_deposit_poll_interval_seconds", "Current interval between polls of the deposit watcher.").set_function(lambda: self.interval)
+
+    def poll(self) -> int:
+        """
+        Run one cycle: sync the mirror, detect new deposits and mix as much of the backlog as allowed.
+
+        Returns:
+            int: Number of deposit addresses mixed.
+        """
+        self.mirror.sync()
+        if self._generation is not None and self._generation != self.mirror.generation:
+            # The remote history was rewritten; skip what the mirror holds now rather than mix anything twice
+            logger.warning("Transaction feed was rebuilt, resuming deposit detection from its end")
+            self._position = len(self.mirror.transactions)
+        self._generation = self.mirror.generation
+
+        new = self.mirror.transactions_since(self._position)
+        self._position += len(new)
+        detected = self._detect(new)
+        mixed = self._mix_backlog()
+
+        if detected:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.max_interval, self.interval * 2)
+        return mixed
+
+    def start(self) -> None:
+        """
+        Poll on a background thread until stop() is called.
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="deposit-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop polling. Deposits still in the backlog stay there.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning("Polling for deposits failed: %s", e)
+                self.interval = min(self.max_interval, self.interval * 2)
+            self._stop.wait(self.interval)
+
+    def _detect(self, transactions) -> int:
+        watched = self.mixer.deposit_addresses
+        house = self.mixer.house_address
+        detected = 0
+        for transaction in transactions:
+            receiver = transaction["toAddress"]
+            if receiver in watched and transaction.get("fromAddress") != house:
+                amount = parse_amount(transaction["amount"])
+                self.backlog[receiver] = self.backlog.get(receiver, 0) + amount
+                self._deposit_units.inc(amount)
+                detected += 1
+        self._deposits.inc(detected)
+        return detected
+
+    def _mix_backlog(self) -> int:
+        mixed = 0
+        while self.backlog and mixed < self.max_mixes_per_cycle:
+            if self._num_pending_payouts() > self.max_pending_payouts:
+                logger.debug("deposit_mixing_deferred backlog=%s", len(self.backlog))
+                break
+            deposit_address, amount = next(iter(self.backlog.items()))
+            # Other errors (e.g. the API being down) propagate and leave the deposit in the backlog for the next cycle
+            try:
+                self.mixer.mix_deposit(deposit_address, amount)
+            except InsufficientBalanceException:
+                logger.warning("Deposit of %s at %s could not be moved to the house account", amount, deposit_address)
+            del self.backlog[deposit_address]
+            mixed += 1
+        return mixed
+
+    def _num_pending_payouts(self) -> int:
+        # With an outbox, installments are queued there rather than in the scheduler
+        pending = self.mixer.scheduler.num_pending()
+        if self.mixer.outbox is not None:
+            pending += self.mixer.outbox.num_pending()
+        return pending
@@ -1,14 +1,24 @@
 #!/usr/bin/env python
+import json
+import logging
 import sys
 
 import click
+from project.bitcoinz.commands import BatchRunner
 from project.bitcoinz.exceptions import DepositAddressDoesntExistException, InsufficientBalanceException
 from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.service import ServiceClient
 
 
 @click.command()
-def main(args=None):
-    click.echo('Welcome to the BitcoinZ network!\n')
+@click.option("--log-level", default="WARNING", help="Log level, e.g. DEBUG to log every balance change.")
+@click.option("--daemon", default=None, help="Use the network served by project.daemon at this URL, e.g. http://127.0.0.1:8765.")
+@click.option("--batch", default=None, type=click.File("r"), help="Run the commands of this file (- for stdin) without prompting, printing JSON lines.")
+def main(log_level, daemon, batch, args=None):
+    logging.basicConfig(level=log_level.upper(), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    if batch is None:
+        click.echo('Welcome to the BitcoinZ network!\n')
 
     help_string = """
     This BitcoinZ Network CLI supports the following commands:
@@ -16,11 +26,22 @@ def main(args=None):
         b) send [sender] [receiver] [amount]                    Send amount from sender to receiver, sender should be empty to mint
         c) get_transactions                                     Get all transactions in the BitcoinZ Mixer
         d) get_transactions [address]                           Get all transactions associated with address in the BitcoinZ Mixer
-        e) help                                                 See help docstring
-        f) blank (enter)                                        Exit from this CLI tool
+        e) dump_transactions [address]                          Stream transactions (of address) as JSON lines
+        f) metrics [json]                                       Print metrics in the Prometheus text format (or as JSON)
+        g) help                                                 See help docstring
+        h) blank (enter)                                        Exit from this CLI tool
     """
 
-    network = BitcoinZNetwork()
+    if daemon is not None:
+        network = ServiceClient(daemon)
+    else:
+        network = BitcoinZNetwork(metrics=MetricsRegistry())
+
+    if batch is not None:
+        num_failed = BatchRunner(network, click.get_text_stream("stdout")).run(batch)
+        if daemon is None:
+            network.wait_for_payouts()
+        sys.exit(1 if num_failed else 0)
 
     while True:
         try:
@@ -31,12 +52,20 @@ def main(args=None):
                 show_default=False)
 
             if input_.strip() == '':
+                # The daemon keeps paying out after this client exits
+                if daemon is None:
+                    network.wait_for_payouts()
                 sys.exit(0)
 
             if "add_address" in input_:
                 command, args = input_.split(' ', 1)
                 addresses = args.replace(' ', '').split(",")
-                deposit_address = network.add_addresses(addresses)
+                try:
+                    deposit_address = network.add_addresses(addresses)
+                except ValueError as e:
+                    # The addresses are well-formed but already registered, unlike the malformed input below
+                    click.echo('\n{}\n'.format(e))
+                    continue
                 click.echo(
                 '\nYou may now send BitcoinZs to address {deposit_address}. They '
                 'will be mixed and sent to your destination addresses.\n'
@@ -57,6 +86,12 @@ def main(args=None):
                 '\n{amount} sent from {sender} to {receiver} via BitcoinZ Mixer.\n'
                 .format(amount=amount, sender=sender, receiver=receiver))
             
+            elif "dump_transactions" in input_:
+                output = input_.split(' ')
+                address = output[1] if len(output) > 1 else None
+                for record in network.iter_transactions(address):
+                    click.echo(json.dumps(record))
+
             elif "get_transactions" in input_:
                 output = input_.split(' ')
                 if len(output) == 1:
@@ -64,6 +99,13 @@ def main(args=None):
                 else:
                     click.echo("\n{}\n".format(network.get_transactions(output[1])))
 
+            elif "metrics" in input_:
+                output = input_.split(' ')
+                if len(output) > 1 and output[1] == "json":
+                    click.echo(network.metrics.to_json())
+                else:
+                    click.echo(network.metrics.to_prometheus())
+
             elif "help" in input_:
                 click.echo(help_string)
 
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Serves one BitcoinZ network to local clients, e.g. `python -m project.cli --daemon http://127.0.0.1:8765`.
+"""
+import asyncio
+import logging
+import signal
+import sys
+
+import click
+from project.bitcoinz.bitcoinz_network import BitcoinZAPINetwork, BitcoinZNetwork
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.mixer import APIBasedMixer, Mixer
+from project.bitcoinz.outbox import PayoutOutbox
+from project.bitcoinz.resilience import CircuitBreaker
+from project.bitcoinz.service import MixerService
+from project.bitcoinz.storage import SQLiteStorage
+
+
+def _build_network(api: bool, storage, outbox, round_window, metrics: MetricsRegistry):
+    if api:
+        client = JobcoinClient(APIBasedMixer.API_ENV_URL, metrics=metrics, breaker=CircuitBreaker(), hedge_reads=True)
+        if outbox is not None:
+            outbox = PayoutOutbox(outbox, client, metrics=metrics)
+        mixer = APIBasedMixer(client=client, metrics=metrics, outbox=outbox, round_window=round_window)
+        return BitcoinZAPINetwork(mixer, metrics=metrics)
+    if storage is None:
+        return BitcoinZNetwork(Mixer(metrics=metrics, round_window=round_window), metrics=metrics)
+    mixer = Mixer(storage=SQLiteStorage(storage), metrics=metrics, round_window=round_window)
+    mixer.resume_payouts()
+    return BitcoinZNetwork(mixer, metrics=metrics)
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Interface to listen on.")
+@click.option("--port", default=8765, help="Port to listen on.")
+@click.option("--unix-socket", default=None, help="Listen on this Unix socket instead of a TCP port.")
+@click.option("--api", is_flag=True, help="Mix through the Jobcoin API instead of the in-memory ledger.")
+@click.option("--storage", default=None, help="SQLite file keeping the ledger across restarts; payouts still owed are resumed on start.")
+@click.option("--outbox", default=None, help="With --api, SQLite file queueing installments durably.")
+@click.option("--round-window", default=None, type=float, help="Pay installments in rounds this many seconds apart, coalesced per receiver.")
+@click.option("--workers", default=8, help="Threads handling requests.")
+@click.option("--drain-timeout", default=None, type=float, help="Seconds to wait for pending payouts on shutdown, forever by default.")
+@click.option("--log-level", default="INFO", help="Log level, e.g. DEBUG to log every balance change.")
+def main(host, port, unix_socket, api, storage, outbox, round_window, workers, drain_timeout, log_level):
+    logging.basicConfig(level=log_level.upper(), format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    network = _build_network(api, storage, outbox, round_window, MetricsRegistry())
+    service = MixerService(network, host, port, unix_socket, workers)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(service.start())
+    click.echo("Serving the BitcoinZ network on {}".format(service.url))
+
+    stopping = []
+
+    def stop():
+        if not stopping:
+            stopping.append(asyncio.ensure_future(service.stop(drain_timeout)))
+
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, stop)
+        except NotImplementedError:
+            pass
+    try:
+        loop.run_until_complete(service.wait_stopped())
+    except KeyboardInterrupt:
+        stop()
+        loop.run_until_complete(service.wait_stopped())
+    finally:
+        loop.close()
+    click.echo("Stopped, payouts drained: {}".format(stopping[0].result()))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+"""
+Local stand-in for the Jobcoin API, so the API path can be developed and load-tested offline.
+Implements POST /create, POST /api/transactions, GET /api/transactions (also as a byte range, for incremental
+sync) and GET /api/addresses/{addr} (under any base path) with in-memory balances, plus configurable latency,
+error injection and rate limits. POSTs carrying an Idempotency-Key header are applied at most once.
+
+    python -m project.jobcoin_server --port 8080 --latency 0.02 --error-rate 0.01 --rate-limit 500
+    python -m project.api_client  # with APIBasedMixer.API_ENV_URL pointed at http://127.0.0.1:8080
+"""
+import asyncio
+import contextlib
+import json
+import logging
+import random
+import sys
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import click
+from project.bitcoinz.amount import COIN, format_amount, parse_amount
+
+logger = logging.getLogger(__name__)
+
+# Coins credited by POST /create
+CREATE_AMOUNT = 50 * COIN
+
+_REASONS = {200: "OK", 206: "Partial Content", 400: "Bad Request", 404: "Not Found", 416: "Range Not Satisfiable",
+            422: "Unprocessable Entity", 429: "Too Many Requests", 503: "Service Unavailable"}
+
+
+class _TokenBucket:
+    """
+    Allows rate requests per second on average, with bursts of up to burst requests.
+    """
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class JobcoinServer:
+    """
+    asyncio HTTP/1.1 server speaking the Jobcoin API, with keep-alive connections. Balances are held in
+    integer base units, see project.bitcoinz.amount.
+
+    Faults are injected per request, in this order: rate limit (429 per client host), latency, server error (503),
+    forced insufficient balance (422 on POST /api/transactions), lost response (a POST is applied, but answered 503).
+
+    A POST with an Idempotency-Key header is applied once; repeating it with the same key returns the
+    response of the first attempt that got past the injected server errors, without applying it again.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, latency_jitter: float = 0.0,
+                 error_rate: float = 0.0, insufficient_balance_rate: float = 0.0, rate_limit: Optional[float] = None,
+                 burst: Optional[float] = None, seed: Optional[int] = None, lost_response_rate: float = 0.0):
+        """
+        Configure the server. Call start() (or use running()) to listen.
+
+        Args:
+            host (str, optional): Interface to listen on. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on, 0 for a free one. Defaults to 0.
+            latency (float, optional): Seconds every response is delayed by. Defaults to 0.
+            latency_jitter (float, optional): Up to this many more seconds of uniformly random delay. Defaults to 0.
+            error_rate (float, optional): Fraction of requests failing with 503. Defaults to 0.
+            insufficient_balance_rate (float, optional): Fraction of transfers rejected as insufficient balance. Defaults to 0.
+            rate_limit (float, optional): Requests per second allowed per client host, None for no limit. Defaults to None.
+            burst (float, optional): Burst size of the rate limit. Defaults to rate_limit.
+            seed (int, optional): Seed of the fault injection. Defaults to None.
+            lost_response_rate (float, optional): Fraction of POSTs applied but answered 503, as if the response was lost. Defaults to 0.
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.insufficient_balance_rate = insufficient_balance_rate
+        self.rate_limit = rate_limit
+        self.burst = burst if burst is not None else rate_limit
+        self.lost_response_rate = lost_response_rate
+        self.rng = random.Random(seed)
+
+        self.balances: Dict[str, int] = {}
+        self.transactions: List[Dict[str, str]] = []
+        self.num_connections = 0
+        self.num_requests = 0
+        self.status_counts: Dict[int, int] = {}
+        self._transactions_by_address: Dict[str, List[int]] = {}
+        # GET /api/transactions body without its closing "]", appended to as transactions are recorded
+        self._transactions_body = bytearray(b"[")
+        # Response per Idempotency-Key of the POSTs applied
+        self._idempotent_responses: Dict[str, Tuple[int, object, Dict[str, str]]] = {}
+        self._buckets: Dict[str, _TokenBucket] = {}
+        self._writers = set()
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        """
+        Base URL to give to JobcoinClient / APIBasedMixer.
+        """
+        return "http://{}:{}".format(self.host, self.port)
+
+    async def start(self) -> None:
+        """
+        Start listening. If port was 0, self.port is set to the port picked.
+        """
+        self._server = await asyncio.start_server(self._serve_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info("Jobcoin stand-in listening on %s", self.url)
+
+    async def stop(self) -> None:
+        """
+        Stop listening and close open keep-alive connections.
+        """
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    def balance(self, address: str) -> int:
+        """
+        Balance of address in base units.
+        """
+        return self.balances.get(address, 0)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.num_connections += 1
+        self._writers.add(writer)
+        peer = writer.get_extra_info("peername")
+        client_host = peer[0] if peer else ""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload, extra_headers = await self._respond(method, target, headers, body, client_host)
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(self._encode_response(status, payload, extra_headers, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    def _encode_response(status: int, payload, extra_headers: Dict[str, str], keep_alive: bool) -> bytes:
+        # bytes payloads are sent as they are
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        lines = ["HTTP/1.1 {} {}".format(status, _REASONS.get(status, "")),
+                 "Content-Type: application/json",
+                 "Content-Length: {}".format(len(body)),
+                 "Connection: {}".format("keep-alive" if keep_alive else "close")]
+        lines.extend("{}: {}".format(name, value) for name, value in extra_headers.items())
+        # Headers and body in a single write, so responses are not held back by Nagle's algorithm
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+    async def _respond(self, method: str, target: str, headers: Dict[str, str], body: bytes,
+                       client_host: str) -> Tuple[int, object, Dict[str, str]]:
+        self.num_requests += 1
+        status, payload, extra_headers = await self._handle(method, target, headers, body, client_host)
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        return status, payload, extra_headers
+
+    async def _handle(self, method: str, target: str, headers: Dict[str, str], body: bytes,
+                      client_host: str) -> Tuple[int, object, Dict[str, str]]:
+        if self.rate_limit is not None:
+            now = asyncio.get_event_loop().time()
+            bucket = self._buckets.get(client_host)
+            if bucket is None:
+                bucket = self._buckets[client_host] = _TokenBucket(self.rate_limit, self.burst, now)
+            if not bucket.take(now):
+                return 429, {"error": "Too Many Requests"}, {"Retry-After": "1"}
+
+        delay = self.latency + (self.rng.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return 503, {"error": "Service Unavailable"}, {}
+
+        path = unquote(urlsplit(target).path).rstrip("/")
+        if method == "POST":
+            key = headers.get("idempotency-key")
+            response = self._idempotent_responses.get(key) if key is not None else None
+            if response is None:
+                response = self._post(path, {name: values[0] for name, values in parse_qs(body.decode()).items()})
+                if key is not None:
+                    self._idempotent_responses[key] = response
+            if self.lost_response_rate and self.rng.random() < self.lost_response_rate:
+                return 503, {"error": "Service Unavailable"}, {}
+            return response
+        elif method == "GET":
+            if path.endswith("/api/transactions"):
+                return self._get_transactions(headers.get("range"))
+            head, _, address = path.rpartition("/")
+            if head.endswith("/api/addresses") and address:
+                transactions = [self.transactions[i] for i in self._transactions_by_address.get(address, ())]
+                return 200, {"balance": format_amount(self.balance(address)), "transactions": transactions}, {}
+        return 404, {"error": "Not Found"}, {}
+
+    def _post(self, path: str, form: Dict[str, str]) -> Tuple[int, object, Dict[str, str]]:
+        if path.endswith("/create"):
+            return self._create(form)
+        if path.endswith("/api/transactions"):
+            return self._post_transaction(form)
+        return 404, {"error": "Not Found"}, {}
+
+    def _create(self, form: Dict[str, str]) -> Tuple[int, object, Dict[str, str]]:
+        address = form.get("address")
+        if not address:
+            return 400, {"error": "address is required"}, {}
+        self.balances[address] = self.balance(address) + CREATE_AMOUNT
+        self._record({"toAddress": address, "amount": format_amount(CREATE_AMOUNT)})
+        return 200, {"status": "OK"}, {}
+
+    def _post_transaction(self, form: Dict[str, str]) -> Tuple[int, object, Dict[str, str]]:
+        sender, receiver = form.get("fromAddress"), form.get("toAddress")
+        try:
+            amount = parse_amount(form.get("amount"))
+        except ValueError:
+            return 422, {"error": "Invalid amount"}, {}
+        if not sender or not receiver:
+            return 422, {"error": "fromAddress and toAddress are required"}, {}
+        if self.balance(sender) < amount or (self.insufficient_balance_rate and self.rng.random() < self.insufficient_balance_rate):
+            return 422, {"error": "Insufficient Funds"}, {}
+
+        self.balances[sender] -= amount
+        self.balances[receiver] = self.balance(receiver) + amount
+        self._record({"fromAddress": sender, "toAddress": receiver, "amount": format_amount(amount)})
+        return 200, {"status": "OK"}, {}
+
+    def _get_transactions(self, range_header: Optional[str]) -> Tuple[int, object, Dict[str, str]]:
+        """
+        Every transaction, or with a "Range: bytes=N-" header the bytes of the JSON array from offset N (206).
+        The array is only ever appended to, so a client that has parsed it up to N can fetch just the new suffix.
+        """
+        body = bytes(self._transactions_body) + b"]"
+        if range_header is None:
+            return 200, body, {}
+        unit, _, spec = range_header.partition("=")
+        first, _, last = spec.partition("-")
+        if unit.strip() != "bytes" or not first.isdigit() or last:
+            return 200, body, {}
+        start = int(first)
+        if start >= len(body):
+            return 416, {"error": "Range Not Satisfiable"}, {"Content-Range": "bytes */{}".format(len(body))}
+        return 206, body[start:], {"Content-Range": "bytes {}-{}/{}".format(start, len(body) - 1, len(body))}
+
+    def _record(self, transaction: Dict[str, str]) -> None:
+        index = len(self.transactions)
+        self.transactions.append(transaction)
+        if index:
+            self._transactions_body += b", "
+        self._transactions_body += json.dumps(transaction).encode()
+        for key in ("fromAddress", "toAddress"):
+            if key in transaction:
+                self._transactions_by_address.setdefault(transaction[key], []).append(index)
+
+
+@contextlib.contextmanager
+def running(server: JobcoinServer) -> Iterator[JobcoinServer]:
+    """
+    Serve from an event loop on a background thread for the duration of the with block,
+    e.g. for tests and benchmarks driving the synchronous API client.
+
+    Args:
+        server (JobcoinServer): Server to run.
+
+    Returns:
+        Iterator[JobcoinServer]: The listening server.
+    """
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start())
+    thread = threading.Thread(target=loop.run_forever, name="jobcoin-server", daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Interface to listen on.")
+@click.option("--port", default=8080, help="Port to listen on.")
+@click.option("--latency", default=0.0, help="Seconds every response is delayed by.")
+@click.option("--latency-jitter", default=0.0, help="Up to this many more seconds of random delay.")
+@click.option("--error-rate", default=0.0, help="Fraction of requests failing with 503.")
+@click.option("--insufficient-balance-rate", default=0.0, help="Fraction of transfers rejected as insufficient balance.")
+@click.option("--rate-limit", default=None, type=float, help="Requests per second allowed per client host.")
+@click.option("--burst", default=None, type=float, help="Burst size of the rate limit.")
+@click.option("--seed", default=None, type=int, help="Seed of the fault injection.")
+@click.option("--lost-response-rate", default=0.0, help="Fraction of POSTs applied but answered 503.")
+def main(host, port, latency, latency_jitter, error_rate, insufficient_balance_rate, rate_limit, burst, seed, lost_response_rate):
+    logging.basicConfig(level=logging.INFO)
+    server = JobcoinServer(host, port, latency, latency_jitter, error_rate, insufficient_balance_rate, rate_limit, burst, seed,
+                           lost_response_rate)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.start())
+    click.echo("Serving the Jobcoin API on {}".format(server.url))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+        loop.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
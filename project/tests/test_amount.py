@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+import random
+import pytest
+from decimal import Decimal
+from project.bitcoinz.amount import COIN, apply_fee, fee_ratio, format_amount, parse_amount, split_units, to_decimal
+
+
+def test_parse_and_format_round_trip():
+    assert parse_amount("90.0") == 90 * COIN
+    assert parse_amount("0.00000001") == 1
+    assert format_amount(90 * COIN) == "90.0"
+    assert format_amount(2940000000) == "29.4"
+    assert format_amount(1) == "0.00000001"
+    assert to_decimal(2940000000) == Decimal("29.4")
+
+
+@pytest.mark.parametrize("amount", ["abc", "-1", "0.000000001", "NaN", "Infinity"])
+def test_parse_rejects_invalid_amounts(amount):
+    with pytest.raises(ValueError):
+        parse_amount(amount)
+
+
+def test_fee_is_exact():
+    ratio = fee_ratio(Decimal("0.02"))
+    assert apply_fee(parse_amount("180"), ratio) == parse_amount("3.6")
+
+
+def test_split_units_sums_exactly():
+    rng = random.Random(42)
+    for _ in range(1000):
+        units = rng.randint(0, 10 ** 12)
+        weights = [rng.random() for _ in range(rng.randint(1, 8))]
+        shares = split_units(units, weights)
+        assert sum(shares) == units
+        assert all(share >= 0 for share in shares)
+
+
+def test_parse_rejects_amounts_beyond_int64():
+    with pytest.raises(ValueError):
+        parse_amount("100000000000")
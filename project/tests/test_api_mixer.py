@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+import asyncio
+
+import pytest
+from project.bitcoinz.amount import COIN, format_amount
+from project.bitcoinz.bitcoinz_network import AsyncBitcoinZAPINetwork, BitcoinZAPINetwork
+from project.bitcoinz.exceptions import InsufficientBalanceException
+from project.bitcoinz.http_client import AsyncJobcoinClient, JobcoinClient
+from project.bitcoinz.mixer import APIBasedMixer, AsyncAPIBasedMixer
+from project.jobcoin_server import JobcoinServer, running
+
+
+@pytest.fixture
+def jobcoin_api():
+    with running(JobcoinServer()) as server:
+        yield server.url, server
+
+
+def test_client_reuses_pooled_connection(jobcoin_api):
+    url, server = jobcoin_api
+    client = JobcoinClient(url)
+    for _ in range(5):
+        assert client.get_address("alice").status_code == 200
+    assert server.num_connections == 1
+    client.close()
+
+
+def test_api_mixer_send(jobcoin_api):
+    url, server = jobcoin_api
+    mixer = APIBasedMixer(client=JobcoinClient(url))
+    mixer.MAX_INSTALLMENT_DELAY = 0.01
+    network = BitcoinZAPINetwork(mixer)
+    deposit = network.add_addresses(["0x4g7z", "0x8a54"])
+
+    network.send(BitcoinZAPINetwork.MINTED, deposit, "50")
+    assert network.wait_for_payouts(timeout=5)
+
+    # Installments go to the private addresses, which can spend them
+    assert server.balance(deposit) == 0
+    assert server.balance("0x4g7z") + server.balance("0x8a54") == 49 * COIN
+    assert network.get_transactions("0x4g7z")["balance"] == format_amount(server.balance("0x4g7z"))
+
+    with pytest.raises(InsufficientBalanceException):
+        network.send("0x4g7z", "bob", "500")
+    with pytest.raises(ValueError):
+        network.add_addresses(["0x8a54"])
+
+
+def test_async_api_mixer_overlaps_sends(jobcoin_api):
+    url, server = jobcoin_api
+
+    async def run():
+        mixer = AsyncAPIBasedMixer(client=AsyncJobcoinClient(url, max_concurrency_per_host=4))
+        mixer.MAX_INSTALLMENT_DELAY = 0.01
+        network = AsyncBitcoinZAPINetwork(mixer)
+        deposits = [network.add_addresses(["0x{}g7z".format(i)]) for i in range(3)]
+        await asyncio.gather(*[network.send(AsyncBitcoinZAPINetwork.MINTED, deposit, "50") for deposit in deposits])
+        assert await network.wait_for_payouts(timeout=5)
+        assert mixer.pending_payouts() == []
+        transactions = await network.get_transactions()
+        mixer.async_client.close()
+        return deposits, transactions
+
+    loop = asyncio.new_event_loop()
+    try:
+        deposits, transactions = loop.run_until_complete(run())
+    finally:
+        loop.close()
+    for i, deposit in enumerate(deposits):
+        assert server.balance(deposit) == 0
+        assert server.balance("0x{}g7z".format(i)) == 49 * COIN
+    assert len(transactions) == len(server.transactions)
+    assert server.num_connections <= 4
+
+
+def test_async_api_mixer_mixes_deposits(jobcoin_api):
+    url, server = jobcoin_api
+
+    async def run():
+        mixer = AsyncAPIBasedMixer(client=AsyncJobcoinClient(url))
+        mixer.MAX_INSTALLMENT_DELAY = 0.01
+        deposit = mixer.get_deposit_address(["0x5g7z", "0x9a54"])
+        await mixer.async_client.create(deposit)
+        tasks = await mixer.mix_deposit(deposit, 50 * COIN)
+        assert tasks and await mixer.wait_for_payouts(timeout=5)
+        mixer.async_client.close()
+        return deposit
+
+    loop = asyncio.new_event_loop()
+    try:
+        deposit = loop.run_until_complete(run())
+    finally:
+        loop.close()
+    assert server.balance(deposit) == 0
+    assert server.balance("0x5g7z") + server.balance("0x9a54") == 49 * COIN
@@ -0,0 +1,26 @@
+#!/usr/bin/env python
+from project.benchmarks.suite import CASES, compare, percentile, run_case
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.50) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([7], 0.99) == 7
+
+
+def test_run_case_reports_measurements():
+    result = run_case(CASES["send_wallet[addresses=4]"], ops=20, seed=1, ledger_size=100)
+    assert result["ops"] == 20
+    assert result["throughput"] > 0
+    assert 0 < result["p50_us"] <= result["p99_us"]
+    assert result["peak_memory_kib"] > 0
+
+
+def test_compare_flags_regressions():
+    baseline = {"results": {"send": {"throughput": 1000.0, "p99_us": 100.0, "peak_memory_kib": 50.0}}}
+    slower = {"results": {"send": {"throughput": 700.0, "p99_us": 105.0, "peak_memory_kib": 80.0}}}
+    assert compare(baseline, baseline) == []
+    regressions = compare(baseline, slower, threshold=0.15)
+    assert len(regressions) == 2
+    assert regressions[0].startswith("send: throughput")
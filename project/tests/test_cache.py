@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from project.benchmarks.suite import FakeClock
+from project.bitcoinz.amount import format_amount
+from project.bitcoinz.bitcoinz_network import BitcoinZAPINetwork
+from project.bitcoinz.cache import ReadThroughCache
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.mixer import APIBasedMixer
+from project.jobcoin_server import JobcoinServer, running
+
+
+def test_cache_serves_fresh_then_stale_while_revalidating():
+    clock = FakeClock()
+    cache = ReadThroughCache(max_entries=2, ttl=1.0, stale_ttl=5.0, cacheable=lambda value: value >= 0, clock=clock)
+    loads = []
+
+    def loader(value):
+        def load():
+            loads.append(value)
+            return value
+        return load
+
+    assert cache.get("a", loader(1)) == 1
+    clock.now = 0.5
+    assert cache.get("a", loader(2)) == 1
+    assert loads == [1]
+
+    # Stale: the old value is served and reloaded in the background
+    clock.now = 2.0
+    assert cache.get("a", loader(3)) == 1
+    cache.close()
+    assert loads == [1, 3]
+    assert cache.get("a", loader(4)) == 3
+
+    # Expired beyond stale_ttl: loaded on the caller's thread
+    clock.now = 10.0
+    assert cache.get("a", loader(5)) == 5
+
+    # Uncacheable values are returned but not kept, and the least recently used entry is evicted
+    assert cache.get("b", loader(-1)) == -1
+    assert cache.get("b", loader(6)) == 6
+    assert cache.get("c", loader(7)) == 7
+    assert cache.get("d", loader(8)) == 8
+    assert len(cache) == 2
+    assert cache.get("a", loader(9)) == 9
+
+
+def test_cache_single_flight_and_invalidation():
+    cache = ReadThroughCache()
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_load():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return len(calls)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(cache.get, "a", slow_load) for _ in range(8)]
+        started.wait(5)
+        # Invalidated while in flight: waiters get the result, but it is not cached
+        cache.invalidate("a")
+        release.set()
+        assert [future.result() for future in futures] == [1] * 8
+    assert calls == [1]
+    assert cache.get("a", slow_load) == 2
+
+
+def test_api_mixer_caches_lookups_until_it_posts():
+    with running(JobcoinServer()) as server:
+        mixer = APIBasedMixer(client=JobcoinClient(server.url))
+        mixer.MAX_INSTALLMENT_DELAY = 0.01
+        network = BitcoinZAPINetwork(mixer)
+        deposit = network.add_addresses(["0x4g7z", "0x8a54"])
+
+        assert network.get_transactions(deposit)["balance"] == format_amount(0)
+        requests_before = server.num_requests
+        for _ in range(10):
+            network.get_transactions(deposit)
+            network.get_transactions()
+        assert server.num_requests == requests_before + 1
+
+        network.send(BitcoinZAPINetwork.MINTED, deposit, "50")
+        assert network.wait_for_payouts(timeout=5)
+        assert network.get_transactions(deposit)["balance"] == format_amount(server.balance(deposit))
+        assert len(network.get_transactions()) == len(server.transactions)
+        mixer.client.close()
@@ -1,10 +1,14 @@
 #!/usr/bin/env python
+import json
 import pytest
 import re
+from types import SimpleNamespace
+from uuid import UUID
 from click.testing import CliRunner
 
 from project.bitcoinz import config
 from project import cli
+from project.bitcoinz import mixer
 from project.bitcoinz.exceptions import DepositAddressDoesntExistException
 
 
@@ -37,6 +41,14 @@ def test_cli_creates_address():
     assert address_create_result.exit_code == 0
     assert output_re.search(address_create_result.output) is not None
 
+def test_cli_rejects_registered_addresses():
+    runner = CliRunner()
+    result = runner.invoke(cli.main, input='add_address 0x4g7z,0x8a54\nadd_address 0x8a54')
+
+    assert result.exit_code == 0
+    assert "Private address 0x8a54 is already registered" in result.output
+    assert 'Malformed input!' not in result.output
+
 def test_cli_send_failure():
     runner = CliRunner()
     deposit_address = '0x4t'
@@ -69,4 +81,19 @@ def test_cli_blank_input_exits():
     )
 
     assert address_create_result.exit_code == 0
-    assert output_re.search(address_create_result.output) is None
\ No newline at end of file
+    assert output_re.search(address_create_result.output) is None
+
+
+def test_cli_dump_transactions(monkeypatch):
+    deposit_address = "d" * 32
+    monkeypatch.setattr(mixer, "uuid", SimpleNamespace(uuid4=lambda: UUID(deposit_address)))
+    runner = CliRunner()
+    result = runner.invoke(cli.main, input='add_address 0x4g7z,0x8a54\nsend {} 100\ndump_transactions'.format(deposit_address))
+
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines() if line.startswith('{')]
+    assert records
+    assert records[0]["fromAddress"] == "(new)"
+    assert records[0]["toAddress"] == deposit_address
+    assert records[0]["amount"] == "100.0"
+    assert all({"timestamp", "fromAddress", "toAddress", "amount"} <= set(record) for record in records)
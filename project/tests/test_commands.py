@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+import io
+import json
+
+import pytest
+from click.testing import CliRunner
+from project import cli
+from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.commands import BatchRunner, tokenize
+
+
+def test_tokenize():
+    assert tokenize("send  a b 1\n") == ["send", "a", "b", "1"]
+    assert tokenize('add_address "0x4g7z, 0x8a54" # two wallets') == ["add_address", "0x4g7z, 0x8a54"]
+    assert tokenize("   # comment") == []
+    with pytest.raises(ValueError):
+        tokenize('send "a b 1')
+
+
+def test_consecutive_sends_are_batched_in_order():
+    network = BitcoinZNetwork()
+    batches = []
+    send_many = network.send_many
+
+    def recording_send_many(transfers, atomic=True):
+        batches.append(len(transfers))
+        return send_many(transfers, atomic)
+
+    network.send_many = recording_send_many
+    deposit = network.add_addresses(["0x4g7z"])
+    out = io.StringIO()
+    lines = ["send {} 1".format(deposit)] * 5 + ["send nowhere 1", "", "get_transactions {}".format(deposit),
+                                                  "send {} 1".format(deposit), "send {}".format(deposit), "frobnicate"]
+    assert BatchRunner(network, out, batch_size=4).run(lines) == 3
+
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [result["line"] for result in results] == [1, 2, 3, 4, 5, 6, 8, 9, 10, 11]
+    assert [result["ok"] for result in results] == [True] * 5 + [False, True, True, False, False]
+    assert results[5]["type"] == "DepositAddressDoesntExistException"
+    assert results[8]["type"] == "ValueError" and results[9]["type"] == "NotImplementedError"
+    assert batches == [4, 2, 1]
+
+
+def test_cli_batch_mode():
+    runner = CliRunner()
+    result = runner.invoke(cli.main, ["--batch", "-"], input="add_address 0x4g7z,0x8a54\nsend nowhere 1\n")
+    assert result.exit_code == 1
+    added, failed = [json.loads(line) for line in result.output.splitlines()]
+    assert len(added["deposit_address"]) == 32 and added["ok"]
+    assert failed == {"line": 2, "command": "send", "ok": False, "type": "DepositAddressDoesntExistException",
+                      "error": "Deposit address (nowhere) does not exist in the JobMixer"}
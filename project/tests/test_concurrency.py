@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.concurrency import StripedLock, ThreadLocalCounter
+from project.bitcoinz.exceptions import InsufficientBalanceException
+from project.bitcoinz.mixer import Mixer
+from project.bitcoinz.scheduler import PayoutScheduler
+from project.bitcoinz.storage import StripedInMemoryStorage
+
+
+def _striped_network():
+    return BitcoinZNetwork(Mixer(scheduler=PayoutScheduler(background=False), storage=StripedInMemoryStorage(stripes=8)))
+
+
+def test_concurrent_sends_never_overdraw():
+    network = _striped_network()
+    senders = [network.add_addresses(["0x{:x}".format(i)]) for i in range(4)]
+    receiver = network.add_addresses(["0x4g7z", "0x8a54"])
+    for sender in senders:
+        network.send(BitcoinZNetwork.MINTED, sender, "10")
+    network.wait_for_payouts()
+
+    def send(i):
+        try:
+            network.send(senders[i % 4], receiver, "1")
+            return True
+        except InsufficientBalanceException:
+            return False
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        sent = sum(pool.map(send, range(200)))
+    network.wait_for_payouts()
+
+    # Each sender holds 9.8 after fees, so exactly 9 sends of 1 succeed per sender
+    assert sent == 36
+    assert all(network.mixer.get_balance(sender) == Decimal("0.8") for sender in senders)
+    assert network.mixer.get_balance(receiver) == Decimal("35.28")
+    assert network.get_fees_collected() == Decimal("0.8") + Decimal("0.72")
+    assert network.mixer.house_balance == 0
+    assert len(list(network.iter_transactions(receiver))) == 36
+
+
+def test_thread_local_counter_merges_threads():
+    counter = ThreadLocalCounter(5)
+    threads = [threading.Thread(target=lambda: [counter.add(1) for _ in range(1000)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value() == 4005
+
+
+def test_striped_lock_orders_stripes():
+    stripes = StripedLock(4)
+    keys = ["a", "b", "c", "d", "e"]
+    held = stripes.acquire(keys)
+    assert held._locks == sorted(held._locks, key=stripes._locks.index)
+    with held:
+        assert all(lock.locked() for lock in held._locks)
+    assert not any(lock.locked() for lock in held._locks)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+import asyncio
+import threading
+
+from project.benchmarks.suite import FakeClock
+from project.bitcoinz.amount import COIN
+from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.events import (BLOCK, DEPOSIT_RECEIVED, DROP, FEE_COLLECTED, INSTALLMENT_PAID,
+                                     TRANSACTION_COMPLETED, EventBus)
+from project.bitcoinz.mixer import Mixer
+from project.bitcoinz.scheduler import PayoutScheduler
+
+
+def test_network_publishes_money_movements():
+    network = BitcoinZNetwork(Mixer(scheduler=PayoutScheduler(clock=FakeClock(), background=False)))
+    events = []
+    subscription = network.events.subscribe(events.append)
+    deposit = network.add_addresses(["0x4g7z", "0x8a54", "0x1b2c"])
+    network.send(BitcoinZNetwork.MINTED, deposit, "50")
+
+    assert [event.kind for event in events] == [DEPOSIT_RECEIVED, FEE_COLLECTED]
+    assert events[0].data == {"sender": BitcoinZNetwork.MINTED, "deposit_address": deposit, "amount": 50 * COIN, "minted": True}
+    assert events[1].data["amount"] == COIN
+
+    assert network.wait_for_payouts(timeout=5)
+    installments = [event for event in events if event.kind == INSTALLMENT_PAID]
+    assert len(installments) == 3
+    assert sum(event.data["amount"] for event in installments) == 49 * COIN
+    # Completion comes after the last installment, exactly once
+    assert events[-1].kind == TRANSACTION_COMPLETED
+    assert events[-1].data == {"sender": BitcoinZNetwork.MINTED, "deposit_address": deposit, "amount": 50 * COIN, "fee": COIN}
+
+    subscription.unsubscribe()
+    network.send(BitcoinZNetwork.MINTED, deposit, "1")
+    assert len(events) == 6
+
+
+def test_bounded_queues_drop_or_block():
+    bus = EventBus()
+    dropping = bus.subscribe_queue(kinds=[FEE_COLLECTED], maxsize=2, policy=DROP)
+    for amount in range(5):
+        bus.publish(FEE_COLLECTED, amount=amount)
+    bus.publish(DEPOSIT_RECEIVED, amount=0)
+    assert dropping.dropped == 3
+    assert [dropping.get(timeout=0).data["amount"] for _ in range(2)] == [0, 1]
+    assert dropping.get(timeout=0) is None
+    dropping.unsubscribe()
+
+    blocking = bus.subscribe_queue(maxsize=1, policy=BLOCK)
+    publisher = threading.Thread(target=lambda: [bus.publish(FEE_COLLECTED, amount=amount) for amount in range(3)])
+    publisher.start()
+    received = [blocking.get(timeout=5).data["amount"] for _ in range(3)]
+    publisher.join()
+    assert received == [0, 1, 2]
+    assert blocking.dropped == 0
+
+
+def test_async_consumer_receives_events_from_other_threads():
+    async def consume():
+        subscription = bus.subscribe_async(maxsize=2, policy=BLOCK)
+        publisher = threading.Thread(target=lambda: [bus.publish(INSTALLMENT_PAID, amount=amount) for amount in range(10)])
+        publisher.start()
+        received = []
+        async for event in subscription:
+            received.append(event.data["amount"])
+            if len(received) == 10:
+                break
+        publisher.join()
+        return received
+
+    bus = EventBus()
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(consume()) == list(range(10))
+    finally:
+        loop.close()
+
+
+def test_unsubscribing_async_consumer_releases_blocked_publishers():
+    bus = EventBus()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        subscription = bus.subscribe_async(maxsize=1, policy=BLOCK)
+        publisher = threading.Thread(target=lambda: [bus.publish(INSTALLMENT_PAID, amount=amount) for amount in range(3)])
+        publisher.start()
+        publisher.join(timeout=0.2)
+        assert publisher.is_alive()
+        subscription.unsubscribe()
+        publisher.join(timeout=5)
+        assert not publisher.is_alive()
+        subscription.deliver(None)
+        assert loop.run_until_complete(subscription.get()).data["amount"] == 0
+        assert subscription._queue.empty()
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
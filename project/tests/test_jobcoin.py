@@ -2,7 +2,8 @@
 import pytest
 import re
 from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
-from project.bitcoinz.exceptions import DepositAddressDoesntExistException, InsufficientBalanceException
+from project.bitcoinz.exceptions import BatchSendException, DepositAddressDoesntExistException, InsufficientBalanceException
+from project.bitcoinz.transaction import Transaction
 from decimal import Decimal
 
 @pytest.fixture
@@ -11,6 +12,7 @@ def before_all():
     deposit_1 = network.add_addresses(["0x4g7z", "0x8a54"])
     amount = '100.0'
     network.send(BitcoinZNetwork.MINTED, deposit_1, amount)
+    network.wait_for_payouts()
     return network, deposit_1, amount
 
 def test_address_created(before_all):
@@ -35,6 +37,7 @@ def test_simple_send(before_all):
     deposit_2 = network.add_addresses(["0xf001", "0x200d"])
     amount_2 = "90.0"
     network.send(deposit_1, deposit_2, amount_2)
+    network.wait_for_payouts()
     account_2_transactions = network.get_transactions(deposit_2)
 
     assert "'fromAddress': '{}'".format(deposit_1) in account_2_transactions
@@ -79,8 +82,137 @@ def test_balance(before_all):
     deposit_3 = network.add_addresses(["0x7j4f", "0x20a"])
     amount_3 = "30.0"
     network.send(deposit_1, deposit_3, amount_3)
+    network.wait_for_payouts()
 
     assert "balance: 18" in network.get_transactions(deposit_1)
     assert "balance: 49" in network.get_transactions(deposit_2)
     assert "balance: 29.4" in network.get_transactions(deposit_3)
-    assert network.get_fees_collected() == (Decimal(amount) + Decimal(amount_2) + Decimal(amount_3)) * Decimal("0.02")
\ No newline at end of file
+    assert network.get_fees_collected() == (Decimal(amount) + Decimal(amount_2) + Decimal(amount_3)) * Decimal("0.02")
+
+def test_send_returns_before_payouts(before_all):
+    network, deposit_1, amount = before_all
+    deposit_2 = network.add_addresses(["0xf001", "0x200d", "0x7j4f", "0x20a", "0x90y6", "0xd7fe"])
+    network.send(deposit_1, deposit_2, "50.0")
+
+    # Sender is debited right away, installments are paid out in the background
+    assert network.mixer.get_balance(deposit_1) == Decimal(amount) * Decimal("0.98") - Decimal("50.0")
+    assert len(network.pending_payouts()) > 0
+
+    assert network.wait_for_payouts()
+    assert network.pending_payouts() == []
+    assert network.mixer.get_balance(deposit_2) == Decimal("50.0") * Decimal("0.98")
+
+def test_send_many(before_all):
+    network, deposit_1, amount = before_all
+    deposit_2 = network.add_addresses(["0xf001", "0x200d"])
+    deposit_3 = network.add_addresses(["0x7j4f", "0x20a"])
+
+    results = network.send_many([
+        (deposit_1, deposit_2, "50.0"),
+        (deposit_1, deposit_3, "30.0"),
+        (BitcoinZNetwork.MINTED, deposit_3, "10.0"),
+    ])
+    network.wait_for_payouts()
+
+    assert results == [None, None, None]
+    assert network.mixer.get_balance(deposit_1) == Decimal("18.0")
+    assert network.mixer.get_balance(deposit_2) == Decimal("49.0")
+    assert network.mixer.get_balance(deposit_3) == Decimal("39.2")
+    assert network.get_num_coins_minted() == Decimal("110.0")
+
+def test_send_many_atomic_rejects_whole_batch(before_all):
+    network, deposit_1, amount = before_all
+    deposit_2 = network.add_addresses(["0xf001", "0x200d"])
+
+    # Each row fits the balance on its own, but not both together
+    with pytest.raises(BatchSendException) as e:
+        network.send_many([(deposit_1, deposit_2, "60.0"), (deposit_1, deposit_2, "60.0"), (deposit_1, "0xd7fe", "1")])
+
+    assert sorted(e.value.errors) == [1, 2]
+    assert network.mixer.get_balance(deposit_1) == Decimal(amount) * Decimal("0.98")
+    assert network.mixer.get_balance(deposit_2) == Decimal(0)
+
+def test_send_many_per_row_errors(before_all):
+    network, deposit_1, amount = before_all
+    deposit_2 = network.add_addresses(["0xf001", "0x200d"])
+
+    results = network.send_many([(deposit_1, deposit_2, "60.0"), (deposit_1, deposit_2, "60.0"), (deposit_1, deposit_2, "abc")], atomic=False)
+    network.wait_for_payouts()
+
+    assert results[0] is None
+    assert isinstance(results[1], InsufficientBalanceException)
+    assert isinstance(results[2], ValueError)
+    assert network.mixer.get_balance(deposit_2) == Decimal("60.0") * Decimal("0.98")
+
+def test_failed_commit_mints_nothing(before_all):
+    network, deposit_1, amount = before_all
+    deposit_2 = network.add_addresses(["0xf001", "0x200d"])
+    # Balances read before a concurrent send drained deposit_1, so validation passes but the commit fails
+    stale = network.mixer.get_wallet_balances([deposit_1, deposit_2])
+    stale[deposit_1] = 1000 * 10 ** 8
+    network.mixer.get_wallet_balances = lambda addresses: stale
+
+    with pytest.raises(InsufficientBalanceException):
+        network.send_many([(BitcoinZNetwork.MINTED, deposit_2, "5"), (deposit_1, deposit_2, "500")])
+    assert network.get_num_coins_minted() == Decimal(amount)
+    assert network.mixer.get_balance(deposit_2) == Decimal(0)
+
+def test_query_transactions_pages(before_all):
+    network, deposit_1, amount = before_all
+    deposit_2 = network.add_addresses(["0xf001", "0x200d"])
+    network.send_many([(deposit_1, deposit_2, "1.5")] * 5)
+
+    page = network.query_transactions(deposit_2, limit=2)
+    records = list(page.records)
+    while page.next_cursor is not None:
+        page = network.query_transactions(deposit_2, cursor=page.next_cursor, limit=2)
+        records.extend(page.records)
+
+    assert len(records) == 5
+    assert records[0] == {"timestamp": records[0]["timestamp"], "fromAddress": deposit_1, "toAddress": deposit_2, "amount": "1.5"}
+    assert len(network.query_transactions(limit=100).records) == 6
+    assert network.query_transactions("0xd7fe").records == []
+
+def test_query_transactions_time_range(before_all):
+    network, deposit_1, amount = before_all
+    first = network.query_transactions(deposit_1).records[0]["timestamp"]
+
+    assert network.query_transactions(deposit_1, since=first).records[0]["timestamp"] == first
+    assert network.query_transactions(deposit_1, until=first).records == []
+    assert list(network.iter_transactions(until="9999-01-01T00:00:00+00:00")) == network.query_transactions().records
+
+def test_parse_timestamp_strings():
+    from project.bitcoinz.transaction import format_timestamp, parse_timestamp
+    timestamp_ns = 1644296350709213000
+    assert parse_timestamp(format_timestamp(timestamp_ns)) == timestamp_ns
+    assert parse_timestamp("2022-02-08T05:59:10.709213+01:00") == timestamp_ns
+    assert parse_timestamp("2022-02-08T04:59:10.709213Z") == timestamp_ns
+    assert parse_timestamp("2022-02-08") == 1644278400 * 10 ** 9
+    with pytest.raises(ValueError):
+        parse_timestamp("yesterday")
+
+def test_dump_transactions_json_lines(before_all):
+    import io, json
+    network, deposit_1, amount = before_all
+    buffer = io.StringIO()
+
+    assert network.dump_transactions(buffer) == 1
+    assert json.loads(buffer.getvalue().splitlines()[0])["amount"] == "100.0"
+
+def test_transaction_log_is_columnar(before_all):
+    network, deposit_1, amount = before_all
+    deposit_2 = network.add_addresses(["0xf001", "0x200d"])
+    network.send(deposit_1, deposit_2, "10.0")
+    log = network.mixer.storage.log
+
+    assert len(log) == 2
+    assert log.to_address(1) == deposit_2
+    assert log.from_ids[1] == log.to_ids[0]
+    assert list(network.mixer.storage.wallets[deposit_1].transactions) == [0, 1]
+    assert not hasattr(network.mixer.storage.wallets[deposit_2].iter_transactions().__next__(), "__dict__")
+
+def test_standalone_transaction_holds_its_fields():
+    transaction = Transaction("0x4g7z", "0x8a54", 5, timestamp_ns=10 ** 18)
+    assert transaction.row is None
+    assert (transaction.fromAddress, transaction.toAddress, transaction.amount) == ("0x4g7z", "0x8a54", 5)
+    assert transaction.to_dict()["timestamp"] == "2001-09-09T01:46:40.000000+00:00"
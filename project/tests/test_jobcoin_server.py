@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+from project.bitcoinz.http_client import JobcoinClient
+from project.jobcoin_server import JobcoinServer, running
+
+
+def test_endpoints_track_balances():
+    with running(JobcoinServer()) as server:
+        client = JobcoinClient(server.url + "/iodine-defrost")
+        assert client.create("alice").status_code == 200
+        assert client.post_transaction("alice", "bob", "12.5").status_code == 200
+        assert client.post_transaction("alice", "bob", "100").json() == {"error": "Insufficient Funds"}
+
+        bob = client.get_address("bob").json()
+        assert bob["balance"] == "12.5"
+        assert bob["transactions"] == [{"fromAddress": "alice", "toAddress": "bob", "amount": "12.5"}]
+        assert len(client.get_transactions().json()) == 2
+        client.close()
+
+
+def test_injects_faults():
+    with running(JobcoinServer(error_rate=1.0)) as server:
+        assert JobcoinClient(server.url).get_transactions().status_code == 503
+
+    with running(JobcoinServer(insufficient_balance_rate=1.0)) as server:
+        client = JobcoinClient(server.url)
+        client.create("alice")
+        assert client.post_transaction("alice", "bob", "1").status_code == 422
+        assert server.balance("alice") == 50 * 10 ** 8
+
+
+def test_rate_limits_per_client():
+    with running(JobcoinServer(rate_limit=1, burst=3)) as server:
+        client = JobcoinClient(server.url)
+        statuses = [client.get_transactions().status_code for _ in range(5)]
+        assert statuses[:3] == [200, 200, 200]
+        assert 429 in statuses[3:]
+        assert server.status_counts[429] >= 1
+
+
+def test_idempotency_keys_apply_posts_once():
+    with running(JobcoinServer(lost_response_rate=1.0)) as server:
+        client = JobcoinClient(server.url)
+        server.balances["alice"] = 10 * 10 ** 8
+        for _ in range(3):
+            assert client.post_transaction("alice", "bob", "4", idempotency_key="k1").status_code == 503
+        assert server.balance("bob") == 4 * 10 ** 8
+        server.lost_response_rate = 0.0
+        assert client.post_transaction("alice", "bob", "4", idempotency_key="k1").status_code == 200
+        assert client.post_transaction("alice", "bob", "4", idempotency_key="k2").status_code == 200
+        assert server.balance("bob") == 8 * 10 ** 8
+        client.close()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+import json
+
+import pytest
+from project.bitcoinz.amount import COIN
+from project.bitcoinz.bitcoinz_network import BitcoinZAPINetwork, BitcoinZNetwork
+from project.bitcoinz.exceptions import InsufficientBalanceException
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import NULL_METRICS, MetricsRegistry
+from project.bitcoinz.mixer import APIBasedMixer, Mixer
+from project.bitcoinz.scheduler import PayoutScheduler
+from project.jobcoin_server import JobcoinServer, running
+
+
+def test_registry_exports_prometheus_and_json():
+    registry = MetricsRegistry()
+    registry.counter("sends_total", "Sends.").inc(3)
+    registry.gauge("queue_depth", "Queue.").set_function(lambda: 7)
+    latency = registry.histogram("latency_seconds", "Latency.", ("method",), buckets=(0.1, 1.0))
+    latency.labels("GET").observe(0.05)
+    latency.labels("GET").observe(0.5)
+    latency.labels("GET").observe(5)
+
+    text = registry.to_prometheus()
+    assert "# TYPE sends_total counter\nsends_total 3\n" in text
+    assert "queue_depth 7\n" in text
+    assert 'latency_seconds_bucket{method="GET",le="0.1"} 1\n' in text
+    assert 'latency_seconds_bucket{method="GET",le="1.0"} 2\n' in text
+    assert 'latency_seconds_bucket{method="GET",le="+Inf"} 3\n' in text
+    assert 'latency_seconds_count{method="GET"} 3\n' in text
+
+    snapshot = json.loads(registry.to_json())
+    assert snapshot["sends_total"]["samples"] == [{"labels": {}, "value": 3}]
+    assert snapshot["latency_seconds"]["samples"][0]["value"]["count"] == 3
+    assert registry.counter("sends_total", "Sends.") is registry.counter("sends_total", "Sends.")
+    with pytest.raises(ValueError):
+        registry.gauge("sends_total", "Sends.")
+
+
+def test_mixer_records_sends_fees_and_latencies():
+    registry = MetricsRegistry()
+    network = BitcoinZNetwork(Mixer(scheduler=PayoutScheduler(background=False), metrics=registry), metrics=registry)
+    sender = network.add_addresses(["0x1"])
+    receiver = network.add_addresses(["0x2", "0x3"])
+    network.send(BitcoinZNetwork.MINTED, sender, "10")
+    assert registry.gauge("bitcoinz_payout_queue_depth", "").value() == 1
+    network.wait_for_payouts()
+    network.send(sender, receiver, "5")
+    with pytest.raises(InsufficientBalanceException):
+        network.send(sender, receiver, "100")
+    network.wait_for_payouts()
+
+    snapshot = registry.snapshot()
+    assert registry.counter("bitcoinz_sends_total", "").value() == 2
+    assert registry.counter("bitcoinz_mints_total", "").value() == 1
+    assert registry.counter("bitcoinz_fees_collected_units_total", "").value() == network.mixer.fees_collected == 3 * COIN // 10
+    assert snapshot["bitcoinz_send_rejections_total"]["samples"] == [{"labels": {"reason": "insufficient_balance"}, "value": 1}]
+    assert snapshot["bitcoinz_execute_transaction_seconds"]["samples"][0]["value"]["count"] == 2
+    assert snapshot["bitcoinz_installment_seconds"]["samples"][0]["value"]["count"] == 3
+    assert snapshot["bitcoinz_wallets"]["samples"][0]["value"] == 2
+    assert snapshot["bitcoinz_payout_queue_depth"]["samples"][0]["value"] == 0
+
+
+def test_api_mixer_records_http_latency():
+    registry = MetricsRegistry()
+    with running(JobcoinServer()) as server:
+        mixer = APIBasedMixer(client=JobcoinClient(server.url, metrics=registry), metrics=registry)
+        mixer.MAX_INSTALLMENT_DELAY = 0.01
+        network = BitcoinZAPINetwork(mixer, metrics=registry)
+        deposit = network.add_addresses(["0x4g7z", "0x8a54", "0xf001"])
+        network.send(BitcoinZAPINetwork.MINTED, deposit, "50")
+        assert network.wait_for_payouts(timeout=5)
+        mixer.client.close()
+
+    text = registry.to_prometheus()
+    # One installment per private address
+    installments = registry.histogram("bitcoinz_installment_seconds", "").snapshot()["count"]
+    assert installments == 3
+    assert 'bitcoinz_http_request_seconds_count{method="POST",status="200"} ' + str(installments + 1) + "\n" in text
+    assert "bitcoinz_sends_total 1\n" in text
+
+
+def test_metrics_disabled_by_default():
+    network = BitcoinZNetwork(Mixer(scheduler=PayoutScheduler(background=False)))
+    deposit = network.add_addresses(["0x1"])
+    network.send(BitcoinZNetwork.MINTED, deposit, "10")
+    network.wait_for_payouts()
+
+    assert network.metrics is NULL_METRICS and network.mixer.metrics is NULL_METRICS
+    assert NULL_METRICS.snapshot() == {} and NULL_METRICS.to_prometheus() == ""
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+import pytest
+from project.bitcoinz.amount import COIN
+from project.bitcoinz.bitcoinz_network import BitcoinZAPINetwork
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.mirror import TransactionMirror
+from project.bitcoinz.mixer import APIBasedMixer
+from project.jobcoin_server import JobcoinServer, running
+
+
+@pytest.fixture
+def jobcoin_api():
+    with running(JobcoinServer()) as server:
+        client = JobcoinClient(server.url)
+        yield client, server
+        client.close()
+
+
+def test_mirror_fetches_only_new_transactions(jobcoin_api):
+    client, server = jobcoin_api
+    registry = MetricsRegistry()
+    mirror = TransactionMirror(client, metrics=registry)
+    fetched = registry.counter("bitcoinz_mirror_fetched_bytes_total", "")
+
+    assert mirror.sync() == 0
+    assert mirror.lookup(None) == []
+    client.create("alice")
+    client.create("alice")
+    client.post_transaction("alice", "bob", "12.5")
+    assert mirror.sync() == 3
+
+    for i in range(200):
+        client.post_transaction("alice", "bob", "0.01")
+    assert mirror.sync() == 200
+    client.post_transaction("bob", "carol", "1")
+    before = fetched.value()
+    assert mirror.sync() == 1
+    # The suffix plus the overlap, not the whole feed
+    assert fetched.value() - before < 200
+    assert mirror.sync() == 0
+
+    assert mirror.lookup(None) == server.transactions
+    for address in ("alice", "bob", "carol"):
+        assert mirror.balance(address) == server.balance(address)
+        assert mirror.lookup(address) == client.get_address(address).json()
+    assert registry.counter("bitcoinz_mirror_rebuilds_total", "").value() == 1
+
+
+def test_mirror_rebuilds_when_history_is_rewritten(jobcoin_api):
+    client, server = jobcoin_api
+    mirror = TransactionMirror(client)
+    client.create("alice")
+    mirror.sync()
+
+    with running(JobcoinServer()) as other:
+        mirror.client = JobcoinClient(other.url)
+        other_client = JobcoinClient(other.url)
+        other_client.create("bob")
+        other_client.create("bob")
+        assert mirror.sync() == 2
+        assert mirror.balance("alice") == 0
+        assert mirror.balance("bob") == 100 * COIN
+        other_client.close()
+        mirror.client.close()
+
+
+def test_api_mixer_answers_lookups_from_mirror(jobcoin_api):
+    client, server = jobcoin_api
+    mixer = APIBasedMixer(client=client, mirror=TransactionMirror(client))
+    mixer.MAX_INSTALLMENT_DELAY = 0.01
+    network = BitcoinZAPINetwork(mixer)
+    deposit = network.add_addresses(["0x4g7z", "0x8a54"])
+    network.send(BitcoinZAPINetwork.MINTED, deposit, "50")
+    assert network.wait_for_payouts(timeout=5)
+
+    requests_before = server.num_requests
+    assert network.get_transactions(deposit) == client.get_address(deposit).json()
+    assert network.get_transactions() == server.transactions
+    # A sync per cache miss of the mixer and the reference lookup, no address lookups by the mixer
+    assert server.num_requests == requests_before + 3
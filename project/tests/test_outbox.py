@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+import os
+import time
+
+import pytest
+from project.bitcoinz.amount import COIN
+from project.bitcoinz.bitcoinz_network import BitcoinZAPINetwork
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.mixer import APIBasedMixer
+from project.bitcoinz.outbox import DELIVERED, FAILED, PENDING, PayoutOutbox
+from project.jobcoin_server import JobcoinServer, running
+
+
+@pytest.fixture
+def jobcoin_api():
+    with running(JobcoinServer(seed=7)) as server:
+        client = JobcoinClient(server.url)
+        yield client, server
+        client.close()
+
+
+def test_retries_lost_responses_without_paying_twice(jobcoin_api, tmp_path):
+    client, server = jobcoin_api
+    registry = MetricsRegistry()
+    # Enough attempts that no installment loses every response
+    outbox = PayoutOutbox(os.path.join(str(tmp_path), "outbox.db"), client, max_attempts=50, base_delay=0.001, background=False,
+                          metrics=registry)
+    network = BitcoinZAPINetwork(APIBasedMixer(client=client, outbox=outbox))
+    deposits = [network.add_addresses(["0x{}a".format(i), "0x{}b".format(i)]) for i in range(5)]
+    for deposit in deposits:
+        network.send(BitcoinZAPINetwork.MINTED, deposit, "50")
+    assert outbox.num_pending() > 0
+
+    # Half of the installments are applied but their response is lost, so they are posted again
+    server.lost_response_rate = 0.5
+    assert network.wait_for_payouts(timeout=30)
+    for i, deposit in enumerate(deposits):
+        assert server.balance(deposit) == 0
+        assert server.balance("0x{}a".format(i)) + server.balance("0x{}b".format(i)) == 49 * COIN
+    assert all(entry.status == DELIVERED for entry in outbox.entries())
+    assert registry.counter("bitcoinz_outbox_attempts_total", "", ("result",)).labels("retried").value() > 0
+    outbox.close()
+
+
+def test_resumes_undelivered_installments(jobcoin_api, tmp_path):
+    client, server = jobcoin_api
+    path = os.path.join(str(tmp_path), "outbox.db")
+    outbox = PayoutOutbox(path, client, background=False)
+    mixer = APIBasedMixer(client=client, outbox=outbox)
+    mixer.MAX_INSTALLMENT_DELAY = 0.01
+    deposit = mixer.get_deposit_address(["0x4g7z"])
+    mixer.execute_transaction(BitcoinZAPINetwork.MINTED, deposit, "50", True)
+    pending = outbox.num_pending()
+    outbox.close()
+    assert pending > 0 and server.balance("0x4g7z") == 0
+
+    resumed = PayoutOutbox(path, client, max_in_flight=2)
+    assert resumed.drain(timeout=10)
+    assert server.balance("0x4g7z") == 49 * COIN
+    assert len(resumed.entries(DELIVERED)) == pending
+    resumed.close()
+
+
+def test_rejected_installments_fail_without_retries(jobcoin_api, tmp_path):
+    client, server = jobcoin_api
+    outbox = PayoutOutbox(os.path.join(str(tmp_path), "outbox.db"), client, background=False)
+    outbox.enqueue([(0.0, "nobody", "bob", "1")])
+    assert outbox.run_pending() == 1
+    [entry] = outbox.entries()
+    assert entry.status == FAILED and entry.attempts == 1 and entry.last_error == "HTTP 422"
+    assert outbox.entries(PENDING) == []
+    outbox.close()
+
+
+def test_unexpected_client_errors_count_as_failed_attempts(jobcoin_api, tmp_path):
+    client, server = jobcoin_api
+    client.create("0x7h2k")
+    post_transaction = client.post_transaction
+    calls = []
+
+    def flaky_post(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ValueError("Unparseable response")
+        return post_transaction(*args, **kwargs)
+
+    client.post_transaction = flaky_post
+    outbox = PayoutOutbox(os.path.join(str(tmp_path), "outbox.db"), client, base_delay=0.001)
+    outbox.enqueue([(0.0, "0x7h2k", "bob", "1")])
+    assert outbox.drain(timeout=10)
+    [entry] = outbox.entries()
+    assert entry.status == DELIVERED and entry.attempts == 2
+    assert server.balance("bob") == COIN
+    outbox.close()
+
+
+def test_wait_for_payouts_shares_one_timeout(jobcoin_api, tmp_path):
+    client, server = jobcoin_api
+    outbox = PayoutOutbox(os.path.join(str(tmp_path), "outbox.db"), client, background=False)
+    mixer = APIBasedMixer(client=client, outbox=outbox)
+    timeouts = []
+
+    def slow_drain(timeout):
+        time.sleep(0.3)
+        return True
+
+    def outbox_drain(timeout):
+        timeouts.append(timeout)
+        return True
+
+    mixer.scheduler.drain = slow_drain
+    outbox.drain = outbox_drain
+    assert mixer.wait_for_payouts(timeout=1.0)
+    assert timeouts[0] <= 0.7
+    outbox.close()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+import os
+import time
+
+import pytest
+import requests
+from project.benchmarks.suite import FakeClock
+from project.bitcoinz.exceptions import CircuitOpenException
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.outbox import PENDING, PayoutOutbox
+from project.bitcoinz.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from project.jobcoin_server import JobcoinServer, running
+
+
+class _Response:
+    status_code = 200
+
+    def close(self):
+        pass
+
+
+def test_breaker_opens_probes_and_closes():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=5.0, clock=clock)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record(False)
+    assert breaker.state == OPEN and not breaker.allow()
+    assert breaker.retry_after() == 5.0
+
+    clock.now += 5.0
+    assert breaker.state == HALF_OPEN
+    # A single probe; it fails, so the breaker opens again
+    assert breaker.allow() and not breaker.allow()
+    # Turned away while the probe is in flight, so not told to retry at once
+    assert breaker.retry_after() == 5.0
+    breaker.record(False)
+    assert breaker.state == OPEN
+
+    clock.now += 5.0
+    assert breaker.allow()
+    breaker.record(True)
+    assert breaker.state == CLOSED and breaker.allow()
+    assert breaker.num_rejected == 2
+
+
+def test_slow_calls_time_out_and_open_the_breaker():
+    with running(JobcoinServer(latency=0.3)) as server:
+        registry = MetricsRegistry()
+        client = JobcoinClient(server.url, metrics=registry, timeout=(1.0, 0.05), breaker=CircuitBreaker(failure_threshold=2),
+                               hedge_reads=True)
+        for _ in range(2):
+            with pytest.raises(requests.Timeout):
+                client.get_address("alice")
+        with pytest.raises(CircuitOpenException):
+            client.post_transaction("alice", "bob", "1")
+        assert registry.gauge("bitcoinz_circuit_breaker_state", "").value() == 2
+        client.close()
+
+
+def test_slow_reads_are_hedged():
+    registry = MetricsRegistry()
+    client = JobcoinClient("http://jobcoin.invalid", metrics=registry, hedge_reads=True)
+    calls = []
+
+    def send(method, url, **kwargs):
+        calls.append(method)
+        if len(calls) == 21:
+            time.sleep(0.5)
+        return _Response()
+
+    client._send = send
+    for _ in range(20):
+        client.get_transactions()
+    start = time.perf_counter()
+    client.get_transactions()
+    assert time.perf_counter() - start < 0.4
+    assert len(calls) == 22
+    assert registry.counter("bitcoinz_http_hedged_requests_total", "").value() == 1
+    # Writes are never sent twice
+    client.post_transaction("alice", "bob", "1")
+    assert len(calls) == 23
+    client.close()
+
+
+def test_outbox_queues_installments_while_breaker_is_open(tmp_path):
+    with running(JobcoinServer()) as server:
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60.0)
+        client = JobcoinClient(server.url, breaker=breaker)
+        outbox = PayoutOutbox(os.path.join(str(tmp_path), "outbox.db"), client, background=False)
+        breaker.allow()
+        breaker.record(False)
+        outbox.enqueue([(0.0, "alice", "bob", "1")])
+        assert outbox.run_pending() == 1
+        [entry] = outbox.entries(PENDING)
+        assert entry.attempts == 0 and entry.not_before > time.time() + 50
+        outbox.close()
+        client.close()
+
+
+def test_outbox_defers_installments_while_breaker_probes(tmp_path):
+    with running(JobcoinServer()) as server:
+        clock = FakeClock()
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0, clock=clock)
+        client = JobcoinClient(server.url, breaker=breaker)
+        outbox = PayoutOutbox(os.path.join(str(tmp_path), "outbox.db"), client, background=False)
+        breaker.allow()
+        breaker.record(False)
+        clock.now += 30.0
+        # Another caller's probe is in flight
+        assert breaker.allow()
+        outbox.enqueue([(0.0, "alice", "bob", "1")])
+        assert outbox.run_pending() == 1
+        [entry] = outbox.entries(PENDING)
+        assert entry.attempts == 0 and entry.not_before > time.time() + 25
+        assert outbox.run_pending() == 0
+        outbox.close()
+        client.close()
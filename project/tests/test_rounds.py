@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+import os
+import random
+from decimal import Decimal
+
+from project.benchmarks.suite import FakeClock
+from project.bitcoinz.amount import COIN
+from project.bitcoinz.bitcoinz_network import BitcoinZAPINetwork, BitcoinZNetwork
+from project.bitcoinz.events import INSTALLMENT_PAID, TRANSACTION_COMPLETED
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.mixer import APIBasedMixer, Mixer
+from project.bitcoinz.outbox import PayoutOutbox
+from project.bitcoinz.rounds import PayoutRounds
+from project.bitcoinz.scheduler import PayoutScheduler
+from project.jobcoin_server import JobcoinServer, running
+
+
+def test_rounds_coalesce_installments_due_by_the_round():
+    clock = FakeClock()
+    scheduler = PayoutScheduler(clock=clock, background=False)
+    rounds_paid = []
+    rounds = PayoutRounds(scheduler, rounds_paid.append, window=1.0, rng=random.Random(1))
+    rounds.submit_many([(0.0, "alice", 10, "a"), (0.5, "bob", 20, "b"), (0.9, "alice", 5, "c"), (2.5, "alice", 1, "d")])
+    assert scheduler.num_pending() == 1
+
+    clock.now = 1.0
+    scheduler.run_pending()
+    [paid] = rounds_paid
+    assert sorted((t.receiver, t.amount, sorted(t.parts)) for t in paid) == [("alice", 15, ["a", "c"]), ("bob", 20, ["b"])]
+    assert rounds.num_pending() == 1
+
+    # Rounds skip ahead to the next installment due
+    clock.now = 2.0
+    assert scheduler.run_pending() == 0
+    clock.now = 2.5
+    scheduler.run_pending()
+    assert [(t.receiver, t.amount) for t in rounds_paid[1]] == [("alice", 1)]
+    assert rounds.num_pending() == 0 and scheduler.num_pending() == 0
+
+
+def test_mixer_pays_rounds_in_one_commit_per_round():
+    registry = MetricsRegistry()
+    mixer = Mixer(scheduler=PayoutScheduler(background=False), metrics=registry, round_window=2.0)
+    network = BitcoinZNetwork(mixer)
+    paid, completed = [], []
+    network.events.subscribe(paid.append, [INSTALLMENT_PAID])
+    network.events.subscribe(completed.append, [TRANSACTION_COMPLETED])
+    deposits = [network.add_addresses(["0x{}a".format(i), "0x{}b".format(i), "0x{}c".format(i)]) for i in range(3)]
+    for _ in range(20):
+        for deposit in deposits:
+            network.send(BitcoinZNetwork.MINTED, deposit, "1")
+
+    assert network.wait_for_payouts()
+    assert len(completed) == 60
+    # Installments are due within 5 seconds, so at most 4 rounds of one transfer per private address
+    assert registry.counter("bitcoinz_payout_round_installments_total", "").value() == 180
+    assert len(paid) == registry.counter("bitcoinz_payout_round_transfers_total", "").value() <= 4 * 9
+    assert mixer.payouts_owed == {}
+    for i, deposit in enumerate(deposits):
+        assert mixer.get_balance_units(deposit) == 20 * COIN * 98 // 100
+        assert sum(mixer.get_received("0x{}{}".format(i, suffix)) for suffix in "abc") == Decimal("19.6")
+
+
+def test_api_mixer_posts_one_batch_per_round(tmp_path):
+    with running(JobcoinServer()) as server:
+        client = JobcoinClient(server.url)
+        outbox = PayoutOutbox(os.path.join(str(tmp_path), "outbox.db"), client, background=False)
+        mixer = APIBasedMixer(scheduler=PayoutScheduler(background=False), client=client, outbox=outbox, round_window=5.0)
+        network = BitcoinZAPINetwork(mixer)
+        completed = []
+        network.events.subscribe(completed.append, [TRANSACTION_COMPLETED])
+        deposit = network.add_addresses(["0x4g7z", "0x8a54"])
+        for _ in range(10):
+            network.send(BitcoinZAPINetwork.MINTED, deposit, "10")
+        posted = len(server.transactions)
+
+        assert network.wait_for_payouts(timeout=30)
+        assert server.balance(deposit) == 0
+        assert server.balance("0x4g7z") + server.balance("0x8a54") == 98 * COIN
+        assert len(completed) == 10
+        # One installment per private address, all due within 2.5 seconds: a single round, queued as one
+        # outbox batch of one transfer per private address
+        assert len(server.transactions) - posted == 2
+        assert len({entry.batch for entry in outbox.entries()}) == 1
+        outbox.close()
+        client.close()
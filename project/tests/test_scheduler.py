@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import pytest
+from project.bitcoinz.scheduler import PayoutScheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_runs_due_payouts_in_order():
+    clock = FakeClock()
+    scheduler = PayoutScheduler(clock=clock, background=False)
+    paid = []
+    scheduler.schedule(2.0, paid.append, "second")
+    scheduler.schedule(0.0, paid.append, "first")
+    scheduler.schedule(5.0, paid.append, "third")
+
+    assert scheduler.run_pending() == 1
+    clock.now = 2.5
+    assert scheduler.run_pending() == 1
+    assert paid == ["first", "second"]
+    assert len(scheduler.pending()) == 1
+
+    assert scheduler.drain()
+    assert paid == ["first", "second", "third"]
+    assert [payout.args[0] for payout in scheduler.completed()] == paid
+
+
+def test_background_worker_executes_payouts():
+    scheduler = PayoutScheduler()
+    paid = []
+    payouts = [scheduler.schedule(0.01 * i, paid.append, i) for i in range(5)]
+
+    assert scheduler.drain(timeout=5)
+    assert all(payout.is_done() for payout in payouts)
+    assert paid == list(range(5))
+    assert scheduler.num_pending() == 0
+    scheduler.shutdown()
+
+
+def test_failed_payout_records_error():
+    scheduler = PayoutScheduler(background=False)
+
+    def fail():
+        raise ValueError("boom")
+
+    payout = scheduler.schedule(0, fail)
+    scheduler.drain()
+    assert payout.is_done()
+    assert isinstance(payout.error, ValueError)
+
+
+def test_shutdown_rejects_new_payouts():
+    scheduler = PayoutScheduler()
+    scheduler.shutdown()
+    with pytest.raises(RuntimeError):
+        scheduler.schedule(0, print)
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+import os
+import threading
+import time
+from decimal import Decimal
+
+import pytest
+from click.testing import CliRunner
+from project import cli
+from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.exceptions import DepositAddressDoesntExistException, InsufficientBalanceException
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.mixer import Mixer
+from project.bitcoinz.service import MixerService, ServiceClient, running
+
+
+def _network():
+    mixer = Mixer()
+    mixer.MAX_INSTALLMENT_DELAY = 0.05
+    return BitcoinZNetwork(mixer, metrics=MetricsRegistry())
+
+
+def test_clients_share_one_network():
+    network = _network()
+    with running(MixerService(network)) as service:
+        client = ServiceClient(service.url)
+        deposit = client.add_addresses(["0x4g7z", "0x8a54"])
+        client.send(ServiceClient.MINTED, deposit, "10")
+        with pytest.raises(DepositAddressDoesntExistException):
+            client.send(ServiceClient.MINTED, "nowhere", "1")
+        with pytest.raises(InsufficientBalanceException):
+            client.send(client.add_addresses(["0x1a2b"]), deposit, "1000")
+        with pytest.raises(ValueError):
+            client.send(ServiceClient.MINTED, deposit, "-1")
+
+        def send():
+            other = ServiceClient(service.url)
+            for _ in range(10):
+                other.send(ServiceClient.MINTED, deposit, "1")
+            other.close()
+
+        threads = [threading.Thread(target=send) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert client.get_fees_collected() == str(network.get_fees_collected()) == "1.00000000"
+        assert len(list(client.iter_transactions(deposit))) == len(list(network.iter_transactions(deposit)))
+        assert 'bitcoinz_send_rejections_total{reason="insufficient_balance"} 1' in client.metrics.to_prometheus()
+        client.close()
+
+
+def test_pipelined_responses_arrive_in_request_order():
+    network = _network()
+    with running(MixerService(network)) as service:
+        client = ServiceClient(service.url)
+        deposit = client.add_addresses(["0x4g7z"])
+        requests = []
+        for i in range(50):
+            requests.append(("POST", "/send", {"receiver": deposit if i % 2 == 0 else "nowhere", "amount": "1"}))
+        results = client.pipeline(requests)
+        assert [isinstance(result, DepositAddressDoesntExistException) for result in results] == [i % 2 == 1 for i in range(50)]
+        assert service.num_requests == 51
+        client.close()
+
+
+def test_pipelined_requests_run_in_request_order():
+    network = _network()
+    send = network.send
+
+    def slow_send(*args):
+        # Later requests would overtake this one if they ran concurrently
+        time.sleep(0.05)
+        send(*args)
+
+    network.send = slow_send
+    with running(MixerService(network)) as service:
+        client = ServiceClient(service.url)
+        deposit = client.add_addresses(["0x4g7z"])
+        requests = []
+        for _ in range(5):
+            requests.append(("POST", "/send", {"receiver": deposit, "amount": "1"}))
+            requests.append(("GET", "/fees", None))
+        results = client.pipeline(requests, raise_errors=True)
+        assert [Decimal(result["fees_collected"]) for result in results[1::2]] == [Decimal("0.02") * i for i in range(1, 6)]
+        client.close()
+
+
+def test_stop_drains_pending_payouts(tmp_path):
+    network = _network()
+    path = os.path.join(str(tmp_path), "mixer.sock")
+    with running(MixerService(network, path=path)) as service:
+        client = ServiceClient(service.url)
+        deposit = client.add_addresses(["0x4g7z"])
+        client.send(ServiceClient.MINTED, deposit, "10")
+        client.close()
+    assert network.pending_payouts() == []
+    assert network.mixer.get_balance(deposit) == Decimal("9.8")
+
+
+def test_cli_uses_the_daemon():
+    network = _network()
+    with running(MixerService(network)) as service:
+        result = CliRunner().invoke(cli.main, ["--daemon", service.url], input="add_address 0x4g7z\nsend nowhere 1\n")
+        assert result.exit_code == 0
+        assert "You may now send BitcoinZs to address" in result.output
+        assert "Deposit address (nowhere) does not exist in the JobMixer" in result.output
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+import itertools
+
+import pytest
+from decimal import Decimal
+from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.exceptions import InsufficientBalanceException
+from project.bitcoinz.sharding import ShardedMixer
+from project.bitcoinz.transaction import Transaction
+
+
+@pytest.fixture(scope="module")
+def sharded():
+    mixer = ShardedMixer(num_shards=3)
+    yield BitcoinZNetwork(mixer)
+    mixer.close()
+
+
+_private_addresses = ("0x{:x}".format(i) for i in itertools.count())
+
+
+def _wallets_on(network, shards, num_addresses=2):
+    """
+    Deposit addresses on the given shards, in order, each with fresh private addresses.
+    """
+    wallets = {}
+    while set(shards) - set(wallets):
+        address = network.add_addresses([next(_private_addresses) for _ in range(num_addresses)])
+        wallets.setdefault(network.mixer.shard_of(address), address)
+    return [wallets[shard] for shard in shards]
+
+
+def test_send_within_and_across_shards(sharded):
+    sender, remote_receiver = _wallets_on(sharded, [0, 1])
+    [local_receiver] = _wallets_on(sharded, [0], num_addresses=1)
+
+    sharded.send(BitcoinZNetwork.MINTED, sender, "100.0")
+    sharded.wait_for_payouts()
+    sharded.send(sender, remote_receiver, "50.0")
+    sharded.send(sender, local_receiver, "10.0")
+    sharded.wait_for_payouts()
+
+    assert sharded.mixer.get_balance(sender) == Decimal("38")
+    assert sharded.mixer.get_balance(remote_receiver) == Decimal("49")
+    assert sharded.mixer.get_balance(local_receiver) == Decimal("9.8")
+    assert sharded.mixer.house_balance == 0
+    assert sharded.mixer.payouts_owed == {}
+    assert [record["amount"] for record in sharded.iter_transactions(sender)] == ["100.0", "50.0", "10.0"]
+    assert [record["amount"] for record in sharded.iter_transactions(remote_receiver)] == ["50.0"]
+
+
+def test_send_many_and_merged_history(sharded):
+    first, second = _wallets_on(sharded, [1, 2])
+    sharded.send_many([(BitcoinZNetwork.MINTED, first, "10"), (BitcoinZNetwork.MINTED, second, "10")])
+    sharded.wait_for_payouts()
+    sharded.send_many([(first, second, "5"), (second, first, "5")])
+    sharded.wait_for_payouts()
+
+    assert sharded.mixer.get_balance(first) == Decimal("9.7")
+    assert sharded.mixer.get_balance(second) == Decimal("9.7")
+    history = list(sharded.iter_transactions())
+    # Every transaction is listed once, in time order
+    assert len(history) == len({(r["timestamp"], r["toAddress"]) for r in history})
+    assert [r["timestamp"] for r in history] == sorted(r["timestamp"] for r in history)
+    page = sharded.query_transactions(limit=2)
+    assert page.records == history[:2] and page.next_cursor == 2
+
+
+def test_overdraft_is_rejected_by_the_shard(sharded):
+    sender, receiver = _wallets_on(sharded, [2, 0])
+    with pytest.raises(InsufficientBalanceException):
+        sharded.mixer.execute_transactions([(Transaction(sender, receiver, 1), False)])
+    assert sharded.mixer.get_balance(receiver) == 0
+    assert list(sharded.iter_transactions(sender)) == []
+
+
+def test_sharded_network_has_no_events(sharded):
+    with pytest.raises(NotImplementedError):
+        sharded.events.subscribe(print)
+    assert not sharded.mixer.metrics.enabled
+
+
+def test_private_addresses_are_unique_across_shards(sharded):
+    private_address = next(_private_addresses)
+    sharded.add_addresses([private_address])
+    for _ in range(8):
+        with pytest.raises(ValueError):
+            sharded.add_addresses([private_address])
+    assert sum(len(registered) for registered in sharded.mixer._broadcast("registered", ([private_address],))) == 1
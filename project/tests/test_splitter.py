@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+import random
+
+import pytest
+from project.bitcoinz.amount import COIN
+from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.mixer import Mixer
+from project.bitcoinz.scheduler import PayoutScheduler
+from project.bitcoinz.splitter import Dirichlet, InstallmentSplitter, UniformBreakpoints, UniformWeights
+
+
+@pytest.mark.parametrize("distribution", [UniformWeights(), UniformBreakpoints(), Dirichlet(0.5), Dirichlet(5.0)])
+def test_splits_sum_exactly_above_the_minimum(distribution):
+    rng = random.Random(42)
+    amounts = [(rng.randint(0, 10 ** 12), rng.randint(1, 8)) for _ in range(2000)]
+    splitter = InstallmentSplitter(distribution, min_installment=1000, rng=random.Random(7))
+    for (units, n), installments in zip(amounts, splitter.split_many(amounts)):
+        assert sum(installments) == units
+        assert len(installments) == min(n, max(1, units // 1000))
+        assert len(installments) == 1 or min(installments) >= 1000
+
+
+def test_small_amounts_get_fewer_installments():
+    splitter = InstallmentSplitter(min_installment=10, rng=random.Random(1))
+    assert sorted(splitter.split(25, 5)) in ([10, 15], [11, 14], [12, 13])
+    assert splitter.split(7, 5) == [7]
+    assert InstallmentSplitter(min_installment=0).split(0, 3) == [0, 0, 0]
+    with pytest.raises(ValueError):
+        Dirichlet(0)
+
+
+def test_mixer_splits_batches_with_its_splitter():
+    splitter = InstallmentSplitter(min_installment=COIN, rng=random.Random(3))
+    mixer = Mixer(scheduler=PayoutScheduler(background=False), splitter=splitter)
+    network = BitcoinZNetwork(mixer)
+    small = network.add_addresses(["0x1", "0x2", "0x3"])
+    large = network.add_addresses(["0x4", "0x5", "0x6"])
+    network.send_many([(BitcoinZNetwork.MINTED, small, "1.5"), (BitcoinZNetwork.MINTED, large, "100")])
+    amounts = sorted(payout.args[1] for payout in mixer.scheduler.pending())
+    assert len(amounts) == 4
+    assert all(amount >= COIN for amount in amounts)
+    assert sum(amounts) == mixer.payouts_owed[small] + mixer.payouts_owed[large]
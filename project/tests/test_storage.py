@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+import os
+import pytest
+from decimal import Decimal
+from project.bitcoinz.bitcoinz_network import BitcoinZNetwork
+from project.bitcoinz.exceptions import InsufficientBalanceException
+from project.bitcoinz.mixer import Mixer
+from project.bitcoinz.scheduler import PayoutScheduler
+from project.bitcoinz.storage import InMemoryStorage, LedgerChanges, SQLiteStorage, StripedInMemoryStorage
+
+
+def _sqlite_network(tmp_path, **storage_options):
+    storage = SQLiteStorage(os.path.join(str(tmp_path), "ledger.db"), **storage_options)
+    return BitcoinZNetwork(Mixer(scheduler=PayoutScheduler(background=False), storage=storage))
+
+
+def test_sqlite_network_matches_in_memory(tmp_path):
+    networks = [_sqlite_network(tmp_path), BitcoinZNetwork(Mixer(scheduler=PayoutScheduler(background=False)))]
+    summaries = []
+    for network in networks:
+        deposit_1 = network.add_addresses(["0x4g7z", "0x8a54"])
+        deposit_2 = network.add_addresses(["0xf001", "0x200d"])
+        network.send(BitcoinZNetwork.MINTED, deposit_1, "100.0")
+        network.wait_for_payouts()
+        network.send(deposit_1, deposit_2, "50.0")
+        network.wait_for_payouts()
+
+        assert network.mixer.get_balance(deposit_1) == Decimal("48")
+        assert network.mixer.get_balance(deposit_2) == Decimal("49")
+        assert network.get_fees_collected() == Decimal("3")
+        assert network.mixer.house_balance == 0
+        assert network.mixer.payouts_owed == {}
+        summaries.append(([record["amount"] for record in network.iter_transactions(deposit_1)],
+                          network.get_transactions(deposit_2).split(",")[0]))
+        network.mixer.close()
+
+    assert summaries[0] == summaries[1]
+
+
+def test_sqlite_query_pages(tmp_path):
+    network = _sqlite_network(tmp_path)
+    network.mixer.storage.SCAN_CHUNK = 2
+    deposit = network.add_addresses(["0x4g7z"])
+    for _ in range(5):
+        network.send(BitcoinZNetwork.MINTED, deposit, "1")
+
+    first = network.query_transactions(deposit, limit=3)
+    second = network.query_transactions(deposit, cursor=first.next_cursor, limit=3)
+    assert len(first.records) == 3 and len(second.records) == 2
+    assert second.next_cursor is None
+    assert len(list(network.iter_transactions(until=first.records[0]["timestamp"]))) == 0
+    network.mixer.close()
+
+
+def test_sqlite_ledger_survives_reopen(tmp_path):
+    network = _sqlite_network(tmp_path)
+    deposit = network.add_addresses(["0x4g7z", "0x8a54"])
+    network.send(BitcoinZNetwork.MINTED, deposit, "10.0")
+    house_address = network.mixer.storage.house_address
+    # Close without paying out: what is owed stays in the database
+    network.mixer.close(drain=False)
+
+    reopened = _sqlite_network(tmp_path)
+    assert reopened.mixer.storage.house_address == house_address
+    assert reopened.mixer.payouts_owed == {deposit: 980000000}
+    assert reopened.get_num_coins_minted() == Decimal("10")
+    reopened.mixer.resume_payouts()
+    reopened.wait_for_payouts()
+    assert reopened.mixer.get_balance(deposit) == Decimal("9.8")
+    reopened.mixer.close()
+
+
+def test_sqlite_shared_between_connections(tmp_path):
+    path = os.path.join(str(tmp_path), "ledger.db")
+    first, second = SQLiteStorage(path), SQLiteStorage(path, validate_interval=0)
+    lazy = SQLiteStorage(path, validate_interval=3600)
+    first.add_wallet("a", ["0x4g7z"])
+    changes = LedgerChanges()
+    changes.add_balance("a", 500)
+    first.commit(changes)
+    # Cached by the other connections, then changed by the first one
+    assert second.balance("a") == 500
+    assert lazy.balance("a") == 500
+
+    changes = LedgerChanges()
+    changes.add_balance("a", -200)
+    first.commit(changes)
+    assert second.balance("a") == 300
+    # Stale until the next check for other connections' commits
+    assert lazy.balance("a") == 500
+    lazy.validate_interval = 0
+    assert lazy.balance("a") == 300
+
+    # A connection's own commits keep its cache, and another's are still noticed afterwards
+    changes = LedgerChanges()
+    changes.add_balance("a", 100)
+    second.commit(changes)
+    changes = LedgerChanges()
+    changes.add_balance("a", 50)
+    lazy.commit(changes)
+    assert lazy.balance("a") == 450
+    for storage in (first, second, lazy):
+        storage.close()
+
+
+@pytest.mark.parametrize("storage_type", ["memory", "sqlite"])
+def test_overdraft_commits_nothing(tmp_path, storage_type):
+    storage = InMemoryStorage() if storage_type == "memory" else SQLiteStorage(os.path.join(str(tmp_path), "ledger.db"))
+    storage.add_wallet("a", ["0x4g7z"])
+    storage.add_wallet("b", ["0xf001"])
+    changes = LedgerChanges()
+    changes.add_balance("a", -1)
+    changes.add_balance("b", 1)
+    changes.add_transaction("a", "b", 1, 0)
+
+    with pytest.raises(InsufficientBalanceException):
+        storage.commit(changes)
+    assert storage.balance("b") == 0
+    assert storage.num_transactions() == 0
+    storage.close()
+
+
+@pytest.mark.parametrize("storage_type", ["memory", "striped", "sqlite"])
+def test_installments_are_paid_to_indexed_private_addresses(tmp_path, storage_type):
+    path = os.path.join(str(tmp_path), "ledger.db")
+    storage = {"memory": InMemoryStorage, "striped": StripedInMemoryStorage}.get(storage_type, lambda: SQLiteStorage(path))()
+    network = BitcoinZNetwork(Mixer(scheduler=PayoutScheduler(background=False), storage=storage, round_window=1.0))
+    deposit = network.add_addresses(["0x4g7z", "0x8a54"])
+    assert storage.wallet_of("0x8a54") == deposit and storage.wallet_of("0xf001") is None
+    with pytest.raises(ValueError):
+        network.add_addresses(["0xf001", "0x8a54"])
+    with pytest.raises(ValueError):
+        network.add_addresses(["0x200d", "0x200d"])
+    assert storage.num_wallets() == 1 and storage.wallet_of("0xf001") is None
+
+    network.send(BitcoinZNetwork.MINTED, deposit, "10")
+    network.wait_for_payouts()
+    received = [network.mixer.get_received(address) for address in ["0x4g7z", "0x8a54"]]
+    assert all(amount > 0 for amount in received) and sum(received) == network.mixer.get_balance(deposit) == Decimal("9.8")
+    assert network.mixer.payouts_owed == {}
+
+    if storage_type == "sqlite":
+        # Ledgers created before the index get it built when opened
+        storage._conn.execute("DELETE FROM private_addresses")
+        storage._conn.execute("DELETE FROM meta WHERE key = 'private_index'")
+        storage.close()
+        storage = SQLiteStorage(path)
+        assert storage.wallet_of("0x4g7z") == deposit and storage.received("0x4g7z") == 0
+    storage.close()
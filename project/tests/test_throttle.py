@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+import threading
+
+import pytest
+from project.benchmarks.suite import FakeClock
+from project.bitcoinz.http_client import JobcoinClient
+from project.bitcoinz.metrics import MetricsRegistry
+from project.bitcoinz.throttle import GET_TRANSACTIONS, POST_TRANSACTION, AdaptiveLimiter, Throttle, TokenBucket
+from project.jobcoin_server import JobcoinServer, running
+
+
+def test_token_bucket_spaces_calls_beyond_burst():
+    clock = FakeClock()
+    waits = []
+    bucket = TokenBucket(rate=10, burst=2, clock=clock, sleep=waits.append)
+    assert [bucket.acquire() for _ in range(4)] == pytest.approx([0.0, 0.0, 0.1, 0.2])
+    clock.now += 1.0
+    # Refilled up to the burst only
+    assert [bucket.acquire() for _ in range(3)] == pytest.approx([0.0, 0.0, 0.1])
+    assert len(waits) == 3
+
+
+def test_limiter_increases_additively_and_backs_off_once_per_round_trip():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(initial_limit=4, max_limit=6, latency_tolerance=None, clock=clock)
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(0.01)
+    assert limiter.limit == 6
+
+    # A burst of failures within one round trip halves the limit once
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(0.5, overloaded=True)
+    assert limiter.limit == 3
+    clock.now += 0.5
+    limiter.acquire()
+    limiter.release(0.5, overloaded=True)
+    assert limiter.limit == 1.5
+
+
+def test_limiter_backs_off_when_latency_grows():
+    clock = FakeClock()
+    limiter = AdaptiveLimiter(initial_limit=8, clock=clock)
+    for _ in range(10):
+        limiter.acquire()
+        limiter.release(0.01)
+    before = limiter.limit
+    limiter.acquire()
+    limiter.release(0.05)
+    assert limiter.baseline == 0.01
+    assert limiter.limit == before / 2
+
+
+def test_client_throttles_per_endpoint():
+    with running(JobcoinServer(rate_limit=20, burst=5)) as server:
+        writes = Throttle(limiter=AdaptiveLimiter(initial_limit=4))
+        reads = Throttle(rate=1000)
+        registry = MetricsRegistry()
+        client = JobcoinClient(server.url, metrics=registry, throttles={POST_TRANSACTION: writes, GET_TRANSACTIONS: reads})
+        client.create("alice")
+        statuses = [client.post_transaction("alice", "bob", "0.01").status_code for _ in range(20)]
+        assert statuses.count(429) == writes.num_overloaded > 0
+        assert writes.limiter.limit < 4
+        assert writes.limiter.in_flight == 0
+        assert registry.gauge("bitcoinz_throttle_limit", "", ("endpoint",)).labels(POST_TRANSACTION).value() == writes.limiter.limit
+        client.close()
+
+
+def test_throttle_counts_concurrent_callers():
+    class _Overloaded:
+        status_code = 429
+
+    throttle = Throttle(rate=1e9, limiter=AdaptiveLimiter(initial_limit=8, min_limit=8, latency_tolerance=None))
+
+    def call():
+        for _ in range(500):
+            throttle.call(_Overloaded)
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert throttle.num_overloaded == 4000
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+import os
+from decimal import Decimal
+
+import pytest
+
+from project.benchmarks.suite import FakeClock
+from project.bitcoinz.amount import COIN
+from project.bitcoinz.http_client import AsyncJobcoinClient, JobcoinClient
+from project.bitcoinz.mixer import APIBasedMixer, AsyncAPIBasedMixer
+from project.bitcoinz.outbox import PayoutOutbox
+from project.bitcoinz.scheduler import PayoutScheduler
+from project.bitcoinz.watcher import DepositWatcher
+from project.jobcoin_server import JobcoinServer, running
+
+
+def test_watcher_mixes_deposits_to_private_addresses():
+    with running(JobcoinServer()) as server:
+        client = JobcoinClient(server.url)
+        mixer = APIBasedMixer(scheduler=PayoutScheduler(clock=FakeClock(), background=False), client=client)
+        watcher = DepositWatcher(mixer, min_interval=0.1, max_interval=0.8)
+        deposits = [mixer.get_deposit_address(["0xa{}".format(i), "0xb{}".format(i)]) for i in range(1000)]
+        assert watcher.poll() == 0
+        assert watcher.interval == 0.2
+
+        # Two deposits to one address, one to another, and transfers that are not deposits
+        client.create("alice")
+        client.create("alice")
+        client.post_transaction("alice", deposits[0], "10")
+        client.post_transaction("alice", deposits[0], "5")
+        client.post_transaction("alice", deposits[7], "20")
+        client.post_transaction("alice", "bob", "1")
+        requests_before = server.num_requests
+        assert watcher.poll() == 2
+        # One feed sync and one transfer to the house account per deposit address mixed
+        assert server.num_requests == requests_before + 3
+        assert watcher.interval == 0.1
+
+        assert mixer.wait_for_payouts(timeout=5)
+        # The installments from the house account are not mistaken for deposits
+        assert watcher.poll() == 0
+        assert server.balance(deposits[0]) == 0 and server.balance(deposits[7]) == 0
+        assert server.balance("0xa0") + server.balance("0xb0") == Decimal("14.7") * COIN
+        assert server.balance("0xa7") + server.balance("0xb7") == Decimal("19.6") * COIN
+        client.close()
+
+
+def test_watcher_backlog_under_back_pressure():
+    with running(JobcoinServer()) as server:
+        client = JobcoinClient(server.url)
+        mixer = APIBasedMixer(scheduler=PayoutScheduler(clock=FakeClock(), background=False), client=client)
+        watcher = DepositWatcher(mixer, max_mixes_per_cycle=2, max_pending_payouts=3)
+        deposits = [mixer.get_deposit_address(["0x{}".format(i)]) for i in range(5)]
+        for deposit in deposits:
+            client.create(deposit)
+
+        assert watcher.poll() == 2
+        # Two installments are queued; after one more mix the queue is over the limit and mixing stops
+        assert watcher.poll() == 2
+        assert watcher.poll() == 0
+        assert len(watcher.backlog) == 1
+        mixer.wait_for_payouts(timeout=5)
+        assert watcher.poll() == 1
+        assert not watcher.backlog
+        client.close()
+
+
+def test_watcher_back_pressure_counts_outbox(tmp_path):
+    with running(JobcoinServer()) as server:
+        client = JobcoinClient(server.url)
+        outbox = PayoutOutbox(os.path.join(str(tmp_path), "outbox.db"), client, background=False)
+        mixer = APIBasedMixer(scheduler=PayoutScheduler(clock=FakeClock(), background=False), client=client, outbox=outbox)
+        watcher = DepositWatcher(mixer, max_mixes_per_cycle=5, max_pending_payouts=0)
+        deposits = [mixer.get_deposit_address(["0x{}".format(i)]) for i in range(2)]
+        for deposit in deposits:
+            client.create(deposit)
+
+        # The first mix queues installments in the outbox, which holds back the second one
+        assert watcher.poll() == 1
+        assert outbox.num_pending() > 0 and mixer.scheduler.num_pending() == 0
+        assert watcher.poll() == 0
+        assert outbox.drain(timeout=10)
+        assert watcher.poll() == 1
+        assert not watcher.backlog
+        outbox.close()
+        client.close()
+
+
+def test_watcher_rejects_async_mixers():
+    with pytest.raises(TypeError):
+        DepositWatcher(AsyncAPIBasedMixer(client=AsyncJobcoinClient("http://localhost:1")))